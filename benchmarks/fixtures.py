@@ -0,0 +1,162 @@
+"""
+Synthetic county-scale data shaped like the files in data/, for timing
+the loaders and analyses at chosen county and date counts.
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from contextlib import contextmanager
+
+from src.data_loader import data_loader, cache
+from src.utils.dates import full_format
+
+static_columns = [
+    'Rural-urban_Continuum Code_2013',
+    'Density per square mile of land area - Population',
+    'Percent of adults with less than a high school diploma 2014-18',
+    'PCTPOV017_2018',
+    'Unemployment_rate_2018',
+    'Total_age65plus',
+    'POP_ESTIMATE_2018',
+]
+mobility_columns = [
+    'retail_and_recreation_percent_change_from_baseline',
+    'grocery_and_pharmacy_percent_change_from_baseline',
+    'parks_percent_change_from_baseline',
+    'transit_stations_percent_change_from_baseline',
+    'workplaces_percent_change_from_baseline',
+    'residential_percent_change_from_baseline',
+]
+
+
+def make_fixture(root, n_counties, n_days, start='2020-01-22', seed=0, mobility=True):
+    """
+    Writes a synthetic data directory under root:
+
+     - raw/time_series_covid19_deaths_US_*.csv : JHU-shaped cumulative deaths
+     - raw/counties_*.csv : static county features
+     - raw/countyfipstool2019.csv : the county FIPS registry
+     - raw/google_mobility_report_*.csv : Google-shaped mobility, with
+       foreign rows (if mobility)
+     - processed/Hospitals.csv : HIFLD-shaped hospitals
+     - processed/od_inter_mobilities_*.csv : county x date OD trips, with
+       "%m-%d" headers, or "%Y-%m-%d" ones when the dates span two years
+
+    Returns the FIPS and the dates.
+    """
+    root = Path(root)
+    raw, processed = root / 'raw', root / 'processed'
+    raw.mkdir(parents=True, exist_ok=True)
+    processed.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    # County codes 1-998 of states 1-56: the registry drops codes 999 and up
+    codes = (np.arange(1, 57)[:, None] * 1000 + np.arange(1, 999)).ravel()
+    fips = np.sort(rng.choice(codes, n_counties, replace=False))
+    dates = pd.date_range(start, periods=n_days)
+    suffix = dates[-1].strftime('%m-%d')
+
+    _write_deaths(raw / f'time_series_covid19_deaths_US_{suffix}.csv', fips, dates, rng)
+
+    counties = pd.DataFrame(rng.random((n_counties, len(static_columns))) * 100,
+                            columns=static_columns)
+    counties.insert(0, 'FIPS', fips)
+    counties.to_csv(raw / f'counties_{suffix}.csv', index=False)
+    pd.DataFrame({
+        'sname': [f'State {f // 1000}' for f in fips],
+        'sab': [f'S{f // 1000}' for f in fips],
+        'sid': fips // 1000,
+        'sfips': fips // 1000,
+        'cname': [f'County {f}' for f in fips],
+        'saint': 0,
+        'cfips': fips % 1000,
+        'fips': fips,
+    }).to_csv(raw / 'countyfipstool2019.csv', index=False)
+
+    n_hospitals = 2 * n_counties
+    pd.DataFrame({
+        'TYPE': rng.choice(['GENERAL ACUTE CARE', 'PSYCHIATRIC'], n_hospitals, p=[0.8, 0.2]),
+        'STATUS': rng.choice(['OPEN', 'CLOSED'], n_hospitals, p=[0.95, 0.05]),
+        'COUNTYFIPS': rng.choice(fips, n_hospitals).astype(str),
+        'BEDS': rng.integers(1, 500, n_hospitals),
+    }).to_csv(processed / 'Hospitals.csv', index=False)
+
+    od_format = '%m-%d' if dates[0].year == dates[-1].year else full_format
+    od = pd.DataFrame(rng.random((n_counties, n_days)) * 1e5,
+                      columns=dates.strftime(od_format))
+    od.insert(0, 'FIPS', fips)
+    od.to_csv(processed / f'od_inter_mobilities_{suffix}.csv', index=False)
+
+    if mobility:
+        _write_mobility(raw / f'google_mobility_report_{suffix}.csv', fips, dates, rng)
+
+    return fips, dates
+
+@contextmanager
+def use_fixture(root):
+    """Points the data loader at a fixture directory, with caching off."""
+    saved = (data_loader.data_dir, data_loader.raw_dir, data_loader.processed_dir,
+             data_loader.state_dir, cache.enabled)
+    root = Path(root)
+    data_loader.data_dir = root
+    data_loader.raw_dir = root / 'raw'
+    data_loader.processed_dir = root / 'processed'
+    data_loader.state_dir = root / 'processed' / 'state'
+    cache.enabled = False
+    try:
+        yield
+    finally:
+        (data_loader.data_dir, data_loader.raw_dir, data_loader.processed_dir,
+         data_loader.state_dir, cache.enabled) = saved
+
+
+#################################
+# Utility Functions
+#################################
+def _write_deaths(path, fips, dates, rng):
+    """Cumulative deaths growing from a random onset, with a few glitches."""
+    n, T = len(fips), len(dates)
+    onset = rng.integers(0, T, n)
+    rate = rng.gamma(1, 0.3, n)
+    day = np.arange(T)
+    daily = rng.poisson(rate[:, None] * np.clip(day - onset[:, None], 0, None) ** 0.5)
+    counts = np.cumsum(daily, axis=1)
+    glitches = rng.choice(n, max(n // 50, 1), replace=False)
+    cols = rng.integers(1, T, len(glitches))
+    counts[glitches, cols] = np.maximum(counts[glitches, cols] - 2, 0)
+
+    deaths = pd.DataFrame({
+        'UID': 84000000 + fips,
+        'iso2': 'US',
+        'iso3': 'USA',
+        'code3': 840,
+        'FIPS': fips.astype(float),
+        'Admin2': [f'County {f}' for f in fips],
+        'Province_State': [f'State {f // 1000}' for f in fips],
+        'Country_Region': 'US',
+        'Lat': rng.uniform(25, 49, n),
+        'Long_': rng.uniform(-124, -67, n),
+        'Combined_Key': [f'County {f}, State {f // 1000}, US' for f in fips],
+        'Population': rng.integers(1000, 10**7, n),
+    })
+    headers = [f'{d.month}/{d.day}/{d.strftime("%y")}' for d in dates]
+    deaths = pd.concat([deaths, pd.DataFrame(counts, columns=headers)], axis=1)
+    deaths.to_csv(path, index=False)
+
+def _write_mobility(path, fips, dates, rng, foreign_share=0.1):
+    """Long format county x date rows, plus foreign rows to filter out."""
+    n_us = len(fips) * len(dates)
+    n_foreign = int(n_us * foreign_share)
+    n_rows = n_us + n_foreign
+    mobility = pd.DataFrame({
+        'country_region_code': ['US'] * n_us + ['CA'] * n_foreign,
+        'country_region': ['United States'] * n_us + ['Canada'] * n_foreign,
+        'sub_region_1': np.r_[np.repeat([f'State {f // 1000}' for f in fips], len(dates)),
+                              np.full(n_foreign, 'Ontario')],
+        'sub_region_2': np.r_[np.repeat([f'County {f}' for f in fips], len(dates)),
+                              np.full(n_foreign, 'Toronto')],
+        'date': np.r_[np.tile(dates.strftime('%Y-%m-%d'), len(fips)),
+                      np.resize(dates.strftime('%Y-%m-%d'), n_foreign)],
+    })
+    values = rng.normal(0, 20, (n_rows, len(mobility_columns))).round()
+    mobility = pd.concat([mobility, pd.DataFrame(values, columns=mobility_columns)], axis=1)
+    mobility.to_csv(path, index=False)
@@ -0,0 +1,183 @@
+"""
+Times the data loaders and analyses on synthetic fixtures at several
+county and date counts, and saves the timings to compare across commits.
+
+Run from the repository root:
+
+    python -m benchmarks.run --counties 100 800 3200 --days 120 365 1095
+    python -m benchmarks.run --compare benchmarks/results/<old>.json
+
+Fixtures start on 2020-01-22, as the JHU series. Headers in "%m-%d" carry
+no year, so once the dates run into 2021 load_deaths runs with
+date_index=True, align_lagged_dates aligns date-indexed series, and
+align_lagged_series is timed as well.
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import warnings
+
+from .fixtures import make_fixture, use_fixture
+from src.data_loader import data_loader
+from src.data_loader.data_loader import load_deaths, load_od_mobilities, load_google_mobility, get_cum_deaths_dataframe
+from src.utils.df_utils import get_date_columns
+from src.pandas.align import align_lagged_dates, align_lagged_series
+from src.learning.learning import DTWDistance
+from src.data_analysis.tools import ac_pca
+
+results_dir = Path(__file__).parent / 'results'
+
+
+def run(counties=(100, 800, 3200), days=(120, 365), repeat=3, n_dtw_pairs=200, mobility=True):
+    """
+    Times each benchmark repeat times at every (counties, days) scale.
+
+    Returns a list of result dicts with the benchmark, its scale and
+    variant, and the minimum and median seconds.
+    """
+    results = []
+    for n_days in days:
+        for n_counties in counties:
+            with tempfile.TemporaryDirectory() as root:
+                _, dates = make_fixture(root, n_counties, n_days, mobility=mobility)
+                multi_year = dates[0].year != dates[-1].year
+                with use_fixture(root):
+                    for name, variant, bench in _benchmarks(multi_year, n_dtw_pairs, mobility):
+                        times = _time(bench, repeat)
+                        results.append({
+                            'benchmark': name,
+                            'variant': variant,
+                            'n_counties': n_counties,
+                            'n_days': n_days,
+                            'repeat': repeat,
+                            'seconds_min': min(times),
+                            'seconds_median': float(np.median(times)),
+                        })
+                        print(f"{name:<26} {variant:<12} {n_counties:>6} counties "
+                              f"{n_days:>5} days {min(times):>10.4f}s", flush=True)
+
+    return results
+
+def save(results, path=None):
+    """Writes results with the commit and environment they were run on."""
+    meta = {
+        'commit': _git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count(),
+    }
+    if path is None:
+        results_dir.mkdir(parents=True, exist_ok=True)
+        path = results_dir / f"{(meta['commit'] or 'unknown')[:10]}.json"
+    with open(path, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+    return path
+
+def compare(old_path, new_path):
+    """Table of old and new median seconds and their ratio per benchmark."""
+    keys = ['benchmark', 'variant', 'n_counties', 'n_days']
+    frames = []
+    for path in (old_path, new_path):
+        with open(path) as f:
+            frames.append(pd.DataFrame(json.load(f)['results']).set_index(keys)['seconds_median'])
+    table = pd.concat(frames, axis=1, keys=['old', 'new']).dropna()
+    table['ratio'] = table['new'] / table['old']
+
+    return table
+
+
+#################################
+# Utility Functions
+#################################
+def _benchmarks(multi_year, n_dtw_pairs, mobility):
+    """(name, variant, method) of each benchmark at a scale."""
+    deaths = load_deaths(date_index=multi_year)[0]
+    rng = np.random.default_rng(0)
+
+    benchmarks = []
+    if multi_year:
+        benchmarks.append(('load_deaths', 'date_index', lambda: load_deaths(date_index=True)))
+        lagged = deaths.shift(14)
+        benchmarks.append(('align_lagged_series', 'lag 7',
+                           lambda: align_lagged_series(lagged, deaths, lag=7)))
+        od = load_od_mobilities(date_index=True)[0]
+        deaths_ts = deaths
+    else:
+        benchmarks.append(('load_deaths', 'default', load_deaths))
+        od = pd.read_csv(next(data_loader.processed_dir.glob('od_inter_mobilities_*.csv')))
+        deaths_ts = deaths.drop(columns=['UID', 'iso2', 'iso3', 'code3', 'Admin2',
+                                         'Province_State', 'Country_Region', 'Lat',
+                                         'Long_', 'Combined_Key', 'Population'])
+        deaths_ts['FIPS'] = deaths_ts['FIPS'].astype(int)
+    benchmarks.append(('get_cum_deaths_dataframe', 'n_days 28',
+                       lambda: get_cum_deaths_dataframe(28)))
+    benchmarks.append(('align_lagged_dates', 'lag 7',
+                       lambda: align_lagged_dates(od, deaths_ts, 'FIPS', lag=7)))
+    if mobility:
+        benchmarks.append(('load_google_mobility', 'default', load_google_mobility))
+
+    # Daily deaths of random county pairs
+    if multi_year:
+        series = np.diff(deaths.T.to_numpy(dtype=float), axis=1)
+    else:
+        series = np.diff(deaths[get_date_columns(deaths, return_dtimes=False)].to_numpy(dtype=float), axis=1)
+    pairs = rng.integers(0, len(series), (n_dtw_pairs, 2))
+    # Compile the DTW kernel (with numba) outside the timings
+    DTWDistance(series[0], series[0])
+    benchmarks.append(('DTWDistance', f'{n_dtw_pairs} pairs',
+                       lambda: [DTWDistance(series[i], series[j]) for i, j in pairs]))
+
+    X = rng.normal(size=(len(series), 20))
+    Y = X[:, :2] + rng.normal(size=(len(series), 2))
+    benchmarks.append(('ac_pca', '20 features', lambda: ac_pca(X, Y, 20)))
+
+    return benchmarks
+
+def _time(bench, repeat):
+    times = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            bench()
+            times.append(time.perf_counter() - start)
+    return times
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--counties', type=int, nargs='+', default=[100, 800, 3200])
+    parser.add_argument('--days', type=int, nargs='+', default=[120, 365])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--dtw-pairs', type=int, default=200)
+    parser.add_argument('--no-mobility', action='store_true',
+                        help='skip the Google mobility file, the largest fixture')
+    parser.add_argument('--out', type=Path, default=None)
+    parser.add_argument('--compare', type=Path, default=None,
+                        help='results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run(args.counties, args.days, args.repeat, args.dtw_pairs, not args.no_mobility)
+    path = save(results, args.out)
+    print(f'Saved {path}')
+    if args.compare is not None:
+        print(compare(args.compare, path).to_string())
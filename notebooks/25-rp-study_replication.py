@@ -47,9 +47,11 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import sys; sys.path.append('../')
 from src.data_loader.data_loader import *
+from src.data_loader.fips import county_index
 from src.utils.dates import get_today, lag_date, date2str, str2date, get_format
 from src.utils.df_utils import get_date_columns
 from src.pandas.align import align_lagged_dates
+from src.learning.design import lag_design, lag_index
 
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
@@ -93,17 +95,9 @@ df = get_time_series_dataframe(
 # In[5]:
 
 
-df_timeseries = pd.concat(
-    [df[
-        ['FIPS'] + ['onset_relative'] +
-        [f'deaths_{d+1:02d}'] + 
-        [f'mobility_{d+m+1:02d}' for m in range(mobility_lag)]]
-     .assign(dt=d+1).rename({
-        f'deaths_{d+1:02d}':'deaths',
-        **{f'mobility_{d+m+1:02d}':f't{m}' for m in range(mobility_lag)}
-    }, axis=1) for d in range(n_days)],
-    axis=0
-)
+mobility = df[[f'mobility_{m+1:02d}' for m in range(n_days + mobility_lag - 1)]].values
+deaths = df[[f'deaths_{d+1:02d}' for d in range(n_days)]].values
+county, day = lag_index(len(df), n_days)
 
 
 # In[6]:
@@ -187,7 +181,15 @@ for i in range(4):
 # In[13]:
 
 
-df_X = pd.merge(df_timeseries, pd.merge(df_predictors, df_hypothesis, on='FIPS'), on='FIPS')
+df_static = pd.concat([df_predictors, df_hypothesis.drop(columns='FIPS')], axis=1)
+df_X = pd.DataFrame(
+    lag_design(mobility, mobility_lag, n_days),
+    columns=[f't{m}' for m in range(mobility_lag)],
+)
+df_X['deaths'] = deaths[county, day]
+df_X['dt'] = day + 1
+df_X['onset_relative'] = df['onset_relative'].values[county]
+df_X = pd.concat([df_static.iloc[county].reset_index(drop=True), df_X], axis=1)
 
 
 # In[14]:
@@ -243,8 +245,11 @@ predictor_vars = [
 ] + [f't{m}' for m in range(mobility_lag)]
 target_var = 'deaths'
 
-X = df_X[df_X['FIPS'].isin(county_fips)][predictor_vars].values
-y = df_X[df_X['FIPS'].isin(county_fips)][target_var].values
+## Match on the county index, as the FIPS above are zero-padded strings
+registry = load_county_fips()['FIPS']
+in_cities = np.isin(county_index(registry, df_X['FIPS']), county_index(registry, county_fips))
+X = df_X[in_cities][predictor_vars].values
+y = df_X[in_cities][target_var].values
 
 
 # In[17]:
@@ -276,7 +281,11 @@ ggam = GammaGAM(
 # lams = lams * 8 - 3 # shift values to -3, 3
 # lams = np.exp(lams) # transforms values to 1e-3, 1e3
 
-# ggam.gridsearch(X, y, lam=lams)
+# ## Searched over a process pool, warm started and pruned on GCV
+# from src.learning.gam import gam_basis, lam_search
+# basis, penalties = gam_basis(ggam, X)
+# search, coef = lam_search(basis, y, penalties, lams, n_jobs=-1)
+# best_lams = search.loc[search['GCV'].idxmin(), 'lam']
 
 
 # In[ ]:
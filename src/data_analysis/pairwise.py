@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from pathlib import Path
+
+from ..utils.df_utils import gather_days
+
+
+def pairwise_differences(df, columns=None, pairs=None, extra=None, chunksize=100000):
+    """
+    Feature differences between pairs of counties, yielded as DataFrame
+    chunks of at most chunksize pairs so memory stays bounded.
+
+    Each chunk has columns FIPS1, FIPS2 and, for each feature,
+    df.loc[FIPS1] - df.loc[FIPS2], taken as one array operation.
+
+    df : DataFrame of county features indexed by FIPS
+    columns : features to difference (default all numeric columns)
+    pairs : (fips1, fips2) arrays of the pairs to take, e.g. from
+        `adjacent_pairs`; pairs with a county missing from df are dropped.
+        Default all pairs of rows i < j, in row order
+    extra : dict of column name -> method (i, j) -> 1d array, computing
+        further per-pair columns from the row positions of the pairs,
+        e.g. `aligned_death_difference`
+    chunksize : number of pairs per chunk
+    """
+    if columns is None:
+        columns = list(df.select_dtypes('number').columns)
+    values = df[columns].to_numpy(dtype=float)
+    fips = df.index.to_numpy()
+    extra = {} if extra is None else extra
+
+    for i, j in _iter_pairs(df.index, pairs, chunksize):
+        chunk = pd.DataFrame({'FIPS1': fips[i], 'FIPS2': fips[j]})
+        diffs = pd.DataFrame(values[i] - values[j], columns=columns)
+        chunk = pd.concat([chunk, diffs], axis=1)
+        for name, method in extra.items():
+            chunk[name] = method(i, j)
+        yield chunk
+
+def write_pairwise(chunks, path):
+    """
+    Streams pairwise chunks to a .parquet or .csv file without holding
+    them all in memory. Returns the number of pairs written.
+    """
+    path = Path(path)
+    n_pairs = 0
+    writer = None
+    try:
+        for k, chunk in enumerate(chunks):
+            if path.suffix == '.parquet':
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+            else:
+                chunk.to_csv(path, mode='w' if k == 0 else 'a',
+                             header=k == 0, index=False)
+            n_pairs += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return n_pairs
+
+def adjacent_pairs(adjacency, fips, counties=None, seed=None):
+    """
+    Pairs of adjacent counties, each listed once.
+
+    adjacency, fips : county graph and the FIPS of its rows and columns,
+        from `data_loader.adjacency.load_county_adjacency`
+        (data/raw/county_adjacency.txt)
+    counties : counties to keep pairs of (default all)
+    seed : if given, the order within each pair is randomized with this
+        seed, so differences are not all taken from the lower FIPS
+
+    Returns (fips1, fips2) arrays, sorted by FIPS.
+    """
+    fips = np.asarray(fips)
+    # Each edge once, from the upper triangle of the symmetrized graph
+    upper = sparse.triu(adjacency + adjacency.T, k=1).tocoo()
+    order = np.lexsort((upper.col, upper.row))
+    fips1, fips2 = fips[upper.row[order]], fips[upper.col[order]]
+    if counties is not None:
+        keep = np.isin(fips1, counties) & np.isin(fips2, counties)
+        fips1, fips2 = fips1[keep], fips2[keep]
+    if seed is not None:
+        swap = np.random.default_rng(seed).integers(0, 2, len(fips1)).astype(bool)
+        fips1, fips2 = np.where(swap, fips2, fips1), np.where(swap, fips1, fips2)
+
+    return fips1, fips2
+
+def aligned_death_difference(deaths, days, onset_days, population):
+    """
+    Per-pair difference in deaths per capita, each county of a pair taken
+    the same number of days after its outbreak: the days the later
+    county has had up to the last day of deaths.
+
+    deaths : (n, T) cumulative deaths, rows in the order of the df passed
+        to `pairwise_differences`
+    days : (T,) day offsets of the deaths columns
+    onset_days : (n,) day offset of each county's outbreak
+    population : (n,) population of each county
+
+    Returns a method (i, j) -> array for the extra argument of
+    `pairwise_differences`. Pairs whose aligned day is not a column of
+    deaths get NaN.
+    """
+    deaths = np.asarray(deaths, dtype=float)
+    days = np.asarray(days)
+    onset_days = np.asarray(onset_days)
+    per_capita = deaths / np.asarray(population, dtype=float)[:, None]
+
+    def difference(i, j):
+        n_days = days[-1] - np.maximum(onset_days[i], onset_days[j])
+        return (
+            gather_days(per_capita, days, i, onset_days[i] + n_days)
+            - gather_days(per_capita, days, j, onset_days[j] + n_days)
+        )
+
+    return difference
+
+
+#################################
+# Utility Functions
+#################################
+def _iter_pairs(index, pairs, chunksize):
+    """Row positions (i, j) of the pairs, chunksize pairs at a time."""
+    if pairs is not None:
+        i = index.get_indexer(pairs[0])
+        j = index.get_indexer(pairs[1])
+        found = (i >= 0) & (j >= 0)
+        i, j = i[found], j[found]
+        for start in range(0, len(i), chunksize):
+            yield i[start:start + chunksize], j[start:start + chunksize]
+        return
+
+    # Pair k of the upper triangle, row by row: row i starts at starts[i]
+    n = len(index)
+    starts = np.concatenate(([0], np.cumsum(np.arange(n - 1, 0, -1))))
+    for start in range(0, starts[-1], chunksize):
+        k = np.arange(start, min(start + chunksize, starts[-1]))
+        i = np.searchsorted(starts, k, side='right') - 1
+        yield i, k - starts[i] + i + 1
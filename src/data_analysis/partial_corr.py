@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.stats import rankdata, t as t_dist
+
+from ..utils.parallel import get_n_jobs, share_array, attach_array
+
+
+def partial_corr(df, columns=None, controls=None, by=None, method='spearman',
+                 n_perm=0, seed=0, n_jobs=None, batch_size=100):
+    """
+    Partial correlations of every pair of columns given the controls, as
+    ppcor's pcor.test(x, y, z, method="spearman") of
+    notebooks/bm-10-Spearman's_Partial_Correlation_Test, for all pairs at
+    once and optionally within each stratum.
+
+    Within a stratum, rows with a missing value are dropped (na.omit) and
+    all variables are ranked once. The covariance C of the ranks gives the
+    conditional covariance of the columns given the controls as the Schur
+    complement C_vv - C_vz C_zz^-1 C_zv, from a single solve, and the
+    partial correlations are its normalized entries.
+
+    Permutation p-values permute the rows of the columns' residuals on the
+    controls: each batch of permutations is a few stacked matrix products,
+    of at most `_max_bytes` of permuted residuals, giving every pair's
+    statistic. Batches run over a process pool with
+    the residuals in shared memory, and each draws its permutations from
+    its own generator spawned from seed, so p-values do not depend on
+    n_jobs.
+
+    df : DataFrame of county features
+    columns : variables to correlate (default all numeric columns other
+        than the controls and by)
+    controls : variables to control for (default none, i.e. plain
+        correlations)
+    by : column, or list of columns, whose values define strata, e.g.
+        'Rural-urban_Continuum Code_2013' (default the whole frame)
+    method : 'spearman' (ranks) or 'pearson' (values)
+    n_perm : number of permutations per stratum, 0 for none
+    seed : seed of the permutation generators
+    n_jobs : number of processes, -1 for all CPUs
+    batch_size : permutations per task
+
+    Returns
+    -------
+    DataFrame with a row per stratum and pair x < y (in column order): the
+    by columns, x, y, the partial correlation r, n (rows used), the t
+    statistic and p_value of ppcor (n - 2 - number of controls degrees of
+    freedom) and the permutation p-value p_perm
+    """
+    controls = [] if controls is None else list(controls)
+    by = [] if by is None else [by] if isinstance(by, str) else list(by)
+    if columns is None:
+        columns = [c for c in df.select_dtypes('number').columns if c not in controls + by]
+    columns = list(columns)
+    if method not in ('spearman', 'pearson'):
+        raise ValueError(f"method must be 'spearman' or 'pearson', not {method!r}")
+
+    df = df.dropna(subset=columns + controls + by).reset_index(drop=True)
+    strata = df.groupby(by, sort=True).indices if by else {(): np.arange(len(df))}
+    values = df[columns + controls].to_numpy(dtype=float)
+    n_vars = len(columns)
+
+    keys, tables, residuals, offsets = [], [], [], [0]
+    for key, rows in strata.items():
+        X = values[rows]
+        if method == 'spearman':
+            X = rankdata(X, axis=0)
+        r, R = _partial(X, n_vars)
+        keys.append(key)
+        tables.append(r)
+        residuals.append(R)
+        offsets.append(offsets[-1] + len(R))
+
+    exceed = [np.zeros((n_vars, n_vars)) for _ in keys]
+    if n_perm > 0:
+        residuals = np.vstack(residuals) if residuals else np.empty((0, n_vars))
+        seeds = np.random.SeedSequence(seed).spawn(len(keys))
+        tasks = [
+            (s, offsets[s], offsets[s + 1], batch)
+            for s in range(len(keys))
+            for batch in _batches(seeds[s], n_perm, batch_size)
+        ]
+        n_jobs = get_n_jobs(n_jobs)
+        if n_jobs == 1:
+            _state.update(R=residuals, observed=tables)
+            for s, start, stop, batch in tasks:
+                exceed[s] += _run_batch(s, start, stop, batch)
+            _state.clear()
+        else:
+            shm, spec = share_array(residuals)
+            try:
+                with ProcessPoolExecutor(
+                    n_jobs,
+                    initializer=_init_worker,
+                    initargs=(spec, tables),
+                ) as pool:
+                    futures = {pool.submit(_run_batch, *task): task[0] for task in tasks}
+                    for future in as_completed(futures):
+                        exceed[futures[future]] += future.result()
+            finally:
+                shm.close()
+                shm.unlink()
+
+    i, j = np.triu_indices(n_vars, 1)
+    frames = []
+    for key, r, counts, start, stop in zip(keys, tables, exceed, offsets[:-1], offsets[1:]):
+        n = stop - start
+        dof = n - 2 - len(controls)
+        rij = r[i, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            statistic = rij * np.sqrt(dof / (1 - rij**2)) if dof > 0 else np.full(len(rij), np.nan)
+        frame = pd.DataFrame({
+            'x': np.asarray(columns, dtype=object)[i],
+            'y': np.asarray(columns, dtype=object)[j],
+            'r': rij,
+            'n': n,
+            'statistic': statistic,
+            'p_value': 2 * t_dist.sf(np.abs(statistic), dof) if dof > 0 else np.nan,
+            'p_perm': (1 + counts[i, j]) / (1 + n_perm) if n_perm > 0 else np.nan,
+        })
+        for name, value in reversed(list(zip(by, key if isinstance(key, tuple) else (key,)))):
+            frame.insert(0, name, value)
+        frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)
+
+
+#################################
+# Utility Functions
+#################################
+_state = {}
+# Memory of the permuted residuals and statistics stacked per product
+_max_bytes = 64 << 20
+
+def _partial(X, n_vars):
+    """
+    Partial correlations of the first n_vars columns of X given the rest,
+    and their residuals on the rest, centered and scaled to unit norm so
+    their cross products are the correlations.
+    """
+    X = X - X.mean(axis=0)
+    V, Z = X[:, :n_vars], X[:, n_vars:]
+    C = X.T @ X
+    if Z.shape[1]:
+        # Schur complement C_vv - C_vz C_zz^-1 C_zv
+        B = np.linalg.lstsq(C[n_vars:, n_vars:], C[n_vars:, :n_vars], rcond=None)[0]
+        V = V - Z @ B
+    norms = np.linalg.norm(V, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = V / norms
+
+    return R.T @ R, R
+
+def _batches(seed, n_perm, batch_size):
+    seeds = seed.spawn((n_perm + batch_size - 1) // batch_size)
+    sizes = [min(batch_size, n_perm - b * batch_size) for b in range(len(seeds))]
+    return list(zip(seeds, sizes))
+
+def _init_worker(spec, observed):
+    shm, R = attach_array(spec)
+    _state.update(R=R, observed=observed, shm=shm)
+
+def _run_batch(s, start, stop, batch):
+    """Counts, per pair, the permutations at least as extreme as observed."""
+    seed, size = batch
+    R = _state['R'][start:stop]
+    observed = np.abs(_state['observed'][s])
+    rng = np.random.default_rng(seed)
+    perms = np.argsort(rng.random((size, len(R))), axis=1)
+    # Stack as many permutations per product as fit in _max_bytes
+    n, n_vars = R.shape
+    step = max(1, _max_bytes // (8 * n_vars * (n + n_vars)))
+    counts = np.zeros((n_vars, n_vars))
+    for k in range(0, size, step):
+        # (step, n_vars, n_vars) statistics of corr(R_i[perm], R_j), one product
+        stats = np.matmul(R[perms[k:k + step]].transpose(0, 2, 1), R)
+        counts += np.sum(np.abs(stats) >= observed - 1e-12, axis=0)
+
+    return counts
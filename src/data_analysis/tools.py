@@ -1,33 +1,118 @@
 import numpy as np
-from numpy.linalg import eig
 import pandas as pd
 
-def ac_pca(X, Y, lam):
-    X_rows, X_cols = X.shape
-
-    column_names = ['PC' + str(i) for i in range(1, X_cols + 1)]
-
-    # Center data
-    X_mean = X.T.mean(axis=1)
-    X = X - X_mean
-    Y_mean = Y.T.mean(axis=1)
-    Y = Y - Y_mean
-
-    # AC-PCA
-#     lam = 20  # lambda
-#     lam = 100
-    K = Y @ Y.T
-    cov_1 = X.T @ X 
-    cov_2 = lam * X.T @ K @ X
-#     print('cov_1:\n', cov_1)
-#     print('cov_2:\n', cov_2)
-    cov = cov_1 - cov_2
-    eigenvals, eigenvecs = eig(cov.T)
-    P = eigenvecs.T.dot(X.T)
-    P = P.T
+def ac_pca(X, Y, lam, n_components=None, solver='eigh'):
+    """
+    Adjusted-for-confounders PCA: principal components of X that maximize
+    variance while penalizing covariance with the confounders Y,
+
+        cov = X.T @ X - lam * X.T @ Y @ Y.T @ X
+
+    on centered data. The penalty is formed as (X.T @ Y) @ (Y.T @ X), so
+    the n x n kernel Y @ Y.T is never built.
+
+    X : (n, d) data
+    Y : (n, m) or (n,) confounders
+    lam : penalty weight
+    n_components : number of leading components (default all d)
+    solver : 'eigh' for the dense symmetric solver, or 'lanczos' for a
+        truncated solver that only applies cov to vectors, for large d and
+        n_components < d (it falls back to 'eigh' otherwise)
+
+    Returns
+    -------
+    projected : (n, k) data projected on the components
+    PCs : (d, k) components, as columns
+    eigenvalues : (1, k) eigenvalues
+
+    Components are sorted by decreasing eigenvalue, and their sign is set
+    so that the largest loading of each is positive.
+    """
+    X, XtX, XtY = _ac_pca_terms(X, Y)
+    d = X.shape[1]
+    k = d if n_components is None else n_components
+    column_names = ['PC' + str(i) for i in range(1, k + 1)]
+
+    if solver == 'eigh':
+        eigenvals, eigenvecs = np.linalg.eigh(XtX - lam * XtY @ XtY.T)
+        eigenvals, eigenvecs = eigenvals[::-1][:k], eigenvecs[:, ::-1][:, :k]
+    elif solver == 'lanczos':
+        eigenvals, eigenvecs = _lanczos(XtX, XtY, lam, k)
+    else:
+        raise ValueError(f"solver must be 'eigh' or 'lanczos', not {solver!r}")
+    eigenvecs = _flip_signs(eigenvecs)
+    P = X @ eigenvecs
 
     projected = pd.DataFrame(data=P, columns=column_names)
     PCs = pd.DataFrame(data=eigenvecs, columns=column_names)
-    eigenvalues = pd.DataFrame(data=eigenvals.reshape(1, X_cols), columns=column_names)
+    eigenvalues = pd.DataFrame(data=eigenvals.reshape(1, k), columns=column_names)
+
+    return projected, PCs, eigenvalues
+
+def ac_pca_sweep(X, Y, lams, n_components=None):
+    """
+    `ac_pca` for several penalty weights at once. The cross products are
+    computed once and the eigenproblems of all lams are solved as one
+    stacked call.
+
+    Returns
+    -------
+    projected : (n_lams, n, k) data projected on the components
+    PCs : (n_lams, d, k) components, as columns
+    eigenvalues : (n_lams, k) eigenvalues
+    """
+    X, XtX, XtY = _ac_pca_terms(X, Y)
+    k = X.shape[1] if n_components is None else n_components
+    lams = np.asarray(lams, dtype=float)
+
+    covs = XtX - lams[:, None, None] * (XtY @ XtY.T)
+    eigenvals, eigenvecs = np.linalg.eigh(covs)
+    eigenvals = eigenvals[:, ::-1][:, :k]
+    eigenvecs = _flip_signs(eigenvecs[:, :, ::-1][:, :, :k])
+    projected = X @ eigenvecs
+
+    return projected, eigenvecs, eigenvals
+
+
+#################################
+# Utility Functions
+#################################
+def _ac_pca_terms(X, Y):
+    """Centered X and the cross products X.T @ X and X.T @ Y."""
+    X = np.asarray(X, dtype=float)
+    Y = np.asarray(Y, dtype=float)
+    if Y.ndim == 1:
+        Y = Y.reshape(len(Y), 1)
+    X = X - X.mean(axis=0)
+    Y = Y - Y.mean(axis=0)
+
+    return X, X.T @ X, X.T @ Y
+
+def _lanczos(XtX, XtY, lam, k):
+    """
+    Top k eigenpairs of XtX - lam * XtY @ XtY.T from its products. ARPACK
+    needs k < d, so k >= d falls back to the dense solver.
+    """
+    from scipy.sparse.linalg import LinearOperator, eigsh
+
+    d = XtX.shape[0]
+    if k >= d:
+        eigenvals, eigenvecs = np.linalg.eigh(XtX - lam * XtY @ XtY.T)
+        return eigenvals[::-1][:k], eigenvecs[:, ::-1][:, :k]
+    cov = LinearOperator(
+        (d, d),
+        matvec=lambda v: XtX @ v - lam * (XtY @ (XtY.T @ v)),
+        dtype=float,
+    )
+    eigenvals, eigenvecs = eigsh(cov, k=k, which='LA')
+    order = np.argsort(eigenvals)[::-1]
+
+    return eigenvals[order], eigenvecs[:, order]
+
+def _flip_signs(eigenvecs):
+    """Flips components so their largest absolute loading is positive."""
+    rows = np.abs(eigenvecs).argmax(axis=-2)
+    signs = np.sign(np.take_along_axis(eigenvecs, rows[..., None, :], axis=-2))
+    signs[signs == 0] = 1
 
-    return projected, PCs, eigenvalues
\ No newline at end of file
+    return eigenvecs * signs
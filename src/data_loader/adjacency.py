@@ -0,0 +1,155 @@
+"""
+County adjacency as a sparse graph.
+
+The graph is a CSR matrix over counties, with `fips` giving the FIPS of
+each row and column, so neighbor statistics of a whole county x date
+array are sparse matrix products rather than loops over an edge dict.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import data_loader
+
+
+def load_county_adjacency(path=None):
+    """
+    Reads the Census county adjacency file (data/raw/county_adjacency.txt).
+
+    Each county starts a block with its own name and FIPS in the first two
+    columns; the following rows leave those empty and list its neighbors in
+    the last two. A county listed as its own neighbor is dropped.
+
+    Returns
+    -------
+    adjacency : (n, n) CSR matrix, 1 where row county borders column county
+    fips : (n,) sorted FIPS of the rows and columns
+    """
+    path = data_loader.raw_dir / 'county_adjacency.txt' if path is None else path
+    adj = pd.read_csv(
+        path, sep='\t', header=None, usecols=[1, 3], encoding='latin-1',
+        names=['county', 'FIPS', 'neighbor', 'neighbor_FIPS'],
+        dtype={'FIPS': 'float', 'neighbor_FIPS': 'float'},
+    )
+    adj['FIPS'] = adj['FIPS'].ffill()
+    adj = adj.dropna().astype(int)
+    # Counties bordering none (islands) keep a row, with no neighbors
+    fips = np.union1d(adj['FIPS'], adj['neighbor_FIPS'])
+    adj = adj[adj['FIPS'] != adj['neighbor_FIPS']]
+    adjacency = _edges_to_csr(
+        np.searchsorted(fips, adj['FIPS']),
+        np.searchsorted(fips, adj['neighbor_FIPS']),
+        len(fips),
+    )
+
+    return adjacency, fips
+
+def align_adjacency(adjacency, fips, target_fips):
+    """
+    Adjacency restricted and reordered to target_fips, e.g. the rows of a
+    county x date array. Counties absent from the graph have no neighbors.
+    """
+    pos = pd.Index(fips).get_indexer(np.asarray(target_fips))
+    found = np.flatnonzero(pos >= 0)
+    # Target row of each graph county, -1 if not a target
+    target = np.full(len(fips), -1)
+    target[pos[found]] = found
+
+    coo = adjacency.tocoo()
+    rows, cols = target[coo.row], target[coo.col]
+    keep = (rows >= 0) & (cols >= 0)
+
+    return _edges_to_csr(rows[keep], cols[keep], len(pos))
+
+def k_hop(adjacency, k):
+    """Counties within k steps of each county, excluding itself."""
+    reach = adjacency.astype(bool).tocsr()
+    step = reach
+    for _ in range(k - 1):
+        step = (step @ adjacency).astype(bool)
+        reach = reach + step
+    reach = reach.tolil()
+    reach.setdiag(False)
+
+    return _edges_to_csr(*reach.tocsr().nonzero(), adjacency.shape[0])
+
+def neighbor_sum(adjacency, values):
+    """
+    Sum over neighbors of each county of values, an (n,) or (n, T) array
+    with rows aligned to the adjacency. NaNs are skipped.
+    """
+    values = np.asarray(values, dtype=float)
+    return adjacency @ np.nan_to_num(values)
+
+def neighbor_mean(adjacency, values):
+    """Mean over neighbors, skipping NaNs; NaN if no neighbor has a value."""
+    sums, counts = _neighbor_moments(adjacency, values)[:2]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+def neighbor_std(adjacency, values):
+    """Sample standard deviation over neighbors, skipping NaNs."""
+    sums, counts, squares = _neighbor_moments(adjacency, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (squares - sums**2 / counts) / (counts - 1)
+    return np.where(counts > 1, np.sqrt(np.maximum(var, 0)), np.nan)
+
+def neighbor_correlation(adjacency, values, other=None):
+    """
+    Pearson correlation along dates between each county's series and each
+    neighbor's series, for every edge at once.
+
+    values : (n, T) county x date array, rows aligned to the adjacency
+    other : (n, T) array of the neighbor series (default values)
+
+    Returns a CSR matrix with the adjacency's pattern whose entry (i, j)
+    is corr(values[i], other[j]). Series with NaNs give NaN.
+    """
+    z = _standardize(values)
+    z_other = z if other is None else _standardize(other)
+    coo = adjacency.tocoo()
+    corr = np.einsum('ij,ij->i', z[coo.row], z_other[coo.col]) / z.shape[1]
+
+    return sparse.csr_matrix((corr, (coo.row, coo.col)), shape=adjacency.shape)
+
+def to_edge_dict(adjacency, fips):
+    """FIPS -> list of neighbor FIPS, as the old county_adjacency_edge_dict.pkl."""
+    adjacency = adjacency.tocsr()
+    return {
+        int(f): [int(n) for n in fips[adjacency.indices[adjacency.indptr[i]:adjacency.indptr[i + 1]]]]
+        for i, f in enumerate(fips)
+    }
+
+
+#################################
+# Utility Functions
+#################################
+def _edges_to_csr(rows, cols, n):
+    """0/1 CSR matrix of the edges, duplicates counted once."""
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)), shape=(n, n)
+    )
+    adjacency.data[:] = 1
+    adjacency.sort_indices()
+    return adjacency
+
+def _neighbor_moments(adjacency, values):
+    """Neighbor sums, counts of non-NaN values and sums of squares."""
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0)
+    sums = adjacency @ filled
+    if present.all():
+        counts = np.asarray(adjacency.sum(axis=1)).reshape(-1)
+        counts = counts if values.ndim == 1 else counts[:, None]
+    else:
+        counts = adjacency @ present.astype(float)
+
+    return sums, counts, adjacency @ filled**2
+
+def _standardize(values):
+    """Rows centered and scaled to unit (population) variance."""
+    values = np.asarray(values, dtype=float)
+    centered = values - values.mean(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return centered / centered.std(axis=1, keepdims=True)
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from collections import namedtuple
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+# Standardized frames are stored next to data/processed
+cache_dir = Path('../data/cache')
+enabled = True
+# Fingerprint sources by content hash as well as by mtime and size
+hash_sources = False
+
+# Bump when a cached loader changes what it returns
+CACHE_VERSION = 3
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses'])
+_stats = {}
+
+def cached(sources):
+    """
+    Caches the frames returned by a loader in a columnar format.
+
+    Entries are keyed on the loader, its arguments and a fingerprint of
+    its source files, so they are rebuilt only when one of these changes.
+
+    sources : method taking the loader arguments and returning the paths
+        of the files the loader reads
+    """
+    def decorator(loader):
+        signature = inspect.signature(loader)
+
+        @functools.wraps(loader)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return loader(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            stats = _stats.setdefault(loader.__name__, [0, 0])
+
+            args_key = _hash([loader.__name__, CACHE_VERSION, arguments])
+            source_key = _hash(
+                [fingerprint(p) for p in sources(**arguments)])
+            prefix = f'{loader.__name__}-{args_key}'
+            manifest = cache_dir / f'{prefix}-{source_key}.json'
+            if manifest.exists():
+                stats[0] += 1
+                return _read_entry(manifest)
+
+            stats[1] += 1
+            result = loader(*args, **kwargs)
+            # Other processes may be removing the same stale entries, or
+            # writing the current one
+            for stale in cache_dir.glob(f'{prefix}-*'):
+                if not stale.name.startswith(manifest.stem):
+                    stale.unlink(missing_ok=True)
+            _write_entry(manifest, result)
+
+            return result
+
+        return wrapper
+    return decorator
+
+def fingerprint(path):
+    """Identifies a version of a source file."""
+    path = Path(path)
+    stat = os.stat(path)
+    fp = {
+        'path': str(path.resolve()),
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+    }
+    if hash_sources:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        fp['sha1'] = digest.hexdigest()
+
+    return fp
+
+def cache_info(loader=None):
+    """Cache hits and misses of one loader, or of all loaders."""
+    if loader is not None:
+        return CacheInfo(*_stats.get(loader, [0, 0]))
+    return CacheInfo(
+        sum(s[0] for s in _stats.values()),
+        sum(s[1] for s in _stats.values()),
+    )
+
+def clear_cache(stats=True):
+    """Removes every cache entry, and resets hit/miss counts if stats."""
+    if cache_dir.exists():
+        for f in cache_dir.iterdir():
+            f.unlink(missing_ok=True)
+    if stats:
+        _stats.clear()
+
+
+#################################
+# Utility Functions
+#################################
+def _hash(obj):
+    return hashlib.sha1(
+        json.dumps(obj, sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+
+def _write_entry(manifest, result):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    items = result if isinstance(result, tuple) else (result,)
+    entries = []
+    for i, item in enumerate(items):
+        if isinstance(item, pd.DataFrame):
+            entries.append({'frame': _write_frame(manifest, i, item)})
+        else:
+            entries.append({'value': item})
+    # The manifest is written last so a partial entry is never read
+    def write(path):
+        with open(path, 'w') as f:
+            json.dump({'tuple': isinstance(result, tuple), 'items': entries}, f,
+                      default=_json_default)
+    _replace(manifest, write)
+
+def _read_entry(manifest):
+    with open(manifest) as f:
+        entry = json.load(f)
+    items = []
+    for item in entry['items']:
+        if 'frame' in item:
+            items.append(_read_frame(cache_dir / item['frame']))
+        else:
+            items.append(item['value'])
+
+    return tuple(items) if entry['tuple'] else items[0]
+
+def _write_frame(manifest, i, df):
+    stem = manifest.stem
+    try:
+        name = f'{stem}-{i}.parquet'
+        _replace(cache_dir / name, df.to_parquet)
+    except (ImportError, ValueError, TypeError):
+        # No parquet engine, or labels or mixed columns parquet cannot
+        # store (pyarrow raises ArrowInvalid or ArrowTypeError)
+        name = f'{stem}-{i}.pkl'
+        _replace(cache_dir / name, df.to_pickle)
+
+    return name
+
+def _replace(path, write):
+    """
+    Writes path through a temporary file of this process, moved into place
+    once complete, so concurrent writers of the same entry never share a
+    partial file.
+    """
+    with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+        tmp = Path(f.name)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def _read_frame(path):
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
@@ -2,16 +2,23 @@ import numpy as np
 import pandas as pd
 from pathlib import Path
 import re
-from ..utils.dates import str2date, switch_date_format, ordinal2string, lag_date
-from ..utils.df_utils import get_date_columns
+from ..utils.dates import str2date, switch_date_format, ordinals2strs, lag_date, days2strs, str2day, full_format, dtime_format, get_header_days
+from ..utils.df_utils import get_date_columns, to_date_index, gather_days
+from ..utils.profiling import profiled, stage
 from ..pandas.align import align_lagged_dates
+from .cache import cached, fingerprint
+from . import schema
+from .fips import build_registry, county_index, row_lookup, join_counties
+from .state import build_deaths_state, extend_deaths_state, build_od_state, extend_od_state, save_state, load_state
 
 import os
 
 data_dir = Path('../data')
 raw_dir = data_dir / 'raw'
 processed_dir = data_dir / 'processed'
+state_dir = processed_dir / 'state'
 
+@profiled
 def _get_file(path, name):
     files = []
     dtimes = []
@@ -22,91 +29,186 @@ def _get_file(path, name):
             files.append(f)
             dtimes.append(match.group(1))
 
-    return(max(zip(files,dtimes), key=lambda x: str2date(x[1])))
+    return(max(zip(files,dtimes), key=lambda x: _get_snapshot_day(x[1])))
 
-def load_deaths(join_county_codes = False, drop_geo=False, standardize_dates=True):
+def _get_snapshot_day(dtime):
+    """
+    Day of a snapshot suffix. Year-qualified suffixes (full_format) order
+    across years; "%m-%d" suffixes are taken as 1900, before any of them.
+    """
+    try:
+        return str2day(dtime, full_format)
+    except ValueError:
+        return str2day(dtime)
+
+def _latest_file(path, name):
+    return path / _get_file(path, name)[0]
+
+@profiled
+@cached(lambda join_county_codes, **_: (
+    [_latest_file(raw_dir, 'time_series_covid19_deaths_US')] +
+    ([_latest_file(raw_dir, 'counties'), raw_dir / 'countyfipstool2019.csv']
+     if join_county_codes else [])))
+def load_deaths(join_county_codes = False, drop_geo=False, standardize_dates=True, date_index=False):
+    """
+    Loads the latest JHU deaths time series. With date_index, returns the
+    date x FIPS series on a DatetimeIndex instead (see `to_date_index`),
+    which keeps the year of every date. The series has no county columns
+    to join codes onto, so join_county_codes cannot be combined with it.
+    """
+    if date_index and join_county_codes:
+        raise ValueError(
+            'join_county_codes adds a column per county row, which the '
+            'date_index series does not have; select its FIPS columns instead.'
+        )
     deaths_path, date = _get_file(raw_dir, 'time_series_covid19_deaths_US')
-    deaths = pd.read_csv(raw_dir / deaths_path, parse_dates = True)
+    deaths = schema.read_csv(raw_dir / deaths_path, 'deaths', parse_dates = True)
+    if date_index:
+        deaths = deaths.dropna(subset=['FIPS']).astype({'FIPS':'int32'})
+        return(to_date_index(deaths, 'FIPS', "%m/%d/%y"), date)
     if drop_geo or join_county_codes:
         deaths = deaths.drop(labels=['UID', 'iso2', 'iso3', 'code3', 'Admin2', 'Province_State', 'Country_Region', 'Lat', 'Long_', "Combined_Key", "Population"], axis=1)
     if join_county_codes:
         county_codes = load_counties()[0][['FIPS', 'Rural-urban_Continuum Code_2013']]
-        deaths = pd.merge(deaths, county_codes, on="FIPS")
+        deaths = join_counties(deaths, county_codes, load_county_fips()['FIPS'],
+                           sources=('deaths', 'counties'))
     if standardize_dates:
-        deaths.rename(columns={c:switch_date_format(c,"%m/%d/%y") for c in deaths.columns}, inplace=True)
+        _standardize_dates(deaths, "%m/%d/%y")
 
     return(deaths, date)
 
+@profiled
+@cached(lambda **_: [_latest_file(raw_dir, 'interventions')])
 def load_interventions(standardize_dates = True):
+    """
+    Loads the latest county interventions, whose dates are day ordinals
+    (see `npi` for them as arrays). With standardize_dates, the dates are
+    formatted as standard date strings.
+    """
     csv_path, date = _get_file(raw_dir, 'interventions')
     interventions = pd.read_csv(raw_dir / csv_path, parse_dates = True)
 
     if standardize_dates:
-        interventions.iloc[:,3:] = interventions.iloc[:,3:].applymap(ordinal2string)
+        interventions = interventions.astype({c:object for c in interventions.columns[3:]})
+        interventions.iloc[:,3:] = interventions.iloc[:,3:].apply(ordinals2strs)
 
     return(interventions, date)
 
-def load_google_mobility(remove_foreign=True):
+@profiled
+@cached(lambda **_: [_latest_file(raw_dir, 'google_mobility_report')])
+def load_google_mobility(remove_foreign=True, chunksize=100000):
+    """
+    Loads the latest Google community mobility report.
+
+    With remove_foreign, the global report is streamed in chunks of
+    chunksize rows and only US county rows are kept, with categorical
+    state/county and float32 percent changes, so that memory is bounded
+    by the US portion of the file.
+    """
     csv_path, date = _get_file(raw_dir, 'google_mobility_report')
-    mobility = pd.read_csv(raw_dir / csv_path, parse_dates = True)
-    
-    if remove_foreign:
-        mobility = mobility[mobility.loc[:,'country_region_code'] == 'US']
-        mobility.drop(labels=['country_region_code', 'country_region'], axis=1, inplace=True)
-        mobility.dropna(axis='rows',subset=['sub_region_1','sub_region_2'], inplace=True)
-        mobility.rename(columns={'sub_region_1':'state','sub_region_2':'county'}, inplace=True)
+    if not remove_foreign:
+        mobility = schema.read_csv(raw_dir / csv_path, 'google_mobility', parse_dates = True)
+        return(mobility, date)
+
+    header = pd.read_csv(raw_dir / csv_path, nrows=0).columns
+    ## Text as str per chunk, as categories of separate chunks do not concat
+    dtypes = {c:(str if t == 'category' else t)
+              for c, t in schema.dtypes('google_mobility', header).items()}
+    chunks = pd.read_csv(
+        raw_dir / csv_path,
+        usecols=lambda c: c != 'country_region',
+        dtype=dtypes,
+        chunksize=chunksize,
+    )
+    mobility = pd.concat(
+        chunk[chunk['country_region_code'] == 'US'].dropna(
+            axis='rows', subset=['sub_region_1','sub_region_2'])
+        for chunk in chunks
+    )
+    mobility.drop(labels=['country_region_code'], axis=1, inplace=True)
+    mobility = schema.astype(mobility, 'google_mobility')
+    mobility.rename(columns={'sub_region_1':'state','sub_region_2':'county'}, inplace=True)
 
     return(mobility, date)
 
+@profiled
+@cached(lambda **_: [_latest_file(raw_dir, 'counties')])
 def load_counties():
     csv_path, date = _get_file(raw_dir, 'counties')
-    csv = pd.read_csv(raw_dir / csv_path, parse_dates = True)
+    csv = schema.read_csv(raw_dir / csv_path, 'counties', parse_dates = True)
 
     return(csv, date)
 
+@profiled
+@cached(lambda **_: [raw_dir / 'countyfipstool2019.csv'])
+def load_county_fips():
+    """
+    County FIPS registry (see `fips.build_registry`): FIPS, state and
+    state_abbr of each county, sorted by FIPS, so that the row of a county
+    is its index.
+    """
+    tool = schema.read_csv(raw_dir / 'countyfipstool2019.csv', 'fips_tool', encoding='latin-1')
+
+    return build_registry(tool)
+
+@profiled
+@cached(lambda **_: [_latest_file(processed_dir, 'mobility_time_series')])
 def load_google_mobility_time_series():
     csv_path, date = _get_file(processed_dir, 'mobility_time_series')
-    mobility_ts = pd.read_csv(processed_dir / csv_path, parse_dates = True)
+    mobility_ts = schema.read_csv(processed_dir / csv_path, 'mobility_time_series', parse_dates = True)
 
     return(mobility_ts,date)
 
-def load_infection_time_series(standardize_dates=True):
+@profiled
+@cached(lambda **_: [_latest_file(raw_dir, 'infection_time_series')])
+def load_infection_time_series(standardize_dates=True, date_index=False):
     csv_path, date = _get_file(raw_dir, 'infection_time_series')
-    infections_ts = pd.read_csv(raw_dir / csv_path, parse_dates = True)
+    infections_ts = schema.read_csv(raw_dir / csv_path, 'infections', parse_dates = True)
 
+    if date_index:
+        infections_ts = infections_ts.dropna(subset=['FIPS']).astype({'FIPS':'int32'})
+        return(to_date_index(infections_ts, 'FIPS', "%m/%d/%y"), date)
     if standardize_dates:
-        infections_ts.rename(columns={c:switch_date_format(c,"%m/%d/%y") for c in infections_ts.columns}, inplace=True)
+        _standardize_dates(infections_ts, "%m/%d/%y")
 
     return(infections_ts,date)
 
-def load_descartes_m50(standardize_dates=True):
+@profiled
+@cached(lambda **_: [_latest_file(raw_dir, 'descartes_m_50')])
+def load_descartes_m50(standardize_dates=True, date_index=False):
     csv_path, date = _get_file(raw_dir, 'descartes_m_50')
-    df = pd.read_csv(raw_dir / csv_path, parse_dates = True)
+    df = schema.read_csv(raw_dir / csv_path, 'm50', parse_dates = True)
 
-    if standardize_dates:
-        df.rename(columns={c:switch_date_format(c,"%Y-%m-%d") for c in df.columns}, inplace=True)
+    if standardize_dates and not date_index:
+        _standardize_dates(df, "%Y-%m-%d")
     
     df.rename(columns={'fips':'FIPS'}, inplace=True)
     df.dropna(axis=0, subset=['admin2'], inplace=True)
-    df['FIPS'] = df['FIPS'].astype(int)
+    df['FIPS'] = df['FIPS'].astype('int32')
+    if date_index:
+        return(to_date_index(df, 'FIPS', "%Y-%m-%d"), date)
 
     return(df,date)
 
+@profiled
+@cached(lambda **_: [processed_dir / 'od_mobility_baseline.csv'])
 def load_od_baseline():
-    od_mobility = pd.read_csv('../data/processed/od_mobility_baseline.csv')
+    od_mobility = schema.read_csv(processed_dir / 'od_mobility_baseline.csv', 'od_baseline')
     return od_mobility
 
+@profiled
+@cached(lambda **_: [processed_dir / 'Hospitals.csv'])
 def load_acute_care(beds=True):
-    hospitals = pd.read_csv('../data/processed/Hospitals.csv')
-    hospitals = hospitals[['TYPE', 'STATUS', 'COUNTYFIPS', 'BEDS']]
+    hospitals = schema.read_csv(processed_dir / 'Hospitals.csv', 'hospitals',
+                                usecols=['TYPE', 'STATUS', 'COUNTYFIPS', 'BEDS'])
     hospitals = hospitals[hospitals["STATUS"] == 'OPEN']
     hospitals = hospitals[hospitals["TYPE"] == 'GENERAL ACUTE CARE']
     if beds:
-        hospitals = hospitals[hospitals["BEDS"].astype(str).astype(int) > 0]
+        hospitals = hospitals[hospitals["BEDS"] > 0]
     hospitals["FIPS"] = hospitals["COUNTYFIPS"]
     hospitals = hospitals[hospitals["FIPS"] != 'NOT AVAILABLE']
     hospitals = hospitals.drop(["COUNTYFIPS", "STATUS"], axis=1)
-    hospitals["FIPS"] = hospitals["FIPS"].astype(str).astype(int)
+    hospitals["FIPS"] = hospitals["FIPS"].astype('int32')
     hospitals = hospitals.groupby("FIPS")['BEDS'].agg(
         ['sum', 'count']).rename(columns={'sum':'Beds', 'count':'HospCt'}
         )
@@ -114,19 +216,35 @@ def load_acute_care(beds=True):
 
     return hospitals
 
+@profiled
+@cached(lambda **_: [processed_dir / 'clustering.csv'])
 def load_matthias_clusters():
     csv_path, date = _get_file(raw_dir, 'descartes_m_50')
-    df = pd.read_csv('../data/processed/clustering.csv')
+    df = schema.read_csv(processed_dir / 'clustering.csv', 'clustering')
     df = df[['FIPS', 'cluster']]
     return df
 
-def load_od_mobilities():
+@profiled
+@cached(lambda **_: [_latest_file(processed_dir, 'od_inter_mobilities')])
+def load_od_mobilities(date_index=False, year=2020):
+    """
+    Loads the latest OD trips per county, with "%m-%d" date headers, or
+    full_format ones for a file spanning more than a year. With
+    date_index, returns the date x FIPS series on a DatetimeIndex instead
+    (see `to_date_index`), "%m-%d" headers being dates of year.
+    """
     csv_path, date = _get_file(processed_dir, 'od_inter_mobilities')
-    mobility_ts = pd.read_csv(processed_dir / csv_path, parse_dates = True)
+    mobility_ts = schema.read_csv(processed_dir / csv_path, 'od', parse_dates = True)
+
+    if date_index:
+        fmt = full_format if get_header_days(mobility_ts.columns, full_format)[0] else dtime_format
+        return(to_date_index(mobility_ts, 'FIPS', fmt, year), date)
 
     return mobility_ts, date
 
-def get_cum_deaths_dataframe(n_days, onset_threshold=3, time_series=False):
+@profiled
+def get_cum_deaths_dataframe(n_days, onset_threshold=3, time_series=False, incremental=False,
+                             start=None, end=None):
     """
     Returns a dataframe of static variables, mobility statistics, and deaths
     (cumulative) ndays out.
@@ -139,113 +257,123 @@ def get_cum_deaths_dataframe(n_days, onset_threshold=3, time_series=False):
     onset_threshold : int
         Death threshold to mark a county outbreak start.
     time_series : boolean (default=False)
+    incremental : boolean (default=False)
+        Keep the derived deaths and OD state under data/processed/state.
+        When `_get_file` finds a newer snapshot, the state is updated from
+        its appended dates and revised counties only.
+    start, end : date strings or datetimes (default unbounded)
+        Date range of the deaths and OD series to use, sliced on their
+        DatetimeIndex, so files spanning several years need no
+        truncation. The onset column gives "%m-%d" dates.
     """
 
-    # Time series data
-    mobility, mobility_date = load_google_mobility()
-    deaths, deaths_date = load_deaths(join_county_codes=False)
-    interventions, interventions_date = load_interventions()
+    counties, hospitals, deaths_states, od_state, county_fips = load_cum_deaths_inputs(
+        [onset_threshold], incremental, start, end)
+
+    return build_cum_deaths_dataframe(
+        deaths_states[onset_threshold], od_state, counties, hospitals,
+        n_days, time_series, county_fips)
+
+@profiled
+def load_cum_deaths_inputs(onset_thresholds, incremental=False, start=None, end=None):
+    """
+    Inputs of `build_cum_deaths_dataframe`, so several configurations can
+    share them: counties, hospitals, a dict of the deaths state of each
+    onset threshold, the OD mobility state and the FIPS of the county
+    registry. The deaths CSV is read at most once, and the series are
+    restricted to the dates from start to end.
+    """
     # Static data
     counties, counties_date = load_counties()
-    # Processed mobility -> time series
-    mobility_ts, mobility_ts_date = load_google_mobility_time_series()
-    m50,_ = load_descartes_m50()
-    od_mobilities, _ = load_od_mobilities()
     hospitals = load_acute_care(beds=True)
-    ## Get death dataframe date columns
-    death_dates = get_date_columns(deaths, return_dtimes=False)
-    ## Moving average (weekly) mobility
-    od_mobilities_ma = od_mobilities.copy()
-    od_mobilities_ma[od_mobilities_ma.columns[1:]] = od_mobilities[
-        od_mobilities.columns[1:]
-        ].rolling(7, center=True, axis=1).mean()
-    od_mobilities_ma = od_mobilities_ma.dropna(axis=1)
-    deaths_df = deaths[['FIPS']+death_dates]
-    deaths_df.dropna(subset=['FIPS'], inplace=True)
-    deaths_df = deaths_df.astype({'FIPS':int})
-    deaths_df['onset'] = deaths_df[death_dates].apply(
-        lambda row: _get_onset_date(row, thresh=onset_threshold), axis=1)
-    ## Drop counties with no onset
-    deaths_df = deaths_df.dropna(axis=0, subset=['onset'])
-    ## Only counties with N_DAYS worth of data after onset
-    deaths_df = deaths_df[deaths_df['onset'].apply(
-        lambda d: (str2date(death_dates[-1]) - str2date(d)).days >= n_days
-    )]
-    ## Remove counties with growth decrease, in case of errors
-    deaths_df = deaths_df[
-        deaths_df.apply(
-            lambda r: r[[d for d in death_dates if 
-                str2date(d) >= str2date(r['onset']) and 
-                str2date(d) <= lag_date(str2date(r['onset']
-            ), 
-            lag=n_days, backwards=False)
-                        ]].diff().min() >= 0, axis=1
-        )
-    ]
-    ## Get the number of deaths or timeseries to N_DAYS from onset
-    ## and make final dataframe
-    if time_series:
-        for days_past in range(n_days):
-            deaths_df[f'day_{days_past+1:02d}'] = deaths_df.apply(
-                lambda row: row[lag_date(row['onset'], days_past, backwards=False, return_date=False)],axis=1
-            )
-        cum_deaths = deaths_df[['FIPS'] + [f'day_{d+1:02d}' for d in range(n_days)] + ['onset']]
-    else:
-        deaths_df['cum_deaths'] = deaths_df.apply(
-            lambda r: r[lag_date(str2date(r['onset']), lag=n_days, backwards=False, return_date=False)], axis=1
-        )
-        
-        cum_deaths = deaths_df[['FIPS', 'cum_deaths', 'onset']]
-    cum_deaths = pd.merge(cum_deaths, hospitals, on='FIPS')
-    ## OD baseline
-    od_dates = get_date_columns(od_mobilities, return_dtimes=False)
-    od_mobilities['OD_baseline'] = od_mobilities.apply(lambda x: x[od_dates[:14]].mean(), axis=1)
-    cum_deaths = pd.merge(cum_deaths, od_mobilities[['FIPS', 'OD_baseline']], on='FIPS')
-    ## OD at onset
-    new_row = []
-    for i,row in cum_deaths.iterrows():
-        try:
-            od = od_mobilities_ma[od_mobilities_ma['FIPS']==row['FIPS']][row['onset']].iloc[0]
-        except:
-            od = np.nan
-        new_row.append(od)
-    cum_deaths['OD_at_onset'] = new_row
-    ## OD 2 weeks before onset
-    new_row = []
-    for i,row in cum_deaths.iterrows():
-        try:
-            lag_onset = lag_date(row['onset'], lag=14, backwards=True, return_date=False)
-            od = od_mobilities_ma[od_mobilities_ma['FIPS']==row['FIPS']][lag_onset].iloc[0]
-        except:
-            od = np.nan
-        new_row.append(od)
-    cum_deaths['OD_2wk_before_onset'] = new_row
-    ## OD 2 weeks after onset
-    new_row = []
-    for i,row in cum_deaths.iterrows():
-        try:
-            lag_onset = lag_date(row['onset'], lag=14, backwards=False, return_date=False)
-            od = od_mobilities_ma[od_mobilities_ma['FIPS']==row['FIPS']][lag_onset].iloc[0]
-        except:
-            od = np.nan
-        new_row.append(od)
-    cum_deaths['OD_2wk_after_onset'] = new_row
-    ## static features
-    static_features = counties[
-        ['FIPS',
-        'Rural-urban_Continuum Code_2013',
-        'Density per square mile of land area - Population',
-        'Percent of adults with less than a high school diploma 2014-18',
-        'PCTPOV017_2018',
-        'Unemployment_rate_2018',
-        'Total_age65plus', 
-        'POP_ESTIMATE_2018']
-    ]
-    static_features = static_features.dropna()
-    cum_deaths = cum_deaths.merge(static_features, on="FIPS")
-    ## Outliers
-    outliers = [36061, 6038, 17031, 48201]
-    cum_deaths = cum_deaths[~cum_deaths['FIPS'].isin(outliers)]
+    # Time series data, as county x day state
+    deaths_states = _get_deaths_states(onset_thresholds, incremental, start, end)
+    od_state = _get_od_state(incremental, start, end)
+    county_fips = load_county_fips()['FIPS'].to_numpy()
+
+    return counties, hospitals, deaths_states, od_state, county_fips
+
+@profiled
+def build_cum_deaths_dataframe(deaths_state, od_state, counties, hospitals, n_days, time_series=False,
+                               county_fips=None):
+    """
+    `get_cum_deaths_dataframe` from loaded inputs (see
+    `load_cum_deaths_inputs`). Inputs are only read. Sources are joined on
+    their index in the county registry county_fips (default
+    `load_county_fips`).
+    """
+    if county_fips is None:
+        county_fips = load_county_fips()['FIPS'].to_numpy()
+    with stage('select_onsets', len(deaths_state['fips'])) as record:
+        fips = deaths_state['fips']
+        counts = deaths_state['counts']
+        days = deaths_state['days']
+        ## Onset column index, -1 for counties with no onset
+        onset = deaths_state['onset']
+        ## Only counties with N_DAYS worth of data after onset
+        keep = (onset >= 0) & (days[-1] - days[onset] >= n_days)
+        ## Remove counties with growth decrease, in case of errors
+        keep &= _is_nondecreasing(deaths_state, onset, n_days)
+        rows = np.flatnonzero(keep)
+        onset = onset[rows]
+        ## Get the number of deaths or timeseries to N_DAYS from onset
+        ## and make final dataframe
+        cum_deaths = pd.DataFrame({'FIPS': fips[rows]})
+        if time_series:
+            lags = np.arange(n_days)
+            cols = np.searchsorted(days, days[onset][:, None] + lags)
+            for days_past in lags:
+                cum_deaths[f'day_{days_past+1:02d}'] = counts[rows, cols[:, days_past]]
+        else:
+            cols = np.searchsorted(days, days[onset] + n_days)
+            cum_deaths['cum_deaths'] = counts[rows, cols]
+        ## Onset as "%m-%d", as downstream notebooks read it
+        cum_deaths['onset'] = days2strs(days[onset])
+        onset_days = pd.Series(days[onset], index=fips[rows])
+        record['rows_out'] = len(cum_deaths)
+    with stage('od_features', len(cum_deaths)) as record:
+        cum_deaths = join_counties(cum_deaths, hospitals, county_fips, sources=('deaths', 'hospitals'))
+        ## OD baseline
+        od_fips = od_state['fips']
+        od_baseline = pd.DataFrame({
+            'FIPS': od_fips,
+            'OD_baseline': pd.DataFrame(od_state['values'][:, :14]).mean(axis=1),
+        })
+        cum_deaths = join_counties(cum_deaths, od_baseline, county_fips, sources=('deaths', 'OD'))
+        ## Moving average (weekly) mobility, keeping only complete days
+        complete = ~np.isnan(od_state['ma']).any(axis=0)
+        od_ma = od_state['ma'][:, complete]
+        od_days = od_state['days'][complete]
+        ## One county -> OD row lookup shared by every OD gather
+        od_rows = row_lookup(county_index(county_fips, od_fips), len(county_fips))[
+            county_index(county_fips, cum_deaths['FIPS'])
+        ]
+        onset_days = onset_days.loc[cum_deaths['FIPS']].to_numpy()
+        ## OD at onset, 2 weeks before onset and 2 weeks after onset
+        cum_deaths['OD_at_onset'] = gather_days(od_ma, od_days, od_rows, onset_days)
+        cum_deaths['OD_2wk_before_onset'] = gather_days(
+            od_ma, od_days, od_rows, onset_days - 14)
+        cum_deaths['OD_2wk_after_onset'] = gather_days(
+            od_ma, od_days, od_rows, onset_days + 14)
+        record['rows_out'] = len(cum_deaths)
+    with stage('merge_static', len(cum_deaths)) as record:
+        ## static features
+        static_features = counties[
+            ['FIPS',
+            'Rural-urban_Continuum Code_2013',
+            'Density per square mile of land area - Population',
+            'Percent of adults with less than a high school diploma 2014-18',
+            'PCTPOV017_2018',
+            'Unemployment_rate_2018',
+            'Total_age65plus', 
+            'POP_ESTIMATE_2018']
+        ]
+        static_features = static_features.dropna()
+        cum_deaths = join_counties(cum_deaths, static_features, county_fips, sources=('deaths', 'counties'))
+        ## Outliers
+        outliers = [36061, 6038, 17031, 48201]
+        cum_deaths = cum_deaths[~cum_deaths['FIPS'].isin(outliers)]
+        record['rows_out'] = len(cum_deaths)
 
     return cum_deaths
 
@@ -253,9 +381,101 @@ def get_cum_deaths_dataframe(n_days, onset_threshold=3, time_series=False):
 #################################
 # Utility Functions
 #################################
-def _get_onset_date(row, thresh):
-    above = row[row >= thresh]
-    if len(above) == 0:
-        return np.nan
+@profiled
+def _standardize_dates(df, fmt):
+    """Renames date headers in fmt to the standard format, in place."""
+    df.rename(columns={c:switch_date_format(c,fmt) for c in df.columns}, inplace=True)
+    if df.columns.duplicated().any():
+        raise ValueError(
+            'Standardized date headers collide because the dates span more '
+            'than a year; load with date_index=True instead.'
+        )
+
+@profiled
+def _get_deaths_states(onset_thresholds, incremental, start=None, end=None):
+    """
+    Deaths state (see `state.build_deaths_state`) of the latest snapshot,
+    from start to end, for each onset threshold, persisted and extended
+    from the previous one if incremental.
+    """
+    source = _state_source(_latest_file(raw_dir, 'time_series_covid19_deaths_US'), start, end)
+    states = {}
+    args = None
+    for onset_threshold in onset_thresholds:
+        path = state_dir / f'deaths_onset_{onset_threshold}.npz'
+        state, state_source = load_state(path) if incremental else (None, None)
+        if state is not None and state_source == source:
+            states[onset_threshold] = state
+            continue
+
+        if args is None:
+            deaths, deaths_date = load_deaths(date_index=True)
+            deaths = deaths.loc[start:end]
+            args = (
+                deaths.columns.to_numpy().astype(int),
+                deaths.index,
+                np.ascontiguousarray(deaths.to_numpy().T),
+            )
+        if state is None:
+            state = build_deaths_state(*args, onset_threshold)
+        else:
+            state = extend_deaths_state(state, *args, onset_threshold)
+        if incremental:
+            save_state(path, state, source)
+        states[onset_threshold] = state
+
+    return states
+
+@profiled
+def _get_od_state(incremental, start=None, end=None):
+    """
+    OD mobility state (see `state.build_od_state`) of the latest snapshot,
+    from start to end, persisted and extended from the previous one if
+    incremental.
+    """
+    source = _state_source(_latest_file(processed_dir, 'od_inter_mobilities'), start, end)
+    path = state_dir / 'od_inter_mobilities.npz'
+    state, state_source = load_state(path) if incremental else (None, None)
+    if state is not None and state_source == source:
+        return state
+
+    od_mobilities, _ = load_od_mobilities(date_index=True)
+    od_mobilities = od_mobilities.loc[start:end]
+    args = (
+        od_mobilities.columns.to_numpy(),
+        od_mobilities.index,
+        np.ascontiguousarray(od_mobilities.to_numpy(dtype=float).T),
+    )
+    if state is None:
+        state = build_od_state(*args)
     else:
-        return above.idxmin()
\ No newline at end of file
+        state = extend_od_state(state, *args)
+    if incremental:
+        save_state(path, state, source)
+
+    return state
+
+def _state_source(path, start, end):
+    """Fingerprint of the snapshot and date range a state is built from."""
+    return {
+        **fingerprint(path),
+        'start': None if start is None else str(pd.Timestamp(start).date()),
+        'end': None if end is None else str(pd.Timestamp(end).date()),
+    }
+
+def _is_nondecreasing(deaths_state, onset, n_days):
+    """
+    Whether each row has no decrease over its window of columns from onset
+    to N_DAYS after onset. Rows with no onset or no defined difference in
+    the window are marked False.
+    """
+    days = deaths_state['days']
+    decreases = deaths_state['decreases']
+    defined = deaths_state['defined']
+    start = np.maximum(onset, 0)
+    end = np.searchsorted(days, days[start] + n_days, side='right') - 1
+    idx = np.arange(len(onset))
+    n_decreases = decreases[idx, end] - decreases[idx, start]
+    n_defined = defined[idx, end] - defined[idx, start]
+
+    return (onset >= 0) & (n_decreases == 0) & (n_defined > 0)
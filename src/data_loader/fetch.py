@@ -0,0 +1,180 @@
+"""
+Downloads the raw data snapshots (see notebooks/01-rp-pull_data.ipynb)
+into data/raw/<name>_<yyyy-mm-dd>.csv, the names `data_loader._get_file`
+reads and orders across years.
+
+Sources are fetched concurrently over a thread pool. For each source the
+ETag, Last-Modified and SHA-1 of its latest snapshot are kept in
+data/raw/.fetch/<name>.json, so that:
+
+ - requests are conditional (If-None-Match / If-Modified-Since) and an
+   unchanged upstream file is not downloaded again (304)
+ - an interrupted download is resumed from its partial file with a Range
+   request, guarded by If-Range so a changed upstream file restarts it
+ - a download whose content matches the latest snapshot is not written
+   as a new snapshot
+ - snapshots are written to a partial file and moved into place, so
+   readers never see a truncated CSV
+"""
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from . import data_loader
+from ..utils.dates import full_format
+from ..utils.parallel import get_n_jobs
+
+sources = {
+    'time_series_covid19_deaths_US': 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv',
+    'counties': 'https://raw.githubusercontent.com/JieYingWu/COVID-19_US_County-level_Summaries/master/data/counties.csv',
+    'interventions': 'https://raw.githubusercontent.com/JieYingWu/COVID-19_US_County-level_Summaries/master/data/interventions.csv',
+    'google_mobility_report': 'https://www.gstatic.com/covid19/mobility/Global_Mobility_Report.csv',
+    'infection_time_series': 'https://raw.githubusercontent.com/JieYingWu/COVID-19_US_County-level_Summaries/master/data/infections_timeseries.csv',
+    'descartes_m_50': 'https://raw.githubusercontent.com/descarteslabs/DL-COVID-19/master/DL-us-m50.csv',
+}
+
+
+def fetch(names=None, urls=None, raw_dir=None, date=None, n_jobs=None, timeout=60):
+    """
+    Fetches the latest snapshot of each source.
+
+    names : sources to fetch (default all of urls)
+    urls : dict of source name -> URL (default `sources`), e.g. a local
+        server standing in for the upstream hosts
+    raw_dir : directory of the snapshots (default data/raw)
+    date : snapshot suffix (default today, as "%Y-%m-%d")
+    n_jobs : number of threads (default one per source)
+    timeout : seconds to wait on a connection or read
+
+    Returns
+    -------
+    DataFrame with a row per source: its name, status ('downloaded',
+    'not modified' when the server answered 304, 'unchanged' when the
+    download matched the latest snapshot, or 'failed'), snapshot path,
+    bytes transferred, seconds and error
+    """
+    urls = sources if urls is None else urls
+    names = list(urls) if names is None else names
+    raw_dir = data_loader.raw_dir if raw_dir is None else raw_dir
+    date = datetime.now().strftime(full_format) if date is None else date
+    n_jobs = len(names) if n_jobs is None else get_n_jobs(n_jobs)
+
+    with ThreadPoolExecutor(max(n_jobs, 1)) as pool:
+        rows = list(pool.map(
+            lambda name: _fetch_source(name, urls, raw_dir, date, timeout),
+            names,
+        ))
+
+    return pd.DataFrame(rows)
+
+def fetch_source(name, url, raw_dir=None, date=None, timeout=60):
+    """Fetches one source (see `fetch`), raising on errors."""
+    raw_dir = data_loader.raw_dir if raw_dir is None else raw_dir
+    date = datetime.now().strftime(full_format) if date is None else date
+    row = _fetch_source(name, {name: url}, raw_dir, date, timeout, raise_errors=True)
+
+    return row['status'], row['path']
+
+
+#################################
+# Utility Functions
+#################################
+def _fetch_source(name, urls, raw_dir, date, timeout, raise_errors=False):
+    """Fetches a source of urls, returning its result row."""
+    start = time.perf_counter()
+    row = {'name': name, 'status': None, 'path': None, 'bytes': 0, 'seconds': None, 'error': None}
+    try:
+        if name not in urls:
+            raise KeyError(f'unknown source {name!r}')
+        row.update(_download(name, urls[name], raw_dir, date, timeout))
+    except Exception as e:
+        if raise_errors:
+            raise
+        row.update(status='failed', error=f'{type(e).__name__}: {e}')
+    row['seconds'] = time.perf_counter() - start
+
+    return row
+
+def _download(name, url, raw_dir, date, timeout):
+    state_dir = raw_dir / '.fetch'
+    state_dir.mkdir(parents=True, exist_ok=True)
+    meta_path = state_dir / f'{name}.json'
+    part = state_dir / f'{name}.part'
+    meta = _read_meta(meta_path)
+    latest = raw_dir / meta['file'] if meta.get('file') else None
+    if latest is not None and not latest.exists():
+        latest = None
+
+    headers = {}
+    resume = part.exists() and part.stat().st_size > 0 and meta.get('part_validator')
+    if resume:
+        headers['Range'] = f'bytes={part.stat().st_size}-'
+        headers['If-Range'] = meta['part_validator']
+    elif latest is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        response = urlopen(Request(url, headers=headers), timeout=timeout)
+    except HTTPError as e:
+        if e.code == 304:
+            return {'status': 'not modified', 'path': latest}
+        if e.code == 416 and resume:
+            # The partial file is no prefix of the current file; restart
+            part.unlink()
+            return _download(name, url, raw_dir, date, timeout)
+        raise
+
+    with response:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        append = resume and response.status == 206
+        # Validator of the partial file, kept before any byte is written
+        meta['part_validator'] = etag or last_modified
+        _write_meta(meta_path, meta)
+        with open(part, 'ab' if append else 'wb') as f:
+            start = f.tell()
+            shutil.copyfileobj(response, f, 1 << 20)
+            n_bytes = f.tell() - start
+
+    sha1 = _sha1(part)
+    meta.update(etag=etag, last_modified=last_modified, part_validator=None)
+    if latest is not None and sha1 == meta.get('sha1'):
+        part.unlink()
+        _write_meta(meta_path, meta)
+        return {'status': 'unchanged', 'path': latest, 'bytes': n_bytes}
+
+    path = raw_dir / f'{name}_{date}.csv'
+    os.replace(part, path)
+    meta.update(sha1=sha1, file=path.name)
+    _write_meta(meta_path, meta)
+
+    return {'status': 'downloaded', 'path': path, 'bytes': n_bytes}
+
+def _read_meta(path):
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_meta(path, meta):
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, path)
+
+def _sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,105 @@
+"""
+Canonical county key.
+
+The registry (`data_loader.load_county_fips`) lists each county FIPS once,
+sorted, so the position of a county in it is a dense index 0..n-1. Each
+source is mapped to that index once with `county_index`, whatever the
+dtype of its FIPS (int, float with NaN, or zero-padded strings such as
+'06001'), after which joins between sources are array gathers through
+`row_lookup` rather than merges on a FIPS column.
+"""
+import numpy as np
+import pandas as pd
+import warnings
+
+# Alaska boroughs created or recoded after the codes of countyfipstool2019.csv
+added_fips = [2063, 2066, 2105, 2158, 2195, 2198, 2275]
+
+
+def build_registry(tool):
+    """
+    Registry from the rows of countyfipstool2019.csv, which lists each
+    county under several spellings: one row per county with its FIPS,
+    state and state abbreviation, sorted by FIPS.
+    """
+    tool = tool[tool['cfips'] < 999]
+    # State names are spelled in several casings (e.g. 'district of
+    # columbia' only); normalize to title case, as 'District of Columbia'
+    states = tool[['sfips', 'sname', 'sab']].astype({'sname':str, 'sab':str})
+    states['sname'] = states['sname'].str.strip().str.title().str.replace(' Of ', ' of ')
+    states = states.drop_duplicates('sfips').set_index('sfips')[['sname', 'sab']]
+    added = pd.DataFrame({'fips': added_fips, 'sfips': np.array(added_fips) // 1000})
+    registry = pd.concat([tool[['fips', 'sfips']], added]).drop_duplicates('fips')
+    registry = registry.join(states, on='sfips')[['fips', 'sname', 'sab']].sort_values('fips')
+    registry = registry.rename(columns={'fips':'FIPS', 'sname':'state', 'sab':'state_abbr'})
+
+    return registry.astype({'FIPS':'int32', 'state':'category'}).reset_index(drop=True)
+
+def parse_fips(values):
+    """
+    FIPS as integers from ints, floats or strings with or without leading
+    zeros. Returns (fips, invalid): fips is -1 where a value is missing or
+    not a number, and invalid marks the values that are present but not a
+    number (e.g. 'NOT AVAILABLE').
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        numbers = values.astype(float)
+    else:
+        numbers = pd.to_numeric(values.astype(str).str.strip(), errors='coerce')
+        numbers[values.isna().to_numpy()] = np.nan
+    invalid = (numbers.isna() & values.notna()).to_numpy()
+    fips = numbers.fillna(-1).to_numpy().astype(np.int64)
+
+    return fips, invalid
+
+def county_index(county_fips, values, source=None):
+    """
+    Dense county index of each of values in the registry FIPS county_fips,
+    -1 for values that are missing or not a county of the registry.
+    Warns, naming source, when values hold text that is not a FIPS.
+    """
+    fips, invalid = parse_fips(values)
+    if invalid.any():
+        examples = pd.unique(np.asarray(values, dtype=object)[invalid])[:3]
+        warnings.warn(
+            f"{invalid.sum()} {source or 'FIPS'} values are not FIPS numbers, "
+            f"e.g. {list(examples)}; their rows are left out"
+        )
+    county_fips = np.asarray(county_fips)
+    index = np.searchsorted(county_fips, fips)
+    index = np.minimum(index, len(county_fips) - 1)
+    found = county_fips[index] == fips
+
+    return np.where(found, index, -1)
+
+def row_lookup(index, n_counties):
+    """
+    Source row of each county from the county index of each source row:
+    lookup[i] is the (first) row of county i, -1 if the source lacks it.
+    An extra last entry is -1, so lookup[index] of another source is -1
+    for its rows with no county (-1) as well.
+    """
+    index = np.asarray(index)
+    rows = np.flatnonzero(index >= 0)
+    counties, first = np.unique(index[rows], return_index=True)
+    lookup = np.full(n_counties + 1, -1)
+    lookup[counties] = rows[first]
+
+    return lookup
+
+def join_counties(left, right, county_fips, on='FIPS', sources=(None, None)):
+    """
+    Inner join of two frames on their county, as a gather. Returns the
+    rows of left whose county is in right, in the order of left, with the
+    other columns of right taken from its (first) row of that county.
+
+    sources : names of left and right for warnings (see `county_index`)
+    """
+    lookup = row_lookup(county_index(county_fips, right[on], sources[1]), len(county_fips))
+    rows = lookup[county_index(county_fips, left[on], sources[0])]
+    keep = rows >= 0
+    joined = left[keep].reset_index(drop=True)
+    taken = right.drop(columns=on).iloc[rows[keep]].reset_index(drop=True)
+
+    return pd.concat([joined, taken], axis=1)
@@ -0,0 +1,162 @@
+"""
+Non-pharmaceutical interventions (NPIs) as county x policy arrays.
+
+Each policy source is read into one long frame with a row per policy
+record and the columns
+
+    FIPS : county FIPS, or state FIPS * 1000 for a state-wide record (as
+        in the interventions file, e.g. 6000 for California)
+    npi : policy name, as the source spells it
+    start, end : day ordinals (`date.toordinal`), <NA> if not given
+
+Dates stay integer day ordinals throughout. `policy_dates` spreads a long
+frame over the counties of the registry, with counties inheriting the
+state date of a policy they have no record of, and `days_since_npi` gives
+the days from each policy to each county's onset in one array operation.
+"""
+import numpy as np
+import pandas as pd
+
+from . import data_loader, schema
+from .fips import county_index
+from ..utils.dates import strs2ordinals
+
+# Ordinal of 1970-01-01, to turn datetime64 days into day ordinals
+_unix_ordinal = 719163
+
+
+def load_state_policies(path=None, statewide=True, mandate=False):
+    """
+    Reads the state distancing policies
+    (data/raw/USstatesCov19distancingpolicy_07_01.csv). start is the date
+    enacted and end the date ended.
+
+    statewide : keep only records applying to the whole state
+    mandate : keep only mandatory policies
+    """
+    path = data_loader.raw_dir / 'USstatesCov19distancingpolicy_07_01.csv' if path is None else path
+    policies = schema.read_csv(path, 'state_policies', encoding='latin-1')
+    if statewide:
+        policies = policies[policies['StateWide'] == 1]
+    if mandate:
+        policies = policies[policies['Mandate'] == 1]
+
+    return pd.DataFrame({
+        'FIPS': policies['StateFIPS'].astype('int32') * 1000,
+        'npi': policies['StatePolicy'].astype(str),
+        'start': _ordinals(pd.to_datetime(policies['DateEnacted'].astype(str), format='%Y%m%d', errors='coerce')),
+        'end': _ordinals(pd.to_datetime(policies['DateEnded'].astype(str), format='%Y%m%d', errors='coerce')),
+    }).reset_index(drop=True)
+
+def load_keystone_policies(path=None):
+    """
+    Reads the Keystone county and state NPIs
+    (data/raw/complete_npis_inherited_policies_keystone_06_26.csv), whose
+    state-wide records have the state FIPS alone.
+    """
+    path = data_loader.raw_dir / 'complete_npis_inherited_policies_keystone_06_26.csv' if path is None else path
+    policies = schema.read_csv(path, 'keystone_policies', encoding='latin-1')
+    fips = policies['fips'].to_numpy()
+
+    return pd.DataFrame({
+        'FIPS': np.where(fips < 100, fips * 1000, fips).astype('int32'),
+        'npi': policies['npi'].astype(str),
+        'start': _ordinals(pd.to_datetime(policies['start_date'], format='%m/%d/%Y', errors='coerce')),
+        'end': _ordinals(pd.to_datetime(policies['end_date'], format='%m/%d/%Y', errors='coerce')),
+    })
+
+def load_intervention_policies():
+    """
+    The latest interventions file (see `data_loader.load_interventions`)
+    as a long frame. Its dates are already day ordinals; it has no end
+    dates.
+    """
+    interventions, _ = data_loader.load_interventions(standardize_dates=False)
+    npis = interventions.columns[3:]
+    interventions = interventions.dropna(subset=['FIPS'])
+    dates = interventions[npis].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+
+    return pd.DataFrame({
+        'FIPS': np.repeat(interventions['FIPS'].to_numpy().astype('int32'), len(npis)),
+        'npi': np.tile(np.asarray(npis, dtype=object), len(interventions)),
+        'start': pd.array(dates.ravel(), dtype='Int32'),
+        'end': pd.array(np.full(dates.size, np.nan), dtype='Int32'),
+    })
+
+def policy_dates(policies, county_fips, npis=None, column='start'):
+    """
+    County x policy array of the dates in column of a long policy frame.
+
+    A county takes its own record of a policy if it has one and the
+    state-wide record otherwise. Of several records of a county or state,
+    the earliest date is kept.
+
+    policies : long frame of a `load_*_policies` loader
+    county_fips : counties of the rows, e.g. `load_county_fips()['FIPS']`
+    npis : policies of the columns (default all in policies, sorted)
+
+    Returns
+    -------
+    dates : (n_counties, n_npis) float array of day ordinals, NaN where
+        neither the county nor its state has the policy
+    npis : policy of each column
+    """
+    county_fips = np.asarray(county_fips)
+    npis = np.sort(policies['npi'].unique()) if npis is None else np.asarray(npis)
+    policies = policies.dropna(subset=[column])
+    cols = pd.Index(npis).get_indexer(policies['npi'])
+    fips = policies['FIPS'].to_numpy()
+    dates = policies[column].to_numpy(dtype=float)
+    keep = cols >= 0
+
+    # Earliest record per state and per county, with np.fmin.at
+    statewide = keep & (fips % 1000 == 0)
+    state_dates = np.full((100, len(npis)), np.nan)
+    np.fmin.at(state_dates, (fips[statewide] // 1000, cols[statewide]), dates[statewide])
+    rows = county_index(county_fips, fips)
+    local = keep & ~statewide & (rows >= 0)
+    county_dates = np.full((len(county_fips), len(npis)), np.nan)
+    np.fmin.at(county_dates, (rows[local], cols[local]), dates[local])
+
+    inherited = state_dates[county_fips // 1000]
+    dates = np.where(np.isnan(county_dates), inherited, county_dates)
+
+    return dates, npis
+
+def days_since_npi(policies, fips, onset, npis=None, column='start', onset_format='%m-%d', year=2020):
+    """
+    Days from each policy to the onset of each county, i.e. onset - date:
+    positive for policies put in place before onset, NaN where the county
+    has no date for the policy.
+
+    policies : long frame of a `load_*_policies` loader
+    fips : FIPS of each county, e.g. the FIPS column of
+        `get_cum_deaths_dataframe`
+    onset : onset date of each county, as strings in onset_format (taken
+        in year when the format has none) or as day ordinals
+    npis, column : see `policy_dates`
+
+    Returns a frame with the FIPS and a column per policy.
+    """
+    county_fips = np.unique(np.asarray(fips))
+    dates, npis = policy_dates(policies, county_fips, npis, column)
+    onset = np.asarray(onset)
+    if onset.dtype == object or onset.dtype.kind in 'US':
+        onset = strs2ordinals(onset, onset_format, year)
+    days = onset[:, None] - dates[np.searchsorted(county_fips, fips)]
+
+    features = pd.DataFrame(days, columns=npis)
+    features.insert(0, 'FIPS', np.asarray(fips))
+
+    return features
+
+
+#################################
+# Utility Functions
+#################################
+def _ordinals(dates):
+    """Day ordinals of a datetime series, <NA> where NaT."""
+    days = dates.to_numpy(dtype='datetime64[D]').astype(float)
+    days[dates.isna().to_numpy()] = np.nan
+
+    return pd.array(days + _unix_ordinal, dtype='Int32')
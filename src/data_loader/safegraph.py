@@ -0,0 +1,161 @@
+"""
+SafeGraph origin-destination trips as one memory-mapped cube.
+
+The daily "Number of trips" matrices (data/intermediates/Number of trips/
+YYYY_MM_DD.csv, origin FIPS rows x destination FIPS columns) are read
+once by `build_od_cube` into a day x origin x destination array on disk.
+County mobility over any window is then a reduction of that array.
+"""
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+from . import data_loader
+from ..utils.dates import str2day, strs2days, full_format
+
+trips_format = '%Y_%m_%d'
+
+
+def build_od_cube(trips_dir=None, cube_dir=None, dtype=np.float32):
+    """
+    Converts the daily trips matrices into a memory-mapped cube.
+
+    The day axis covers every day from the first file to the last; days
+    without a file, and counties absent from a day's file, are NaN. The
+    cube is written to cube_dir/trips.npy with its FIPS and day offsets
+    in cube_dir/index.npz.
+
+    Returns `load_od_cube(cube_dir)`.
+    """
+    trips_dir, cube_dir = _get_dirs(trips_dir, cube_dir)
+    files = {}
+    for f in sorted(trips_dir.glob('*.csv')):
+        try:
+            files[str2day(f.stem, trips_format)] = f
+        except ValueError:
+            continue
+    if not files:
+        raise FileNotFoundError(f'No YYYY_MM_DD.csv trips files in {trips_dir}')
+
+    # Every county of any day, read from the headers and index only
+    fips = set()
+    for f in files.values():
+        fips.update(pd.read_csv(f, nrows=0).columns[1:].astype(int))
+        fips.update(pd.read_csv(f, usecols=[0]).iloc[:, 0].astype(int))
+    fips = np.array(sorted(fips))
+    index = pd.Index(fips)
+    days = np.arange(min(files), max(files) + 1)
+
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    cube = np.lib.format.open_memmap(
+        cube_dir / 'trips.npy', mode='w+', dtype=dtype,
+        shape=(len(days), len(fips), len(fips)),
+    )
+    for t, day in enumerate(days):
+        cube[t] = np.nan
+        if day not in files:
+            continue
+        trips = pd.read_csv(files[day], index_col=0)
+        rows = index.get_indexer(trips.index.astype(int))
+        cols = index.get_indexer(trips.columns.astype(int))
+        cube[t][np.ix_(rows, cols)] = trips.to_numpy(dtype=dtype)
+    cube.flush()
+    del cube
+    np.savez(cube_dir / 'index.npz', fips=fips, days=days)
+
+    return load_od_cube(cube_dir)
+
+def load_od_cube(cube_dir=None):
+    """
+    Returns the read-only memory-mapped cube (days x origins x
+    destinations), its day offsets and its FIPS.
+    """
+    _, cube_dir = _get_dirs(None, cube_dir)
+    cube = np.load(cube_dir / 'trips.npy', mmap_mode='r')
+    with np.load(cube_dir / 'index.npz') as index:
+        days, fips = index['days'], index['fips']
+
+    return cube, days, fips
+
+def county_trips(cube, chunk_days=7):
+    """
+    Daily intra- and inter-county trips of every county, reduced from the
+    cube chunk_days days at a time.
+
+    Intra is the diagonal. Inter is, as in the SafeGraph notebooks, the
+    trips out of the county plus the trips into it, less the intra trips.
+
+    Returns (intra, inter), each (days, counties), NaN where the county is
+    missing that day.
+    """
+    n_days, n_counties, _ = cube.shape
+    intra = np.empty((n_days, n_counties))
+    inter = np.empty((n_days, n_counties))
+    for start in range(0, n_days, chunk_days):
+        block = np.asarray(cube[start:start + chunk_days], dtype=float)
+        diag = np.diagonal(block, axis1=1, axis2=2)
+        total = np.nansum(block, axis=2) + np.nansum(block, axis=1) - diag
+        intra[start:start + chunk_days] = diag
+        inter[start:start + chunk_days] = np.where(np.isnan(diag), np.nan, total)
+
+    return intra, inter
+
+def window_mean(series, days, cols, onset_days, start, stop):
+    """
+    Mean of each county's series over the days [onset + start, onset + stop).
+
+    series : (days, counties) daily values, e.g. from `county_trips`
+    days : day offsets of the series rows
+    cols : column of each county in series, -1 if absent
+    onset_days : day offset of each county's onset
+    start, stop : window bounds in days relative to onset
+
+    Missing days take the value of the last day before them, as the
+    notebooks did; days outside the series are skipped.
+    """
+    filled = pd.DataFrame(series).ffill().to_numpy()
+    rows = np.asarray(onset_days)[:, None] - days[0] + np.arange(start, stop)
+    cols = np.asarray(cols)
+    inside = (rows >= 0) & (rows < len(days)) & (cols[:, None] >= 0)
+    values = np.full(rows.shape, np.nan)
+    values[inside] = filled[rows[inside], np.broadcast_to(cols[:, None], rows.shape)[inside]]
+    counts = (~np.isnan(values)).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, np.nansum(values, axis=1) / counts, np.nan)
+
+def safegraph_mobility(onsets, windows=None, cube_dir=None):
+    """
+    Windowed intra- and inter-county mobility around each county's onset.
+
+    onsets : Series of onset dates ("%Y-%m-%d") indexed by FIPS, e.g. the
+        Outbreak_date column of pre_safegraph.csv
+    windows : dict of name -> (start, stop) days relative to onset,
+        default the two weeks before onset and the two weeks from onset
+
+    Returns a DataFrame indexed by FIPS with '{name} Intra-Mobility' and
+    '{name} Inter-Mobility' columns.
+    """
+    if windows is None:
+        windows = {'2wk Prior': (-14, 0), '2wk Onset': (0, 14)}
+    cube, days, fips = load_od_cube(cube_dir)
+    intra, inter = county_trips(cube)
+    cols = pd.Index(fips).get_indexer(onsets.index)
+    onset_days = strs2days(onsets.to_numpy(), full_format)
+
+    mobility = pd.DataFrame(index=onsets.index)
+    for name, (start, stop) in windows.items():
+        mobility[f'{name} Intra-Mobility'] = window_mean(intra, days, cols, onset_days, start, stop)
+        mobility[f'{name} Inter-Mobility'] = window_mean(inter, days, cols, onset_days, start, stop)
+
+    return mobility
+
+
+#################################
+# Utility Functions
+#################################
+def _get_dirs(trips_dir, cube_dir):
+    if trips_dir is None:
+        trips_dir = data_loader.data_dir / 'intermediates' / 'Number of trips'
+    if cube_dir is None:
+        cube_dir = data_loader.processed_dir / 'safegraph'
+    return Path(trips_dir), Path(cube_dir)
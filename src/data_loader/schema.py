@@ -0,0 +1,181 @@
+"""
+Column dtypes of each data source, applied while its CSV is parsed.
+
+Counts and FIPS are read as 32 bit integers, measurements as float32 and
+repeated text as categoricals, in place of pandas' int64/float64/object
+defaults. FIPS that can be missing (rows of cruise ships, states or the
+whole country) are nullable Int32 until the loader drops those rows.
+
+Date headers differ per snapshot, so each schema gives the dtype of its
+date columns with a pattern matching their headers; columns neither
+listed nor matching keep pandas' default.
+"""
+import pandas as pd
+import re
+
+from ..utils.profiling import profiled
+
+_jhu_columns = {
+    'UID': 'int32',
+    'iso2': 'category',
+    'iso3': 'category',
+    'code3': 'int16',
+    'FIPS': 'Int32',
+    'Admin2': 'category',
+    'Province_State': 'category',
+    'Country_Region': 'category',
+    'Lat': 'float32',
+    'Long_': 'float32',
+    'Combined_Key': str,
+    'Population': 'int32',
+}
+
+schemas = {
+    # JHU cumulative deaths and infections, dates as "%m/%d/%y"
+    'deaths': {
+        'columns': _jhu_columns,
+        'dates': (r'\d{1,2}/\d{1,2}/\d{2}', 'int32'),
+    },
+    'infections': {
+        'columns': _jhu_columns,
+        'dates': (r'\d{1,2}/\d{1,2}/\d{2}', 'int32'),
+    },
+    # Descartes Labs m50, dates as "%Y-%m-%d"
+    'm50': {
+        'columns': {
+            'country_code': 'category',
+            'admin_level': 'int8',
+            'admin1': 'category',
+            'admin2': 'category',
+            'fips': 'Int32',
+        },
+        'dates': (r'\d{4}-\d{2}-\d{2}', 'float32'),
+    },
+    # Google community mobility report, one row per region and date
+    'google_mobility': {
+        'columns': {
+            'country_region_code': 'category',
+            'country_region': 'category',
+            'sub_region_1': 'category',
+            'sub_region_2': 'category',
+            'metro_area': 'category',
+            'iso_3166_2_code': 'category',
+            'census_fips_code': 'Int32',
+            'place_id': str,
+            'date': str,
+            'retail_and_recreation_percent_change_from_baseline': 'float32',
+            'grocery_and_pharmacy_percent_change_from_baseline': 'float32',
+            'parks_percent_change_from_baseline': 'float32',
+            'transit_stations_percent_change_from_baseline': 'float32',
+            'workplaces_percent_change_from_baseline': 'float32',
+            'residential_percent_change_from_baseline': 'float32',
+        },
+    },
+    # Processed Google mobility, dates as "%m-%d"
+    'mobility_time_series': {
+        'columns': {'FIPS': 'int32', 'state': 'category', 'county': 'category'},
+        'dates': (r'\d{2}-\d{2}', 'float32'),
+    },
+    # SafeGraph OD trips per county, dates as "%m-%d", or "%Y-%m-%d" for
+    # files spanning more than a year
+    'od': {
+        'columns': {'FIPS': 'int32'},
+        'dates': (r'(\d{4}-)?\d{2}-\d{2}', 'float32'),
+    },
+    'od_baseline': {
+        'columns': {
+            'FIPS': 'int32',
+            'inter_movement': 'float32',
+            'in_movement': 'float32',
+            'out_movement': 'float32',
+        },
+    },
+    'counties': {
+        'columns': {'FIPS': 'int32'},
+    },
+    # HIFLD hospitals; COUNTYFIPS holds 'NOT AVAILABLE' and leading zeros
+    'hospitals': {
+        'columns': {
+            'TYPE': 'category',
+            'STATUS': 'category',
+            'COUNTYFIPS': str,
+            'BEDS': 'int32',
+        },
+    },
+    # Census county FIPS, one row per spelling of each county name
+    'fips_tool': {
+        'columns': {
+            'sname': 'category',
+            'sab': 'category',
+            'sid': 'float32',
+            'sfips': 'int8',
+            'cname': str,
+            'saint': 'int8',
+            'cfips': 'int32',
+            'fips': 'int32',
+        },
+    },
+    # State distancing policies, dates as %Y%m%d numbers
+    'state_policies': {
+        'columns': {
+            'location_id': 'int16',
+            'StateFIPS': 'int8',
+            'StatePostal': 'category',
+            'StateName': 'category',
+            'StatePolicy': 'category',
+            'Mandate': 'int8',
+            'StateWide': 'int8',
+            'DateIssued': 'Int32',
+            'DateEnacted': 'Int32',
+            'DateExpiry': 'Int32',
+            'DateEased': 'Int32',
+            'DateEnded': 'Int32',
+            'DateReexpanded1': 'Int32',
+            'LastUpdated': 'Int32',
+        },
+    },
+    # Keystone NPIs; state-wide records have the state FIPS
+    'keystone_policies': {
+        'columns': {
+            'fips': 'int32',
+            'county': 'category',
+            'state': 'category',
+            'npi': 'category',
+            'start_date': str,
+            'end_date': str,
+        },
+    },
+    'clustering': {
+        'columns': {'FIPS': 'int32', 'x': 'float32', 'y': 'float32', 'cluster': 'int16'},
+    },
+}
+
+def dtypes(source, columns):
+    """dtype of each of columns that the schema of source declares."""
+    schema = schemas[source]
+    pattern, date_dtype = schema.get('dates', (None, None))
+    types = {}
+    for c in columns:
+        if c in schema['columns']:
+            types[c] = schema['columns'][c]
+        elif pattern is not None and re.fullmatch(pattern, c):
+            types[c] = date_dtype
+
+    return types
+
+@profiled
+def read_csv(path, source, **kwargs):
+    """
+    `pd.read_csv` of path with the dtypes of source. Other arguments are
+    passed on; dtypes given in kwargs take precedence over the schema.
+    """
+    header = pd.read_csv(path, nrows=0, sep=kwargs.get('sep', ','),
+                         encoding=kwargs.get('encoding')).columns
+    types = dtypes(source, header)
+    types.update(kwargs.pop('dtype', {}))
+
+    return pd.read_csv(path, dtype=types, **kwargs)
+
+def astype(df, source):
+    """Casts the columns of df that source declares, e.g. after a concat."""
+    return df.astype(dtypes(source, df.columns))
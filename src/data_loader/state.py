@@ -0,0 +1,197 @@
+"""
+Derived county x day state behind `get_cum_deaths_dataframe`.
+
+A state is a dict of arrays built from one snapshot of a source. When the
+next snapshot only appends date columns, `extend_*` updates the state
+from the new columns alone; counties whose history was revised, and any
+change to the counties or the existing dates, fall back to a rebuild.
+
+Dates are those of a date-indexed series (see `df_utils.to_date_index`),
+kept in the state as full_format labels and days since the epoch, so a
+state may span several years.
+"""
+import numpy as np
+import pandas as pd
+import json
+import os
+
+from ..utils.dates import epoch, full_format
+from ..utils.rolling import rolling_mean
+from ..utils.profiling import profiled
+
+# Saved states of another version are rebuilt
+STATE_VERSION = 1
+
+@profiled
+def build_deaths_state(fips, dates, counts, onset_threshold):
+    """
+    Deaths state: the county x day counts, the onset of each county and
+    running counts of decreasing and defined day-to-day differences, from
+    which monotonicity over any window is a difference of two entries.
+
+    fips : (n,) county FIPS
+    dates : (T,) DatetimeIndex of consecutive days
+    counts : (n, T) cumulative deaths
+    onset_threshold : death threshold marking a county outbreak start
+    """
+    onset, onset_value = _get_onset(counts, onset_threshold)
+    decreases, defined = _count_diffs(counts)
+
+    return {
+        'fips': np.asarray(fips),
+        'dates': _labels(dates),
+        'days': _days(dates),
+        'counts': counts,
+        'onset_threshold': np.asarray(onset_threshold),
+        'onset': onset,
+        'onset_value': onset_value,
+        'decreases': decreases,
+        'defined': defined,
+    }
+
+@profiled
+def extend_deaths_state(state, fips, dates, counts, onset_threshold):
+    """Deaths state of a newer snapshot, updated from the appended dates."""
+    n_old = len(state['dates'])
+    if not _is_prefix(state, fips, dates) or state['onset_threshold'] != onset_threshold:
+        return build_deaths_state(fips, dates, counts, onset_threshold)
+
+    onset, onset_value = _get_onset(counts[:, n_old:], onset_threshold)
+    # Onset is the first smallest count at or above the threshold, so it
+    # only moves to a new date for a strictly smaller count
+    moved = onset_value < state['onset_value']
+    onset = np.where(moved, onset + n_old, state['onset'])
+    onset_value = np.where(moved, onset_value, state['onset_value'])
+    decreases, defined = _count_diffs(counts[:, n_old - 1:])
+
+    extended = {
+        **state,
+        'dates': _labels(dates),
+        'days': _days(dates),
+        'counts': counts,
+        'onset': onset,
+        'onset_value': onset_value,
+        'decreases': np.hstack((state['decreases'], state['decreases'][:, -1:] + decreases[:, 1:])),
+        'defined': np.hstack((state['defined'], state['defined'][:, -1:] + defined[:, 1:])),
+    }
+    # Counties with revised history are recomputed in full
+    revised = np.flatnonzero(_changed_rows(state['counts'], counts[:, :n_old]))
+    if len(revised):
+        rebuilt = build_deaths_state(fips[revised], dates, counts[revised], onset_threshold)
+        for key in ['onset', 'onset_value', 'decreases', 'defined']:
+            extended[key][revised] = rebuilt[key]
+
+    return extended
+
+@profiled
+def build_od_state(fips, dates, values, width=7):
+    """
+    OD mobility state: the county x day trips and their centered moving
+    average over width days, NaN where the window is incomplete.
+
+    fips : (n,) county FIPS
+    dates : (T,) DatetimeIndex of consecutive days
+    values : (n, T) trips
+    """
+    return {
+        'fips': np.asarray(fips),
+        'dates': _labels(dates),
+        'days': _days(dates),
+        'values': values,
+        'ma': _centered_mean(values, width),
+    }
+
+@profiled
+def extend_od_state(state, fips, dates, values, width=7):
+    """OD mobility state of a newer snapshot, updated at its last days."""
+    n_old = len(state['dates'])
+    if not _is_prefix(state, fips, dates):
+        return build_od_state(fips, dates, values, width)
+
+    # Only the last width // 2 old days gain a complete window, which
+    # reaches back another width // 2 days
+    half = width // 2
+    start = max(n_old - half, 0)
+    lo = max(start - half, 0)
+    tail = _centered_mean(values[:, lo:], width)
+    ma = np.hstack((state['ma'][:, :start], tail[:, start - lo:]))
+    revised = np.flatnonzero(_changed_rows(state['values'], values[:, :n_old]))
+    if len(revised):
+        ma[revised] = _centered_mean(values[revised], width)
+
+    return {**state, 'dates': _labels(dates), 'days': _days(dates), 'values': values, 'ma': ma}
+
+@profiled
+def save_state(path, state, source):
+    """Writes a state and the fingerprint of the snapshot it was built from."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp.npz')
+    np.savez(tmp, source=np.asarray(json.dumps(source, sort_keys=True)),
+             version=np.asarray(STATE_VERSION), **state)
+    os.replace(tmp, path)
+
+@profiled
+def load_state(path):
+    """
+    Reads a state and its source fingerprint, (None, None) if missing or
+    of another STATE_VERSION.
+    """
+    if not path.exists():
+        return None, None
+    with np.load(path) as f:
+        state = {k: f[k] for k in f.files}
+    if int(state.pop('version', 0)) != STATE_VERSION:
+        return None, None
+    source = json.loads(str(state.pop('source')))
+
+    return state, source
+
+
+#################################
+# Utility Functions
+#################################
+def _get_onset(counts, thresh):
+    """
+    Column index of the smallest count at or above thresh in each row
+    (first on ties), or -1 if there is none, and that count (inf if none).
+    """
+    above = counts >= thresh
+    masked = np.where(above, counts, np.inf)
+    if masked.shape[1] == 0:
+        return np.full(len(counts), -1), np.full(len(counts), np.inf)
+    onset = masked.argmin(axis=1)
+    onset_value = masked[np.arange(len(counts)), onset]
+    onset[~above.any(axis=1)] = -1
+
+    return onset, onset_value
+
+def _count_diffs(counts):
+    """Running counts of decreasing and of defined differences per row."""
+    diffs = np.diff(counts.astype(float), axis=1)
+    pad = np.zeros((len(counts), 1), dtype=int)
+    decreases = np.hstack((pad, np.cumsum(diffs < 0, axis=1)))
+    defined = np.hstack((pad, np.cumsum(~np.isnan(diffs), axis=1)))
+
+    return decreases, defined
+
+def _labels(dates):
+    return np.asarray(pd.DatetimeIndex(dates).strftime(full_format), dtype=str)
+
+def _days(dates):
+    return np.asarray((pd.DatetimeIndex(dates) - epoch).days, dtype=int)
+
+def _centered_mean(values, width):
+    return rolling_mean(values, width, center=True)
+
+def _is_prefix(state, fips, dates):
+    """Whether a snapshot has the same counties and extends the dates."""
+    n_old = len(state['dates'])
+    return (
+        np.array_equal(state['fips'], fips)
+        and len(dates) >= n_old
+        and np.array_equal(state['dates'], _labels(dates[:n_old]))
+    )
+
+def _changed_rows(old, new):
+    same = (old == new) | (pd.isna(old) & pd.isna(new))
+    return ~same.all(axis=1)
@@ -0,0 +1,212 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import NormalDist
+from pathlib import Path
+import functools
+import hashlib
+import json
+import os
+
+from ..utils.parallel import get_n_jobs, share_array, attach_array
+
+
+def bootstrap(fit, X, y, n_boot=1000, resample=None, seed=0, n_jobs=None,
+              checkpoint_dir=None, batch_size=100):
+    """
+    Bootstrap draws of model coefficients, fitted over a process pool.
+
+    Replicate r draws its data with its own generator, spawned from seed,
+    so draws do not depend on n_jobs or on the order replicates finish in.
+    X and y are placed in shared memory once rather than copied to each
+    task. With checkpoint_dir, each batch of draws is written to disk as
+    it completes and batches already on disk are skipped, so an
+    interrupted run resumes where it stopped. The checkpoint records the
+    replicates, a hash of X and y and the fit and resample methods, and is
+    only resumed by the same run.
+
+    fit : method (X, y) -> 1d array of coefficients
+    X,y : design matrix and target arrays
+    n_boot : number of replicates
+    resample : method (rng, X, y) -> (X, y) drawing one replicate,
+        `resample_rows` (case resampling) by default. For a parametric
+        bootstrap use e.g. `functools.partial(simulate_gamma, mu=..., shape=...)`
+    seed : seed of the replicate generators
+    n_jobs : number of processes, -1 for all CPUs
+    checkpoint_dir : directory to stream draws to and resume from
+    batch_size : replicates per task and per checkpoint file
+
+    fit and resample must be picklable, i.e. module level functions or
+    functools.partial objects of them, when n_jobs > 1.
+
+    Returns
+    -------
+    (n_boot, n_coefficients) array of draws
+    """
+    if n_boot < 1:
+        raise ValueError(f'n_boot must be at least 1, not {n_boot}')
+    resample = resample_rows if resample is None else resample
+    seeds = np.random.SeedSequence(seed).spawn(n_boot)
+    batches = [
+        (b, seeds[start:start + batch_size])
+        for b, start in enumerate(range(0, n_boot, batch_size))
+    ]
+    if checkpoint_dir is not None:
+        checkpoint_dir = Path(checkpoint_dir)
+        _check_checkpoint(checkpoint_dir, {
+            'n_boot': n_boot,
+            'seed': seed,
+            'batch_size': batch_size,
+            'data': _digest([X, y]),
+            'fit': _describe(fit),
+            'resample': _describe(resample),
+        })
+    draws = {}
+    todo = []
+    for b, batch_seeds in batches:
+        path = _batch_path(checkpoint_dir, b)
+        if path is not None and path.exists():
+            draws[b] = np.load(path)
+        else:
+            todo.append((b, batch_seeds))
+
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        _state.update(fit=fit, resample=resample, X=X, y=y,
+                      checkpoint_dir=checkpoint_dir)
+        for b, batch_seeds in todo:
+            draws[b] = _run_batch(b, batch_seeds)
+        _state.clear()
+    else:
+        X_shm, X_spec = share_array(X)
+        y_shm, y_spec = share_array(y)
+        try:
+            with ProcessPoolExecutor(
+                n_jobs,
+                initializer=_init_worker,
+                initargs=(fit, resample, X_spec, y_spec, checkpoint_dir),
+            ) as pool:
+                futures = {
+                    pool.submit(_run_batch, b, batch_seeds): b
+                    for b, batch_seeds in todo
+                }
+                for future in as_completed(futures):
+                    draws[futures[future]] = future.result()
+        finally:
+            for shm in (X_shm, y_shm):
+                shm.close()
+                shm.unlink()
+
+    return np.vstack([draws[b] for b, _ in batches])
+
+def resample_rows(rng, X, y):
+    """Case resampling: rows of X and y drawn with replacement."""
+    rows = rng.integers(0, len(y), len(y))
+    return X[rows], y[rows]
+
+def simulate_gamma(rng, X, y, mu, shape):
+    """
+    Parametric resampling for a gamma model: responses drawn around the
+    fitted means mu with the fitted shape (1 / scale), X unchanged.
+    """
+    return X, rng.gamma(shape, np.asarray(mu) / shape)
+
+def bootstrap_ci(draws, estimate=None, alpha=0.05):
+    """
+    Bootstrap confidence intervals per coefficient.
+
+    draws : (n_boot, n_coefficients) draws from `bootstrap`
+    estimate : coefficients fitted on the full data; if given, intervals
+        are bias-corrected percentile intervals, else plain percentile ones
+    alpha : 1 - confidence level
+
+    Returns (lower, upper) arrays.
+    """
+    draws = np.asarray(draws)
+    normal = NormalDist()
+    z = normal.inv_cdf(1 - alpha / 2)
+    if estimate is None:
+        q = np.tile([alpha / 2, 1 - alpha / 2], (draws.shape[1], 1))
+    else:
+        below = np.mean(draws < np.asarray(estimate), axis=0)
+        below = np.clip(below, 1 / (len(draws) + 1), len(draws) / (len(draws) + 1))
+        z0 = np.array([normal.inv_cdf(p) for p in below])
+        q = np.array([
+            [normal.cdf(2 * z_ - z), normal.cdf(2 * z_ + z)] for z_ in z0
+        ])
+    lower = np.array([np.quantile(draws[:, j], q[j, 0]) for j in range(draws.shape[1])])
+    upper = np.array([np.quantile(draws[:, j], q[j, 1]) for j in range(draws.shape[1])])
+
+    return lower, upper
+
+
+#################################
+# Utility Functions
+#################################
+_state = {}
+
+def _init_worker(fit, resample, X_spec, y_spec, checkpoint_dir):
+    X_shm, X = attach_array(X_spec)
+    y_shm, y = attach_array(y_spec)
+    _state.update(fit=fit, resample=resample, X=X, y=y, shms=(X_shm, y_shm),
+                  checkpoint_dir=checkpoint_dir)
+
+def _run_batch(b, seeds):
+    fit, resample = _state['fit'], _state['resample']
+    draws = np.vstack([
+        np.asarray(fit(*resample(np.random.default_rng(s), _state['X'], _state['y'])),
+                   dtype=float)
+        for s in seeds
+    ])
+    path = _batch_path(_state['checkpoint_dir'], b)
+    if path is not None:
+        tmp = path.with_suffix('.tmp.npy')
+        np.save(tmp, draws)
+        os.replace(tmp, path)
+
+    return draws
+
+def _batch_path(checkpoint_dir, b):
+    if checkpoint_dir is None:
+        return None
+    return checkpoint_dir / f'draws_{b:05d}.npy'
+
+def _check_checkpoint(checkpoint_dir, settings):
+    """
+    Records the run settings, refusing to resume a different run: other
+    replicates, data, fit or resample method.
+    """
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    path = checkpoint_dir / 'settings.json'
+    if path.exists():
+        with open(path) as f:
+            saved = json.load(f)
+        if saved != settings:
+            raise ValueError(
+                f'{checkpoint_dir} holds draws of a run with {saved}, '
+                f'not {settings}'
+            )
+    else:
+        with open(path, 'w') as f:
+            json.dump(settings, f)
+
+def _describe(method):
+    """Qualified name of a method, with the arguments of a partial."""
+    if isinstance(method, functools.partial):
+        return {
+            'func': _describe(method.func),
+            'args': _digest(list(method.args)),
+            'keywords': {k: _digest(v) for k, v in sorted(method.keywords.items())},
+        }
+    return f"{getattr(method, '__module__', None)}.{getattr(method, '__qualname__', type(method).__qualname__)}"
+
+def _digest(value):
+    """Short SHA-1 of arrays (by content) and other values (by repr)."""
+    digest = hashlib.sha1()
+    for v in value if isinstance(value, list) else [value]:
+        if isinstance(v, np.ndarray) or hasattr(v, '__array__'):
+            v = np.ascontiguousarray(v)
+            digest.update(f'{v.dtype.str}{v.shape}'.encode())
+            digest.update(repr(v.tolist()).encode() if v.dtype == object else v.tobytes())
+        else:
+            digest.update(repr(v).encode())
+    return digest.hexdigest()[:16]
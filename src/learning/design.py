@@ -0,0 +1,62 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def lag_design(series, n_lags, n_days=None, static=None, sparse=False):
+    """
+    Builds the (county, day) x lag design matrix of a distributed lag model
+    from a county x date array.
+
+    Row (c, d) holds series[c, d:d+n_lags], so lag column m is
+    series[c, d+m], preceded by the static features of county c. Rows are
+    ordered day by day, all counties for day 0 first; see `lag_index` for
+    the county and day of each row.
+
+    series : (n_counties, n_dates) array, e.g. mobility
+    n_lags : number of lagged values per row
+    n_days : number of days per county (default all full windows)
+    static : (n_counties, n_static) county features, broadcast to each day
+    sparse : return a scipy.sparse CSR matrix instead of an ndarray
+
+    Returns
+    -------
+    (n_days * n_counties, n_static + n_lags) matrix
+    """
+    series = np.asarray(series)
+    n_counties, n_dates = series.shape
+    if n_days is None:
+        n_days = n_dates - n_lags + 1
+    if n_days + n_lags - 1 > n_dates:
+        raise ValueError(
+            f'{n_days} days of {n_lags} lags need {n_days + n_lags - 1} '
+            f'dates, series has {n_dates}'
+        )
+    static = np.empty((n_counties, 0)) if static is None else np.asarray(static)
+    if static.ndim == 1:
+        static = static[:, None]
+    n_static = static.shape[1]
+
+    # (n_counties, n_days, n_lags) view, copied once into the output
+    windows = sliding_window_view(series, n_lags, axis=1)[:, :n_days]
+    design = np.empty(
+        (n_days, n_counties, n_static + n_lags),
+        dtype=np.result_type(series, static),
+    )
+    design[:, :, :n_static] = static
+    design[:, :, n_static:] = windows.transpose(1, 0, 2)
+    design = design.reshape(n_days * n_counties, n_static + n_lags)
+
+    if sparse:
+        from scipy.sparse import csr_matrix
+        return csr_matrix(design)
+    return design
+
+def lag_index(n_counties, n_days):
+    """
+    County and day of each row of `lag_design`, for gathering targets and
+    ids, e.g. `deaths[county, day]` or `fips[county]`.
+    """
+    county = np.tile(np.arange(n_counties), n_days)
+    day = np.repeat(np.arange(n_days), n_counties)
+
+    return county, day
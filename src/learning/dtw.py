@@ -0,0 +1,186 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+
+from ..utils.parallel import get_n_jobs
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Runs the kernels as plain python when numba is not installed."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+
+def dtw_distance(s1, s2, w=7, max_dist=np.inf):
+    """
+    Dynamic time warping distance within a Sakoe-Chiba band.
+
+    Negative values are treated as padding and dropped, and the band is
+    widened to the difference in series lengths, as in `DTWDistance`.
+
+    s1,s2 : 1d arrays
+    w : band width
+    max_dist : return inf for distances above this, abandoning the
+        computation as soon as the bound is crossed
+    """
+    s1, s2 = _strip(s1), _strip(s2)
+
+    return _dtw(s1, s2, w, max_dist**2)
+
+def lb_keogh(s1, s2, w=7):
+    """
+    LB_Keogh lower bound of `dtw_distance(s1, s2, w)`, from the envelope of
+    s2 over the band of each point of s1.
+    """
+    s1, s2 = _strip(s1), _strip(s2)
+    L, U = _envelope(s2, max(w, abs(len(s1) - len(s2))), len(s1))
+
+    return _lb_keogh(s1, L, U, np.inf)
+
+def pairwise_dtw(matrix, window=7, n_jobs=None, max_dist=None):
+    """
+    Condensed DTW distance matrix between the rows of matrix.
+
+    Entries are ordered as in `scipy.spatial.distance.pdist`, with
+    `dtw_distance(matrix[i], matrix[j], window)` for i < j, which is the
+    upper triangle `sklearn.metrics.pairwise_distances` computes with
+    `metric=DTWDistance`. Use `scipy.spatial.distance.squareform` for the
+    square matrix.
+
+    matrix : 2d array of series, padded with negative values
+    window : band width
+    n_jobs : number of processes, -1 for all CPUs
+    max_dist : if given, pairs farther apart are set to inf, skipping
+        them early by LB_Keogh (series of equal length) or abandoning DTW
+    """
+    values, offsets, lower, upper = _pack(matrix, window)
+    n = len(offsets) - 1
+    max_sq = np.inf if max_dist is None else max_dist**2
+    args = (values, offsets, lower, upper, window, max_sq)
+
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        rows = [_dtw_row(i, *args) for i in range(n - 1)]
+    else:
+        with ProcessPoolExecutor(
+                n_jobs, initializer=_init_worker, initargs=args) as pool:
+            rows = list(pool.map(
+                _worker_row, range(n - 1),
+                chunksize=max(1, (n - 1) // (8 * n_jobs))
+            ))
+
+    return np.concatenate(rows) if rows else np.zeros(0)
+
+
+#################################
+# Utility Functions
+#################################
+def _strip(s):
+    s = np.asarray(s, dtype=float)
+    return s[s >= 0]
+
+def _envelope(s, w, n):
+    """
+    Lower and upper envelope of s over the band [i-w, i+w) of each of the
+    n points of the other series, inf/-inf where the band is empty.
+    """
+    if w == 0:
+        return np.full(n, np.inf), np.full(n, -np.inf)
+    pad = max(n + w - len(s), 0)
+    windows = np.arange(n)
+    lower = sliding_window_view(
+        np.concatenate((np.full(w, np.inf), s, np.full(pad, np.inf))), 2*w
+        )[windows].min(axis=1)
+    upper = sliding_window_view(
+        np.concatenate((np.full(w, -np.inf), s, np.full(pad, -np.inf))), 2*w
+        )[windows].max(axis=1)
+
+    return lower, upper
+
+def _pack(matrix, w):
+    """Flattens the stripped rows and their envelopes for the kernels."""
+    rows = [_strip(r) for r in matrix]
+    offsets = np.concatenate(([0], np.cumsum([len(r) for r in rows])))
+    envelopes = [_envelope(r, w, len(r)) for r in rows]
+    values = np.concatenate(rows) if rows else np.zeros(0)
+    lower = np.concatenate([e[0] for e in envelopes]) if rows else np.zeros(0)
+    upper = np.concatenate([e[1] for e in envelopes]) if rows else np.zeros(0)
+
+    return values, offsets, lower, upper
+
+@njit(cache=True)
+def _dtw(s1, s2, w, max_sq):
+    """DTW over a two-row rolling buffer restricted to the band."""
+    n, m = len(s1), len(s2)
+    w = max(w, abs(n - m))
+    # Buffer index j+1 holds column j, index 0 is the j=-1 border
+    prev = np.full(m + 1, np.inf)
+    cur = np.full(m + 1, np.inf)
+    prev[0] = 0.0
+    # Filled cells of the rows held in prev and cur
+    prev_lo, prev_hi = 0, 1
+    cur_lo, cur_hi = 0, 0
+    for i in range(n):
+        for j in range(cur_lo, cur_hi):
+            cur[j] = np.inf
+        start = max(0, i - w)
+        stop = min(m, i + w)
+        row_min = np.inf
+        for j in range(start, stop):
+            cost = min(prev[j + 1], cur[j], prev[j]) + (s1[i] - s2[j])**2
+            cur[j + 1] = cost
+            row_min = min(row_min, cost)
+        if row_min > max_sq:
+            return np.inf
+        prev, cur = cur, prev
+        cur_lo, cur_hi = prev_lo, prev_hi
+        prev_lo, prev_hi = start + 1, stop + 1
+    if prev[m] > max_sq:
+        return np.inf
+
+    return np.sqrt(prev[m])
+
+@njit(cache=True)
+def _lb_keogh(s, lower, upper, max_sq):
+    total = 0.0
+    for i in range(len(s)):
+        if s[i] > upper[i]:
+            total += (s[i] - upper[i])**2
+        elif s[i] < lower[i]:
+            total += (s[i] - lower[i])**2
+        if total > max_sq:
+            break
+
+    return np.sqrt(total)
+
+@njit(cache=True)
+def _dtw_row(i, values, offsets, lower, upper, w, max_sq):
+    """Distances from row i to every row j > i."""
+    n = len(offsets) - 1
+    s1 = values[offsets[i]:offsets[i + 1]]
+    out = np.empty(n - i - 1)
+    for j in range(i + 1, n):
+        s2 = values[offsets[j]:offsets[j + 1]]
+        if max_sq < np.inf and len(s1) == len(s2):
+            lb = _lb_keogh(
+                s1, lower[offsets[j]:offsets[j + 1]],
+                upper[offsets[j]:offsets[j + 1]], max_sq
+            )
+            if lb**2 > max_sq:
+                out[j - i - 1] = np.inf
+                continue
+        out[j - i - 1] = _dtw(s1, s2, w, max_sq)
+
+    return out
+
+_shared = None
+
+def _init_worker(*args):
+    global _shared
+    _shared = args
+
+def _worker_row(i):
+    return _dtw_row(i, *_shared)
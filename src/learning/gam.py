@@ -0,0 +1,320 @@
+"""
+Smoothing parameter (lambda) search for Gamma GAMs with a log link, as the
+pygam GammaGAM of notebooks/25-rp-study_replication.
+
+A GAM is a penalized GLM on a basis expansion B of X, with one penalty
+matrix S_j per smoothing parameter: the fit for lambdas lam minimizes
+deviance + b' (sum_j lam_j S_j) b. With a log link the Gamma working
+weights are all 1, so B' B is the same for every candidate and every
+iteration; it is computed once along with B, and each candidate only
+solves against B' B + P.
+
+`lam_search` evaluates candidates over a process pool with B, y, B' B and
+the S_j in shared memory. Each fit starts from the coefficients of the
+nearest (in log lambda) candidate already fit, and candidates whose
+GCV/UBRE cannot beat the best found so far are pruned before they are fit.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.linalg import cho_factor, cho_solve
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import copy
+import time
+
+from ..utils.parallel import get_n_jobs, share_array, attach_array
+
+# Ridge added to every penalty, as pygam does, so B' B + P is invertible
+_ridge = np.sqrt(np.finfo(float).eps)
+
+
+def gam_basis(gam, X):
+    """
+    Basis expansion of X and penalty matrices of a pygam model, e.g. the
+    GammaGAM of notebook 25, for `lam_search`. The model is prepared as
+    `gam.fit` does, on a copy, and is left unchanged. pygam is imported
+    with the model, it is not needed otherwise.
+
+    Returns
+    -------
+    basis : (n_samples, n_coefs) sparse model matrix, intercept included
+    penalties : (n_lams, n_coefs, n_coefs) array, the penalty of each
+        smoothing parameter at lam = 1, in the order of the flattened
+        `gam.lam` (terms in order, a lambda per marginal for te terms)
+    """
+    from pygam.utils import check_X
+
+    gam = copy.deepcopy(gam)
+    gam._validate_params()
+    X = check_X(X, verbose=gam.verbose)
+    gam._validate_data_dep_params(X)
+    basis = sp.csc_matrix(gam.terms.build_columns(X))
+    n_coefs = basis.shape[1]
+
+    penalties = []
+    for i, term in enumerate(gam.terms):
+        if term.isintercept:
+            continue
+        cols = gam.terms.get_coef_indices(i)
+        lam = term.lam
+        n_lams = len(_flatten(lam))
+        for j in range(n_lams):
+            term.lam = _unflatten(np.eye(n_lams)[j].tolist(), lam)
+            penalty = np.zeros((n_coefs, n_coefs))
+            penalty[np.ix_(cols, cols)] = sp.csc_matrix(term.build_penalties()).toarray()
+            penalties.append(penalty)
+        term.lam = lam
+
+    return basis, np.array(penalties)
+
+def lam_search(basis, y, penalties, lams, objective='GCV', gamma=1.4, scale=1.0,
+               prune=True, n_jobs=None, max_iter=100, tol=1e-4):
+    """
+    Fits a Gamma GAM (log link) for each candidate vector of smoothing
+    parameters, as pygam's `gridsearch(X, y, lam=lams)` does serially.
+
+    basis : (n_samples, n_coefs) model matrix, dense or sparse (see
+        `gam_basis`)
+    y : positive target
+    penalties : (n_lams, n_coefs, n_coefs) penalty of each lambda at 1
+    lams : (n_candidates, n_lams) candidate lambdas
+    objective : 'GCV' (unknown scale, pygam's choice for GammaGAM) or
+        'UBRE' (known scale)
+    gamma : inflation of the effective degrees of freedom, pygam's 1.4
+    scale : known scale of UBRE
+    prune : skip candidates whose objective is bound to exceed the best
+        one found so far. The bound takes the deviance of the least
+        penalized fit, so the best candidate is never pruned; which
+        others are depends on the order fits complete in. Candidates
+        whose GCV is undefined (gamma * edf >= n) are 'failed', not
+        pruned.
+    n_jobs : number of processes, -1 for all CPUs
+    max_iter, tol : PIRLS iterations and tolerance on the relative
+        change of the coefficients, as in pygam
+
+    Returns
+    -------
+    results : DataFrame with a row per candidate: its lambdas (lam), the
+        objective, deviance, effective degrees of freedom (edf), PIRLS
+        iterations, the candidate it was warm started from (-1 for none),
+        status ('fit', 'pruned' or 'failed') and seconds
+    coef : coefficients of the best candidate
+    """
+    y = np.asarray(y, dtype=float)
+    lams = np.atleast_2d(np.asarray(lams, dtype=float))
+    penalties = np.asarray(penalties, dtype=float)
+    if lams.size == 0:
+        raise ValueError('lams holds no candidates')
+    if lams.shape[1] != len(penalties):
+        raise ValueError(f'candidates have {lams.shape[1]} lambdas, there are {len(penalties)} penalties')
+    if objective not in ('GCV', 'UBRE'):
+        raise ValueError(f"objective must be 'GCV' or 'UBRE', not {objective!r}")
+    basis = basis.tocsc() if sp.issparse(basis) else np.asarray(basis, dtype=float)
+    gram = basis.T @ basis
+    gram = gram.toarray() if sp.issparse(gram) else np.asarray(gram)
+    settings = dict(objective=objective, gamma=gamma, scale=scale, max_iter=max_iter, tol=tol)
+    # The least penalized fit bounds the deviance of every candidate
+    d_min = _deviance(y, np.exp(basis @ _pirls(basis, y, gram, np.zeros_like(gram), None, max_iter, tol)[0])) if prune else None
+
+    n_jobs = get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        run = lambda lam, coef, bound: _fit(basis, y, gram, penalties, lam, coef, bound, **settings)
+        return _search(lams, objective, d_min, run=run)
+
+    arrays = {'gram': gram, 'penalties': penalties, 'y': y}
+    if sp.issparse(basis):
+        arrays.update(data=basis.data, indices=basis.indices, indptr=basis.indptr)
+    else:
+        arrays['basis'] = basis
+    shms = []
+    specs = {}
+    try:
+        for key, array in arrays.items():
+            shm, specs[key] = share_array(array)
+            shms.append(shm)
+        with ProcessPoolExecutor(
+            n_jobs,
+            initializer=_init_worker,
+            initargs=(specs, basis.shape, settings),
+        ) as pool:
+            return _search(lams, objective, d_min, pool=pool, n_jobs=n_jobs)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+#################################
+# Utility Functions
+#################################
+_state = {}
+
+def _init_worker(specs, shape, settings):
+    shms = []
+    arrays = {}
+    for key, spec in specs.items():
+        shm, arrays[key] = attach_array(spec)
+        shms.append(shm)
+    if 'basis' in arrays:
+        basis = arrays['basis']
+    else:
+        basis = sp.csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape)
+    _state.update(basis=basis, y=arrays['y'], gram=arrays['gram'],
+                  penalties=arrays['penalties'], settings=settings, shms=shms)
+
+def _run_candidate(lam, coef, bound):
+    return _fit(_state['basis'], _state['y'], _state['gram'], _state['penalties'],
+                lam, coef, bound, **_state['settings'])
+
+def _search(lams, objective, d_min, run=None, pool=None, n_jobs=1):
+    """
+    Evaluates the candidates along a nearest neighbour tour, in process
+    with run or over pool with n_jobs of them in flight, each warm started
+    from the nearest candidate fit so far and pruned against the best
+    objective so far.
+    """
+    log_lams = np.log(np.maximum(lams, _ridge))
+    todo = _tour(log_lams)
+    rows = {}
+    coefs = {}
+    best = [np.inf, None]
+
+    def args(i):
+        fitted = list(coefs)
+        warm = -1
+        if fitted:
+            warm = fitted[np.argmin(np.sum((log_lams[fitted] - log_lams[i])**2, axis=1))]
+        bound = None if d_min is None else (d_min, best[0])
+        return (lams[i], coefs.get(warm), bound), warm
+
+    def collect(i, warm, result):
+        coef, row = result
+        rows[i] = {'candidate': i, 'lam': lams[i], **row, 'warm_start': warm}
+        if row['status'] == 'fit':
+            coefs[i] = coef
+            if row[objective] < best[0]:
+                best[:] = [row[objective], i]
+
+    if pool is None:
+        for i in todo:
+            task, warm = args(i)
+            collect(i, warm, run(*task))
+    else:
+        running = {}
+        while todo or running:
+            while todo and len(running) < n_jobs:
+                i = todo.pop(0)
+                task, warm = args(i)
+                running[pool.submit(_run_candidate, *task)] = (i, warm)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, warm = running.pop(future)
+                collect(i, warm, future.result())
+
+    results = pd.DataFrame([rows[i] for i in range(len(lams))])
+
+    return results, coefs.get(best[1])
+
+def _tour(points):
+    """Greedy nearest neighbour order of points, from the one nearest their mean."""
+    remaining = list(range(len(points)))
+    current = remaining.pop(int(np.argmin(np.sum((points - points.mean(axis=0))**2, axis=1))))
+    order = [current]
+    while remaining:
+        d = np.sum((points[remaining] - points[current])**2, axis=1)
+        current = remaining.pop(int(np.argmin(d)))
+        order.append(current)
+    return order
+
+def _fit(basis, y, gram, penalties, lam, coef, bound, objective, gamma, scale, max_iter, tol):
+    """
+    Fits one candidate, returning its coefficients and result row. With
+    bound (least penalized deviance, best objective) the candidate is
+    pruned when even that deviance would not beat the best objective.
+    """
+    start = time.perf_counter()
+    n = len(y)
+    row = {objective: np.nan, 'deviance': np.nan, 'edf': np.nan, 'n_iter': 0, 'status': None}
+    try:
+        penalty = np.tensordot(lam, penalties, axes=1)
+        factor = cho_factor(gram + penalty + _ridge * np.eye(len(gram)))
+        # Weights are 1, so the hat matrix and edf do not depend on the fit
+        row['edf'] = np.trace(cho_solve(factor, gram))
+        if not np.isfinite(_objective(objective, 0, row['edf'], n, gamma, scale)):
+            # GCV is undefined once gamma * edf reaches n
+            raise ValueError(f'{gamma} * {row["edf"]:.1f} effective degrees of freedom exceed {n} samples')
+        # Only a finite best objective can rule a candidate out
+        if bound is not None and np.isfinite(bound[1]) and \
+                _objective(objective, bound[0], row['edf'], n, gamma, scale) >= bound[1]:
+            row.update(status='pruned', seconds=time.perf_counter() - start)
+            return None, row
+        coef, row['n_iter'] = _pirls(basis, y, factor, penalty, coef, max_iter, tol)
+        row['deviance'] = _deviance(y, np.exp(basis @ coef))
+        row[objective] = _objective(objective, row['deviance'], row['edf'], n, gamma, scale)
+        if not np.isfinite(row[objective]):
+            raise ValueError(f'{objective} is not finite')
+        row['status'] = 'fit'
+    except (np.linalg.LinAlgError, FloatingPointError, ValueError):
+        coef = None
+        row['status'] = 'failed'
+    row['seconds'] = time.perf_counter() - start
+
+    return coef, row
+
+def _pirls(basis, y, gram, penalty, coef, max_iter, tol):
+    """
+    Penalized iteratively reweighted least squares of a Gamma GLM with a
+    log link, from coef (or a least squares fit of log y). gram is B' B,
+    or its Cholesky factor with the penalty already added; penalty is
+    sum_j lam_j S_j. Steps are halved until the penalized deviance drops.
+
+    Returns the coefficients and the number of iterations.
+    """
+    if not isinstance(gram, tuple):
+        gram = cho_factor(gram + penalty + _ridge * np.eye(len(gram)))
+    penalized = lambda b, eta: _deviance(y, np.exp(eta)) + b @ penalty @ b
+    if coef is None:
+        coef = cho_solve(gram, basis.T @ np.log(y))
+    eta = basis @ coef
+    loss = penalized(coef, eta)
+    for n_iter in range(1, max_iter + 1):
+        mu = np.exp(eta)
+        step = cho_solve(gram, basis.T @ (eta + (y - mu) / mu)) - coef
+        for _ in range(30):
+            new = coef + step
+            new_eta = basis @ new
+            new_loss = penalized(new, new_eta)
+            if np.isfinite(new_loss) and new_loss <= loss * (1 + 1e-12):
+                break
+            step /= 2
+        change = np.linalg.norm(new - coef) / max(np.linalg.norm(coef), _ridge)
+        coef, eta, loss = new, new_eta, new_loss
+        if change < tol:
+            break
+
+    return coef, n_iter
+
+def _objective(objective, deviance, edf, n, gamma, scale):
+    """pygam's GCV (unknown scale) or UBRE (known scale)."""
+    if objective == 'GCV':
+        if n - gamma * edf <= 0:
+            return np.inf
+        return n * deviance / (n - gamma * edf)**2
+    return deviance / n - scale + 2 * gamma * edf * scale / n
+
+def _deviance(y, mu):
+    return 2 * np.sum((y - mu) / mu - np.log(y / mu))
+
+def _flatten(lam):
+    if isinstance(lam, (list, tuple, np.ndarray)):
+        return [v for item in lam for v in _flatten(item)]
+    return [lam]
+
+def _unflatten(values, like):
+    """values, a flat list, nested like like."""
+    values = list(values)
+    def rebuild(item):
+        if isinstance(item, (list, tuple, np.ndarray)):
+            return [rebuild(i) for i in item]
+        return values.pop(0)
+    return rebuild(like)
@@ -1,20 +1,9 @@
 import numpy as np
+from .dtw import dtw_distance
 
 def DTWDistance(s1, s2,w=7):
-    s1 = s1[s1 >= 0]
-    s2 = s2[s2 >= 0]
-    DTW={}
-    
-    w = max(w, abs(len(s1)-len(s2)))
-    
-    for i in range(-1,len(s1)):
-        for j in range(-1,len(s2)):
-            DTW[(i, j)] = float('inf')
-    DTW[(-1, -1)] = 0
-  
-    for i in range(len(s1)):
-        for j in range(max(0, i-w), min(len(s2), i+w)):
-            dist= (s1[i]-s2[j])**2
-            DTW[(i, j)] = dist + min(DTW[(i-1, j)],DTW[(i, j-1)], DTW[(i-1, j-1)])
-		
-    return np.sqrt(DTW[len(s1)-1, len(s2)-1])
+    """
+    DTW distance between s1 and s2 within a band of w, ignoring negative
+    (padding) values. See `dtw.pairwise_dtw` for distance matrices.
+    """
+    return dtw_distance(s1, s2, w=w)
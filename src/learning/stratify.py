@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
+
+from ..utils.parallel import get_n_jobs, share_array, attach_array
+
+
+def fit_strata(fit, df, by, predictors, target, terms=None, min_size=None, n_jobs=None):
+    """
+    Fits the same model separately on each stratum of df, e.g. each
+    'Rural-urban_Continuum Code_2013' or each cluster label, over a
+    process pool.
+
+    The design matrix and target are placed in shared memory once; each
+    task only receives the row indices of its stratum, and its worker
+    selects them from a read-only view.
+
+    fit : method (X, y) -> coefficients, or (coefficients, dict of fit
+        statistics), e.g. `ols` or `functools.partial(gamma_glm, alpha=0.1)`
+    df : DataFrame with the by, predictors and target columns
+    by : column, or list of columns, whose values define the strata
+    predictors : columns of the design matrix, in order
+    target : column of the response
+    terms : names of the coefficients (default predictors, preceded by
+        'intercept' when fit returns one more coefficient)
+    min_size : strata with fewer rows are not fit (default the number of
+        predictors + 2)
+    n_jobs : number of processes, -1 for all CPUs
+
+    fit must be picklable, i.e. a module level function or a
+    functools.partial of one, when n_jobs > 1.
+
+    Returns
+    -------
+    Tidy DataFrame with a row per stratum and term: the by columns, term,
+    coef, the fit statistics, n (rows of the stratum), seconds and error
+    (the exception raised by fit, if any). Strata smaller than min_size
+    get a single row with no term.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    min_size = len(predictors) + 2 if min_size is None else min_size
+    df = df.dropna(subset=by)
+    X = df[predictors].to_numpy(dtype=float)
+    y = df[target].to_numpy(dtype=float)
+    strata = df[by].reset_index(drop=True).groupby(by, sort=True).indices
+    tasks = {key: rows for key, rows in strata.items() if len(rows) >= min_size}
+
+    n_jobs = get_n_jobs(n_jobs)
+    results = {}
+    if n_jobs == 1:
+        _state.update(fit=fit, X=X, y=y)
+        for key, rows in tasks.items():
+            results[key] = _run_stratum(rows)
+        _state.clear()
+    else:
+        X_shm, X_spec = share_array(X)
+        y_shm, y_spec = share_array(y)
+        try:
+            with ProcessPoolExecutor(
+                n_jobs,
+                initializer=_init_worker,
+                initargs=(fit, X_spec, y_spec),
+            ) as pool:
+                futures = {
+                    pool.submit(_run_stratum, rows): key
+                    for key, rows in tasks.items()
+                }
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+        finally:
+            for shm in (X_shm, y_shm):
+                shm.close()
+                shm.unlink()
+
+    table = []
+    for key, rows in strata.items():
+        keys = dict(zip(by, key if isinstance(key, tuple) else (key,)))
+        if key not in results:
+            table.append({**keys, 'term': None, 'coef': np.nan, 'n': len(rows),
+                          'seconds': None, 'error': f'fewer than {min_size} rows'})
+            continue
+        coef, stats, seconds, error = results[key]
+        names = _terms(terms, predictors, len(coef))
+        for term, value in zip(names, coef):
+            table.append({**keys, 'term': term, 'coef': value, **stats,
+                          'n': len(rows), 'seconds': seconds, 'error': error})
+        if error is not None:
+            table.append({**keys, 'term': None, 'coef': np.nan, 'n': len(rows),
+                          'seconds': seconds, 'error': error})
+
+    return pd.DataFrame(table)
+
+def ols(X, y):
+    """
+    Least squares with an intercept. Returns the coefficients (intercept
+    first) and the r2 and rmse of the fit.
+    """
+    A = np.column_stack([np.ones(len(X)), X])
+    coef, _, _, _ = np.linalg.lstsq(A, y, rcond=None)
+    resid = y - A @ coef
+    ss_tot = np.sum((y - y.mean())**2)
+
+    return coef, {
+        'r2': 1 - np.sum(resid**2) / ss_tot if ss_tot > 0 else np.nan,
+        'rmse': np.sqrt(np.mean(resid**2)),
+    }
+
+def gamma_glm(X, y, alpha=0.0, max_iter=100, tol=1e-8):
+    """
+    Gamma GLM with a log link and an intercept, fit by iteratively
+    reweighted least squares, as the Tweedie (power=2, link='log')
+    regressions of the stratified notebooks. alpha is an L2 penalty on the
+    coefficients other than the intercept, scaled per row as in
+    scikit-learn.
+
+    Returns the coefficients (intercept first) and the deviance, the
+    fraction of deviance explained (d2) and the iterations run.
+    """
+    A = np.column_stack([np.ones(len(X)), X])
+    penalty = np.full(A.shape[1], alpha * len(y))
+    penalty[0] = 0
+    coef = np.zeros(A.shape[1])
+    coef[0] = np.log(np.mean(y))
+    for n_iter in range(1, max_iter + 1):
+        eta = A @ coef
+        mu = np.exp(eta)
+        # Gamma with log link: working weights are 1, response eta + (y - mu) / mu
+        z = eta + (y - mu) / mu
+        new = np.linalg.solve(A.T @ A + np.diag(penalty), A.T @ z)
+        converged = np.max(np.abs(new - coef)) < tol * (1 + np.max(np.abs(coef)))
+        coef = new
+        if converged:
+            break
+
+    mu = np.exp(A @ coef)
+    deviance = _gamma_deviance(y, mu)
+    null = _gamma_deviance(y, np.full(len(y), y.mean()))
+
+    return coef, {
+        'deviance': deviance,
+        'd2': 1 - deviance / null if null > 0 else np.nan,
+        'n_iter': n_iter,
+    }
+
+
+#################################
+# Utility Functions
+#################################
+_state = {}
+
+def _init_worker(fit, X_spec, y_spec):
+    X_shm, X = attach_array(X_spec)
+    y_shm, y = attach_array(y_spec)
+    _state.update(fit=fit, X=X, y=y, shms=(X_shm, y_shm))
+
+def _run_stratum(rows):
+    start = time.perf_counter()
+    try:
+        result = _state['fit'](_state['X'][rows], _state['y'][rows])
+        coef, stats = result if isinstance(result, tuple) else (result, {})
+        coef, error = np.asarray(coef, dtype=float).ravel(), None
+    except Exception as e:
+        coef, stats, error = np.array([]), {}, f'{type(e).__name__}: {e}'
+
+    return coef, stats, time.perf_counter() - start, error
+
+def _terms(terms, predictors, n_coef):
+    if terms is not None:
+        return list(terms)
+    if n_coef == len(predictors) + 1:
+        return ['intercept'] + list(predictors)
+    return list(predictors)[:n_coef] + [f'coef_{i}' for i in range(len(predictors), n_coef)]
+
+def _gamma_deviance(y, mu):
+    return 2 * np.sum((y - mu) / mu - np.log(y / mu))
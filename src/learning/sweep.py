@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
+import time
+
+from ..data_loader.data_loader import load_cum_deaths_inputs, build_cum_deaths_dataframe
+from ..utils.parallel import get_n_jobs, share_array, attach_array
+
+
+def sweep(fit, grid, time_series=False, n_jobs=None, incremental=False, start=None, end=None):
+    """
+    Sensitivity sweep of a model fit over `get_cum_deaths_dataframe`
+    configurations, run over a process pool.
+
+    The raw inputs are loaded once and the deaths state (onsets, etc.) is
+    built once per onset threshold, then placed in shared memory; each
+    configuration only builds its dataframe from them and fits.
+
+    fit : method (df, **params) -> dict of results, where df is the
+        dataframe of the configuration and params are the grid keys other
+        than n_days and onset_threshold (e.g. a lag)
+    grid : dict of parameter -> list of values; n_days is required,
+        onset_threshold defaults to [3]
+    time_series : passed to `get_cum_deaths_dataframe`
+    n_jobs : number of processes, -1 for all CPUs
+    incremental : passed to `get_cum_deaths_dataframe`
+    start, end : date range, passed to `get_cum_deaths_dataframe`
+
+    fit must be picklable, i.e. a module level function, when n_jobs > 1.
+
+    Returns
+    -------
+    DataFrame with a row per configuration: its parameters, the fit
+    results, the number of counties and the seconds it took
+    """
+    grid = {'onset_threshold': [3], **grid}
+    names = list(grid)
+    configs = [dict(zip(names, values)) for values in product(*grid.values())]
+    counties, hospitals, deaths_states, od_state, county_fips = load_cum_deaths_inputs(
+        grid['onset_threshold'], incremental, start, end)
+
+    n_jobs = get_n_jobs(n_jobs)
+    rows = {}
+    if n_jobs == 1:
+        _state.update(fit=fit, counties=counties, hospitals=hospitals,
+                      deaths_states=deaths_states, od_state=od_state,
+                      county_fips=county_fips, time_series=time_series)
+        for k, config in enumerate(configs):
+            rows[k] = _run_config(config)
+        _state.clear()
+    else:
+        shms = []
+        deaths_specs = {}
+        for threshold, state in deaths_states.items():
+            deaths_specs[threshold] = _share_state(state, shms)
+        od_spec = _share_state(od_state, shms)
+        try:
+            with ProcessPoolExecutor(
+                n_jobs,
+                initializer=_init_worker,
+                initargs=(fit, counties, hospitals, deaths_specs, od_spec, county_fips,
+                          time_series),
+            ) as pool:
+                futures = {
+                    pool.submit(_run_config, config): k
+                    for k, config in enumerate(configs)
+                }
+                for future in as_completed(futures):
+                    rows[futures[future]] = future.result()
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
+
+    return pd.DataFrame([rows[k] for k in range(len(configs))])
+
+
+#################################
+# Utility Functions
+#################################
+_state = {}
+
+def _share_state(state, shms):
+    """Spec of a state with its arrays in shared memory (see `share_array`)."""
+    spec = {}
+    for key, value in state.items():
+        if isinstance(value, np.ndarray) and value.ndim > 0:
+            shm, spec[key] = share_array(value)
+            shms.append(shm)
+        else:
+            spec[key] = ('value', value)
+    return spec
+
+def _attach_state(spec, shms):
+    state = {}
+    for key, value in spec.items():
+        if value[0] == 'value':
+            state[key] = value[1]
+        else:
+            shm, state[key] = attach_array(value)
+            shms.append(shm)
+    return state
+
+def _init_worker(fit, counties, hospitals, deaths_specs, od_spec, county_fips, time_series):
+    shms = []
+    deaths_states = {
+        threshold: _attach_state(spec, shms)
+        for threshold, spec in deaths_specs.items()
+    }
+    od_state = _attach_state(od_spec, shms)
+    _state.update(fit=fit, counties=counties, hospitals=hospitals,
+                  deaths_states=deaths_states, od_state=od_state,
+                  county_fips=county_fips, time_series=time_series, shms=shms)
+
+def _run_config(config):
+    start = time.perf_counter()
+    params = {k: v for k, v in config.items() if k not in ('n_days', 'onset_threshold')}
+    df = build_cum_deaths_dataframe(
+        _state['deaths_states'][config['onset_threshold']],
+        _state['od_state'],
+        _state['counties'],
+        _state['hospitals'],
+        config['n_days'],
+        _state['time_series'],
+        _state['county_fips'],
+    )
+    results = _state['fit'](df, **params)
+
+    return {
+        **config,
+        **results,
+        'n_counties': len(df),
+        'seconds': time.perf_counter() - start,
+    }
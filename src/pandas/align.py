@@ -4,87 +4,172 @@ from datetime import datetime
 import sys
 
 sys.path.append("../")
-from src.utils.dates import get_today, lag_date, date2str
-from src.utils.df_utils import get_date_columns
+from src.utils.dates import get_today, lag_date, date2str, day2date, epoch
+from src.utils.df_utils import get_date_columns, to_date_index
+from src.utils.profiling import profiled
 
 
+@profiled
 def align_lagged_dates(df1, df2, match_col, lag=0, date_converter=date2str, return_idx = True):
     """
     Concatenates two dataframes by matching on the given column and
     lagging time series dates. Note that df1 preceeds df2, for instance
-    in a causal viewpoint.
+    in a causal viewpoint. Rows are ordered by match_col, one per value.
 
-    df1,df2 : dataframes to concatenate
+    df1,df2 : dataframes to concatenate, with "%m-%d" date headers or
+        date-indexed (see `align_lags`)
     match_col : the column to match rows across dataframes
     lag : the day lag for which df1 will preceed df2
-    date_converter : method to read a header date
-    """
-    FIPS = list(set(df1[match_col]) & set(df2[match_col]))
-    causes = df1[df1[match_col].isin(FIPS)]
-    effects = df2[df2[match_col].isin(FIPS)]
+    date_converter : method formatting the returned dates, "%m-%d" by
+        default
 
-    # Sort so that FIPS align
-    causes = causes.sort_values(by=causes.columns.tolist()).reset_index(drop=True)
-    effects = effects.sort_values(by=effects.columns.tolist()).reset_index(drop=True)
+    Only dates t for which df1 has t and df2 has t + lag are returned, so
+    a day missing from either frame is dropped rather than filled with
+    NaN. See `align_lags` to align a whole range of lags at once.
+    """
+    ts1, ts2 = _to_date_index(df1, match_col), _to_date_index(df2, match_col)
+    keys, cause_ts, effect_ts, days = align_lags(ts1, ts2, match_col, lags=lag)
+    # Dates strictly inside the overlapping range, on which both frames
+    # have a column
+    keep = np.isin(days, _get_days(ts1)) & np.isin(days + lag, _get_days(ts2))
+    keep[[0, -1] if len(days) else []] = False
+    cause_ts = cause_ts[:, keep]
+    effect_ts = effect_ts[0][:, keep]
+    days = days[keep]
 
-    # Get columns that are dates
-    cause_dates = get_date_columns(df1)
-    effect_dates = get_date_columns(df2)
+    # Get cause and effect dates in string form
+    cause_dates = [date_converter(day2date(d)) for d in days]
+    effect_dates = [date_converter(day2date(d + lag)) for d in days]
 
-    start_date = max(
-        min(cause_dates), lag_date(min(effect_dates), lag=lag, backwards=True)
-    )
-    end_date = min(
-        lag_date(max(cause_dates), lag=lag, backwards=False), max(effect_dates)
+    idx = list(range(len(days)))
+    aligned = pd.concat(
+        (
+            pd.DataFrame(cause_ts, columns=idx).assign(**{match_col: keys}),
+            pd.DataFrame(effect_ts, columns=idx).assign(**{match_col: keys}),
+        ),
+        axis=0,
     )
 
-    # Get cause and effect dates in string form
-    cause_start = start_date
-    cause_end = lag_date(end_date, lag=lag)
-    effect_start = lag_date(start_date, lag=lag, backwards=False)
-    effect_end = end_date
-
-    cause_dates = [
-        date_converter(c)
-        for c in cause_dates
-        if (c > cause_start and c < cause_end)
-    ]
-    effect_dates = [
-        date_converter(c)
-        for c in effect_dates
-        if (c > effect_start and c < effect_end)
-    ]
-
-    # Adjusted time series, to align with given lag
-    cause_ts = causes[cause_dates].to_numpy()
-    effect_ts = effects[effect_dates].to_numpy()
-
     if return_idx == True:
-        return (pd.concat(
-            (
-                causes[cause_dates + [match_col]].rename(
-                    {cd: i for i, cd in enumerate(cause_dates)}, axis=1
-                ),
-                effects[effect_dates + [match_col]].rename(
-                    {ed: i for i, ed in enumerate(effect_dates)}, axis=1
-                ),
-            ),
-            axis=0,
-        ),
-        (cause_dates, effect_dates),
-        list(range(len(cause_dates))))
+        return (aligned, (cause_dates, effect_dates), idx)
     else:
-        return (pd.concat(
-            (
-                causes[cause_dates + [match_col]].rename(
-                    {cd: i for i, cd in enumerate(cause_dates)}, axis=1
-                ),
-                effects[effect_dates + [match_col]].rename(
-                    {ed: i for i, ed in enumerate(effect_dates)}, axis=1
-                ),
-            ),
-            axis=0,
-        ),
-        (cause_dates, effect_dates)
-        )
+        return (aligned, (cause_dates, effect_dates))
+
+
+@profiled
+def align_lags(df1, df2, match_col, lags=range(31)):
+    """
+    Aligns two dataframes once into contiguous arrays over a range of lags.
+    Note that df1 preceeds df2, as in `align_lagged_dates`.
+
+    df1,df2 : dataframes with a match column and "%m-%d" date headers, or
+        date-indexed frames (dates x match_col values, see
+        `df_utils.to_date_index`), which keep the year of series spanning
+        several years. Date ranges are sliced on the sorted index.
+    match_col : the column to match rows across dataframes
+    lags : int, range or evenly spaced increasing sequence of day lags for
+        which df1 will preceed df2
+
+    Returns
+    -------
+    keys : match_col values in both frames, sorted
+    causes : (n_keys, n_days) view of df1 on the cause days
+    effects : (n_lags, n_keys, n_days) read-only strided view of df2, where
+        effects[k] is df2 on the cause days shifted by lags[k]
+    days : day offsets of the cause days, the days t for which t is in df1
+        and t + lag is in df2 for every lag
+    """
+    lags = _get_lag_range(lags)
+
+    ts1, ts2 = _to_date_index(df1, match_col), _to_date_index(df2, match_col)
+    keys = np.intersect1d(ts1.columns.to_numpy(), ts2.columns.to_numpy())
+    day = pd.Timedelta(days=1)
+    if len(ts1) and len(ts2):
+        start = max(ts1.index[0], ts2.index[0] - lags[0] * day)
+        end = min(ts1.index[-1], ts2.index[-1] - lags[-1] * day)
+        dates = pd.date_range(start, end)
+    else:
+        dates = pd.DatetimeIndex([], name='date')
+
+    causes = _get_day_grid(ts1, keys, dates)
+    effects = _get_day_grid(ts2, keys, dates + lags[0] * day, lags[-1] - lags[0])
+    effects = np.lib.stride_tricks.as_strided(
+        effects,
+        shape=(len(lags), len(keys), len(dates)),
+        strides=(lags.step * effects.strides[1],) + effects.strides,
+        writeable=False,
+    )
+
+    return keys, causes, effects, np.asarray((dates - epoch).days, dtype=int)
+
+
+@profiled
+def align_lagged_series(ts1, ts2, lag=0):
+    """
+    Aligns two date-indexed frames (dates x ids, see
+    `df_utils.to_date_index`) so that date t of ts1 matches date t + lag of
+    ts2. Note that ts1 preceeds ts2, as in `align_lagged_dates`. Ranges are
+    sliced on the sorted DatetimeIndex, so series may span several years.
+
+    ts1,ts2 : date-indexed frames
+    lag : the day lag for which ts1 will preceed ts2
+
+    Returns the two frames restricted to their shared ids and to the
+    overlapping lagged date range. Dates missing from either frame are
+    not filled in.
+    """
+    ids = ts1.columns.intersection(ts2.columns)
+    lag = pd.Timedelta(days=lag)
+    start = max(ts1.index[0], ts2.index[0] - lag)
+    end = min(ts1.index[-1], ts2.index[-1] - lag)
+
+    causes = ts1.loc[start:end, ids]
+    effects = ts2.loc[start + lag:end + lag, ids]
+
+    return(causes, effects)
+
+
+#################################
+# Utility Functions
+#################################
+def _to_date_index(df, match_col):
+    """df as a date-indexed frame, reading "%m-%d" headers if it is not one."""
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df
+    return to_date_index(df, match_col)
+
+def _get_days(ts):
+    return np.asarray((ts.index - epoch).days, dtype=int)
+
+def _get_lag_range(lags):
+    """
+    lags as a non-empty increasing range, the stride of the effect view.
+    Sequences such as [0, 7, 14] are read as the range they enumerate.
+    """
+    if isinstance(lags, (int, np.integer)):
+        return range(lags, lags + 1)
+    if not isinstance(lags, range):
+        values = np.asarray(lags)
+        if values.ndim != 1 or len(values) == 0 or not np.issubdtype(values.dtype, np.integer):
+            raise ValueError('lags must be an int, a range or a sequence of ints')
+        steps = np.unique(np.diff(values))
+        if len(steps) > 1 or (len(steps) and steps[0] <= 0):
+            raise ValueError(f'lags must be evenly spaced and increasing, got {values.tolist()}')
+        step = int(steps[0]) if len(steps) else 1
+        lags = range(int(values[0]), int(values[-1]) + step, step)
+    if len(lags) == 0 or lags.step <= 0:
+        raise ValueError('lags must be an int or a non-empty increasing range')
+
+    return lags
+
+def _get_day_grid(ts, keys, dates, extra=0):
+    """
+    Series of keys (first match of each) of a date-indexed frame as a
+    contiguous (n_keys, n_days) array over dates and the extra days after
+    them, NaN on days missing from ts.
+    """
+    dates = pd.date_range(dates[0], periods=len(dates) + extra) if len(dates) else dates
+    ts = ts.loc[dates[0]:dates[-1]] if len(dates) else ts.iloc[:0]
+    ts = ts.loc[:, ~ts.columns.duplicated()].reindex(index=dates, columns=keys)
 
+    return np.ascontiguousarray(ts.to_numpy().T)
@@ -1,12 +1,25 @@
+import numpy as np
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+from .profiling import profiled
 
 dtime_format = "%m-%d"
+# Year-qualified format, for data that spans more than a year
+full_format = "%Y-%m-%d"
+# Dates are also handled as integer days since the epoch, which is the
+# date strptime fills in for formats without a year
+epoch = datetime(1900, 1, 1)
+_cache_size = 1 << 14
 
 def date2str(date, fmt=dtime_format):
     return(date.strftime(dtime_format))
 
 def str2date(string, fmt=dtime_format):
-    return(datetime.strptime(string, fmt))
+    date = _parse(string, fmt)
+    if date is None:
+        raise ValueError(f"time data {string!r} does not match format {fmt!r}")
+    return(date)
 
 def get_today(string=True):
     today = datetime.now().strftime(dtime_format)
@@ -17,8 +30,8 @@ def get_today(string=True):
 
 def switch_date_format(string, fmt1, fmt2=dtime_format):
     try:
-        return(str2date(string, fmt1).strftime(fmt2))
-    except:
+        return(_switch_date_format(string, fmt1, fmt2))
+    except TypeError:
         return(string)
 
 def ordinal2string(ord, fmt=dtime_format):
@@ -29,7 +42,12 @@ def ordinal2string(ord, fmt=dtime_format):
 
 def lag_date(date, lag=1, backwards=True, return_date=True):
     if type(date) == str:
-        date = str2date(date)
+        day = str2day(date)
+        day = day - lag if backwards else day + lag
+        if return_date:
+            return(day2date(day))
+        else:
+            return(day2str(day))
     if backwards:
         date -= timedelta(days = lag)
     else:
@@ -41,3 +59,115 @@ def lag_date(date, lag=1, backwards=True, return_date=True):
 
 def get_format():
     return dtime_format
+
+
+#################################
+# Integer day API
+#################################
+def str2day(string, fmt=dtime_format):
+    """Days since the epoch of a date string."""
+    day = _parse_day(string, fmt)
+    if day is None:
+        raise ValueError(f"time data {string!r} does not match format {fmt!r}")
+    return day
+
+@lru_cache(maxsize=_cache_size)
+def day2str(day, fmt=dtime_format):
+    """Date string of a day offset."""
+    return day2date(day).strftime(fmt)
+
+@lru_cache(maxsize=_cache_size)
+def day2date(day):
+    """Datetime of a day offset."""
+    return epoch + timedelta(days=int(day))
+
+@profiled
+def strs2days(strings, fmt=dtime_format):
+    """Day offsets of an array of date strings, parsing each value once."""
+    values, inverse = np.unique(np.asarray(strings, dtype=object),
+                                return_inverse=True)
+    days = np.array([str2day(s, fmt) for s in values], dtype=int)
+
+    return days[inverse.reshape(-1)]
+
+@profiled
+def days2strs(days, fmt=dtime_format):
+    """Date strings of an array of day offsets, formatting each value once."""
+    values, inverse = np.unique(np.asarray(days, dtype=int),
+                                return_inverse=True)
+    strings = np.array([day2str(d, fmt) for d in values], dtype=object)
+
+    return strings[inverse.reshape(-1)]
+
+@profiled
+def ordinals2strs(ordinals, fmt=dtime_format):
+    """
+    Date strings of an array of day ordinals (`date.toordinal`, as in the
+    interventions file), formatting each value once. NaNs are kept.
+    """
+    ordinals = np.asarray(ordinals, dtype=float)
+    strings = np.full(ordinals.shape, np.nan, dtype=object)
+    present = ~np.isnan(ordinals)
+    values, inverse = np.unique(ordinals[present].astype(int), return_inverse=True)
+    formatted = np.array([datetime.fromordinal(o).strftime(fmt) for o in values], dtype=object)
+    strings[present] = formatted[inverse.reshape(-1)]
+
+    return strings
+
+@profiled
+def strs2ordinals(strings, fmt=dtime_format, year=2020):
+    """
+    Day ordinals (`date.toordinal`) of an array of date strings, parsing
+    each value once. Dates of formats without a year, such as the default
+    "%m-%d", are taken in year.
+    """
+    values, inverse = np.unique(np.asarray(strings, dtype=object),
+                                return_inverse=True)
+    if '%Y' not in fmt and '%y' not in fmt:
+        # Parsed in year, not 1900, so that e.g. "02-29" of 2020 is valid
+        dates = [str2date(f'{year}-{s}', '%Y-' + fmt) for s in values]
+    else:
+        dates = [str2date(s, fmt) for s in values]
+    ordinals = np.array([d.toordinal() for d in dates], dtype=int)
+
+    return ordinals[inverse.reshape(-1)]
+
+@profiled
+def get_header_days(columns, fmt=dtime_format):
+    """
+    Date columns among headers, in column order, and their day offsets.
+
+    columns : iterable of column labels
+    fmt : date format of the headers
+    """
+    dates, days = [], []
+    for c in columns:
+        day = _parse_day(c, fmt) if isinstance(c, str) else None
+        if day is not None:
+            dates.append(c)
+            days.append(day)
+
+    return(dates, np.array(days, dtype=int))
+
+@lru_cache(maxsize=_cache_size)
+def _parse(string, fmt):
+    """Parsed date string, None if it does not match fmt."""
+    try:
+        return datetime.strptime(string, fmt)
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=_cache_size)
+def _parse_day(string, fmt):
+    """Day offset of a date string, None if it does not match fmt."""
+    date = _parse(string, fmt)
+    if date is None:
+        return None
+    return (date - epoch).days
+
+@lru_cache(maxsize=_cache_size)
+def _switch_date_format(string, fmt1, fmt2):
+    date = _parse(string, fmt1)
+    if date is None:
+        return string
+    return date.strftime(fmt2)
@@ -1,16 +1,62 @@
+import numpy as np
 import pandas as pd
-from .dates import str2date,date2str
+from .dates import str2date,date2str,day2date,days2strs,get_header_days,epoch,dtime_format
 from datetime import datetime
+from .profiling import profiled
 
-def get_date_columns(df, return_dtimes=True):
-    cols = df.columns
-    dates = []
-    for c in cols:
-        try:
-            dates.append(str2date(c))
-        except:
-            continue
+@profiled
+def get_date_columns(df, return_dtimes=True, fmt=dtime_format):
+    dates, days = get_header_days(df.columns, fmt)
     if return_dtimes:
-        return(dates)
+        return([day2date(d) for d in days])
     else:
-        return([date2str(d) for d in dates])
\ No newline at end of file
+        return(list(days2strs(days)))
+
+@profiled
+def to_date_index(df, id_col, fmt=dtime_format, year=None):
+    """
+    Date-indexed time series of a frame with one column per date.
+
+    Returns a frame whose rows are a sorted DatetimeIndex and whose
+    columns are the values of id_col, so that headers with a year stay
+    distinct and date ranges slice by binary search, e.g.
+    `ts.loc['2020-12-01':'2021-01-31']`.
+
+    df : dataframe with an id column and date headers
+    id_col : column identifying the series, e.g. 'FIPS'
+    fmt : date format of the headers
+    year : year of the headers when fmt has none, such as "%m-%d"
+        (default the epoch year, in which "02-29" is not a date)
+    """
+    labels = df.columns
+    if year is not None and '%Y' not in fmt and '%y' not in fmt:
+        labels = pd.Index([f'{year}-{c}' if isinstance(c, str) else c for c in labels])
+        fmt = '%Y-' + fmt
+    dates, days = get_header_days(labels, fmt)
+    index = pd.to_datetime(days, unit='D', origin=epoch).rename('date')
+    if not index.is_unique:
+        raise ValueError(f'Duplicate dates in headers read as {fmt!r}')
+    ts = pd.DataFrame(
+        df.iloc[:, labels.isin(dates)].to_numpy().T,
+        index=index,
+        columns=pd.Index(df[id_col], name=id_col),
+    )
+
+    return ts.sort_index()
+
+def gather_days(values, days, rows, targets):
+    """
+    values[row, day] for each (row, target day) pair, NaN where the row is
+    missing (-1) or the day is not a column of values.
+
+    values : (n, T) array, e.g. county x day
+    days : (T,) sorted day offsets of the columns of values
+    rows, targets : row index and day offset of each pair
+    """
+    cols = np.searchsorted(days, targets)
+    cols = np.minimum(cols, len(days) - 1)
+    found = (rows >= 0) & (days[cols] == targets)
+    out = np.full(len(rows), np.nan)
+    out[found] = values[rows[found], cols[found]]
+
+    return out
@@ -0,0 +1,43 @@
+import numpy as np
+from multiprocessing import shared_memory
+import os
+
+def get_n_jobs(n_jobs):
+    """
+    Number of worker processes for an n_jobs argument, following the
+    scikit-learn convention: None means 1 and negative values count back
+    from the number of CPUs (-1 uses all of them).
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(os.cpu_count() + 1 + n_jobs, 1)
+    return n_jobs
+
+def share_array(array):
+    """
+    Copies an array into shared memory, so process pool workers can read it
+    without receiving their own copy.
+
+    Returns the SharedMemory block, which the caller must close and unlink
+    when done, and the spec workers pass to `attach_array`.
+    """
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    spec = (shm.name, array.shape, array.dtype.str)
+
+    return shm, spec
+
+def attach_array(spec):
+    """
+    Read-only view of an array shared by `share_array`. Returns the
+    SharedMemory block, which must be kept alive while the view is used,
+    and the view.
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    array.flags.writeable = False
+
+    return shm, array
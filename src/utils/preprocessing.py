@@ -1,9 +1,13 @@
 import numpy as np
 import pandas as pd
 
+from .rolling import rolling_mean
+from .profiling import profiled
+
+@profiled
 def moving_average(df, cols, n=3):
-    df = df.copy()
-    df[cols] = df[cols].apply(lambda x: x.rolling(window=n).mean(), axis=1)
-    df.drop(cols[:n-1] , axis=1, inplace=True)
+    averages = rolling_mean(df[cols].to_numpy(dtype=float), n)
+    df = df.drop(cols[:n-1], axis=1)
+    df[cols[n-1:]] = averages[:, n-1:]
 
-    return df
\ No newline at end of file
+    return df
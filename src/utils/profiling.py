@@ -0,0 +1,173 @@
+"""
+Opt-in timing of the data pipeline.
+
+Loaders, alignment and date utilities are wrapped with `profiled` or
+`stage`. While profiling is disabled (the default) a wrapped call only
+checks a flag. Once `enable()` is called, each call records its wall
+time, rows in and out and, with memory=True, its peak traced memory,
+nested under the stage that called it:
+
+    from src.utils import profiling
+    profiling.enable(memory=True)
+    get_cum_deaths_dataframe(28)
+    print(profiling.report())
+    profiling.to_json('profile.json')
+"""
+import pandas as pd
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+enabled = False
+memory = False
+
+_records = []
+_stack = []
+
+
+def enable(memory=False):
+    """Starts recording stages, and peak memory per stage if memory."""
+    global enabled
+    enabled = True
+    globals()['memory'] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    """Stops recording; recorded stages are kept until `reset`."""
+    global enabled
+    enabled = False
+    if memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def reset():
+    """Drops recorded stages."""
+    _records.clear()
+
+@contextmanager
+def stage(name, rows_in=None):
+    """
+    Records the enclosed block as a stage. Yields the stage record, on
+    which 'rows_out' can be set.
+    """
+    if not enabled:
+        yield {}
+        return
+    record = {
+        'name': name,
+        'path': ';'.join([r['name'] for r in _stack] + [name]),
+        'depth': len(_stack),
+        'rows_in': rows_in,
+        'rows_out': None,
+    }
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1]['_peak'] = max(_stack[-1]['_peak'], peak)
+        tracemalloc.reset_peak()
+        record['_start_memory'] = current
+        record['_peak'] = current
+    _stack.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        _stack.pop()
+        if memory:
+            peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+            record['peak_bytes'] = peak - record.pop('_start_memory')
+            if _stack:
+                _stack[-1]['_peak'] = max(_stack[-1]['_peak'], peak)
+        _records.append(record)
+
+def profiled(func=None, name=None):
+    """
+    Decorator recording each call of func as a stage, with rows in taken
+    from its first argument and rows out from its result (the first item
+    of a returned tuple), when these are frames or arrays.
+    """
+    if func is None:
+        return functools.partial(profiled, name=name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return func(*args, **kwargs)
+        with stage(name or func.__name__, _n_rows(args[0] if args else None)) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = _n_rows(result[0] if isinstance(result, tuple) and result else result)
+        return result
+
+    return wrapper
+
+def records():
+    """Recorded stages, in the order they finished."""
+    return list(_records)
+
+def summary():
+    """
+    DataFrame of stages aggregated by call path: calls, total and self
+    seconds (excluding nested stages), rows and peak memory.
+    """
+    if not _records:
+        return pd.DataFrame(columns=['path', 'calls', 'seconds', 'self_seconds'])
+    df = pd.DataFrame(_records)
+    df[['rows_in', 'rows_out']] = df[['rows_in', 'rows_out']].astype(float)
+    df['parent'] = df['path'].str.rpartition(';')[0]
+    children = df.groupby('parent')['seconds'].sum()
+    rows = lambda s: s.sum(min_count=1)
+    aggs = {'calls': ('name', 'size'), 'seconds': ('seconds', 'sum'),
+            'rows_in': ('rows_in', rows), 'rows_out': ('rows_out', rows)}
+    if 'peak_bytes' in df:
+        aggs['peak_bytes'] = ('peak_bytes', 'max')
+    table = df.groupby('path', sort=False).agg(**aggs).reset_index()
+    table.insert(3, 'self_seconds',
+                 table['seconds'] - table['path'].map(children).fillna(0))
+    # Parents before their stages, as a tree
+    order = sorted(range(len(table)), key=lambda i: table['path'][i].split(';'))
+
+    return table.iloc[order].reset_index(drop=True)
+
+def to_json(path=None):
+    """The recorded stages as JSON, written to path if given."""
+    text = json.dumps(_records, indent=1, default=float)
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(text)
+    return text
+
+def collapsed_stacks():
+    """
+    Self time per call path in microseconds, in the collapsed stack format
+    read by flame graph tools (flamegraph.pl, speedscope).
+    """
+    table = summary()
+    return '\n'.join(
+        f"{path} {max(int(round(s * 1e6)), 0)}"
+        for path, s in zip(table['path'], table['self_seconds'])
+    )
+
+def report():
+    """Indented text tree of the summary."""
+    lines = []
+    for _, row in summary().iterrows():
+        depth = row['path'].count(';')
+        name = row['path'].rpartition(';')[2]
+        line = (f"{'  ' * depth}{name:<{40 - 2 * depth}} {row['calls']:>6} calls "
+                f"{row['seconds']:>9.4f}s total {row['self_seconds']:>9.4f}s self")
+        if 'peak_bytes' in row:
+            line += f" {row['peak_bytes'] / 2**20:>9.1f} MiB peak"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+#################################
+# Utility Functions
+#################################
+def _n_rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)) or hasattr(value, 'shape'):
+        return len(value) if getattr(value, 'ndim', 1) > 0 else None
+    return None
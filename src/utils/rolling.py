@@ -0,0 +1,113 @@
+"""
+Rolling windows along the date axis of county x date arrays.
+
+Window sums come from one cumulative sum per row, so every window costs
+a subtraction whatever its width. NaNs are skipped and counted apart,
+with pandas' min_periods semantics, so results match
+`DataFrame.rolling(...)` on the transposed frame up to rounding.
+"""
+import numpy as np
+
+from .profiling import profiled
+
+
+@profiled
+def rolling_sum(values, window, center=False, min_periods=None):
+    """
+    Rolling sum along the last axis, skipping NaNs.
+
+    values : (..., T) array, e.g. county x date
+    window : window width in columns
+    center : center the window on each column (as pandas, the window of
+        column i is [i - window // 2, i + (window - 1) // 2]) instead of
+        ending it there
+    min_periods : minimum non-NaN values for a result (default window),
+        NaN otherwise
+    """
+    sums, counts = _window_sums(values, window, center)
+    min_periods = window if min_periods is None else min_periods
+
+    return np.where(counts >= max(min_periods, 1), sums, np.nan)
+
+@profiled
+def rolling_mean(values, window, center=False, min_periods=None):
+    """Rolling mean along the last axis, skipping NaNs (see `rolling_sum`)."""
+    sums, counts = _window_sums(values, window, center)
+    min_periods = window if min_periods is None else min_periods
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts >= max(min_periods, 1), sums / counts, np.nan)
+
+@profiled
+def impute_ma(values, k=5, weighting='linear'):
+    """
+    Fills NaNs along the last axis with a weighted moving average of the
+    observed values up to k columns on each side, as the 5 day moving
+    average imputation of the paper (imputeTS::na_ma).
+
+    weighting : 'simple' (equal weights), 'linear' (1 / (1 + distance)) or
+        'exponential' (1 / 2**distance)
+
+    Where fewer than 2 values are observed within k columns, the window is
+    widened until there are. Observed values are returned unchanged.
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values.copy()
+    shape = values.shape
+    values = values.reshape(-1, shape[-1])
+    missing = missing.reshape(-1, shape[-1])
+
+    imputed = values.copy()
+    rows, cols = np.nonzero(missing)
+    # Values needed per gap: 2, or all the row has; rows with none stay NaN
+    needed = np.minimum((~missing).sum(axis=1), 2)[rows]
+    todo = np.flatnonzero(needed > 0)
+    while len(todo):
+        offsets = np.arange(-k, k + 1)
+        weights = _ma_weights(np.abs(offsets), weighting)
+        idx = cols[todo, None] + offsets
+        inside = (idx >= 0) & (idx < shape[-1])
+        window = np.where(inside, values[rows[todo, None], np.clip(idx, 0, shape[-1] - 1)], np.nan)
+        observed = ~np.isnan(window)
+        enough = observed.sum(axis=1) >= needed[todo]
+        w = np.where(observed, weights, 0)
+        done = todo[enough]
+        imputed[rows[done], cols[done]] = (
+            np.nansum(window[enough] * w[enough], axis=1) / w[enough].sum(axis=1)
+        )
+        todo = todo[~enough]
+        k += 1
+
+    return imputed.reshape(shape)
+
+
+#################################
+# Utility Functions
+#################################
+def _window_sums(values, window, center):
+    """Sums and non-NaN counts of each window along the last axis."""
+    values = np.asarray(values, dtype=float)
+    present = ~np.isnan(values)
+    n = values.shape[-1]
+    pad = np.zeros(values.shape[:-1] + (1,))
+    csum = np.concatenate((pad, np.cumsum(np.where(present, values, 0), axis=-1)), axis=-1)
+    ccount = np.concatenate((pad, np.cumsum(present, axis=-1)), axis=-1)
+
+    # Window of column i is [lo, hi) in column positions
+    end = np.arange(n) + ((window - 1) // 2 if center else 0)
+    hi = np.clip(end + 1, 0, n)
+    lo = np.clip(end + 1 - window, 0, n)
+    sums = csum[..., hi] - csum[..., lo]
+    counts = ccount[..., hi] - ccount[..., lo]
+
+    return sums, counts
+
+def _ma_weights(distance, weighting):
+    if weighting == 'simple':
+        return np.ones(len(distance))
+    if weighting == 'linear':
+        return 1 / (1 + distance)
+    if weighting == 'exponential':
+        return 1 / 2.0**distance
+    raise ValueError(f"weighting must be 'simple', 'linear' or 'exponential', not {weighting!r}")
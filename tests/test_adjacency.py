@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from src.data_loader.adjacency import (
+    load_county_adjacency, align_adjacency, k_hop, neighbor_sum, neighbor_mean,
+    neighbor_std, neighbor_correlation, to_edge_dict,
+)
+
+# A path 1001 - 1003 - 1005 - 1007, 1003 also bordering 1007, and an island
+edges = {1001: [1003], 1003: [1001, 1005, 1007], 1005: [1003, 1007],
+         1007: [1003, 1005], 2013: []}
+
+
+@pytest.fixture
+def graph(tmp_path):
+    lines = []
+    for fips, neighbors in edges.items():
+        # Census blocks list the county itself among its neighbors
+        for i, n in enumerate([fips] + neighbors):
+            county = f'"County {fips}, ST"\t{fips:05d}' if i == 0 else '\t'
+            lines.append(f'{county}\t"County {n}, ST"\t{n:05d}')
+    path = tmp_path / 'county_adjacency.txt'
+    path.write_text('\n'.join(lines) + '\n', encoding='latin-1')
+    return load_county_adjacency(path)
+
+def _values(n_days=5, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.random((len(edges), n_days))
+    values[2, 1] = np.nan
+    return values
+
+def test_load_county_adjacency(graph):
+    adjacency, fips = graph
+    assert list(fips) == list(edges)
+    assert to_edge_dict(adjacency, fips) == edges
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_neighbor_aggregations_match_edge_loops(graph):
+    adjacency, fips = graph
+    values = _values()
+    sums, means, stds = (f(adjacency, values) for f in (neighbor_sum, neighbor_mean, neighbor_std))
+
+    for i, f in enumerate(fips):
+        neighbors = values[[list(fips).index(n) for n in edges[f]]]
+        np.testing.assert_allclose(sums[i], np.nansum(neighbors, axis=0))
+        np.testing.assert_allclose(means[i], np.nanmean(neighbors, axis=0))
+        np.testing.assert_allclose(stds[i], np.nanstd(neighbors, axis=0, ddof=1))
+    np.testing.assert_allclose(neighbor_mean(adjacency, values[:, 0]), means[:, 0])
+
+def test_neighbor_correlation(graph):
+    adjacency, fips = graph
+    values = _values(n_days=20)
+    values[2, 1] = 0.5
+    corr = neighbor_correlation(adjacency, values).toarray()
+
+    for i, f in enumerate(fips):
+        for n in edges[f]:
+            j = list(fips).index(n)
+            assert corr[i, j] == pytest.approx(np.corrcoef(values[i], values[j])[0, 1])
+
+def test_k_hop(graph):
+    adjacency, fips = graph
+    two_hop = to_edge_dict(k_hop(adjacency, 2), fips)
+
+    for f, neighbors in edges.items():
+        reach = set(neighbors).union(*(edges[n] for n in neighbors)) - {f}
+        assert two_hop[f] == sorted(reach)
+    assert to_edge_dict(k_hop(adjacency, 1), fips) == edges
+
+def test_align_adjacency(graph):
+    adjacency, fips = graph
+    target = np.array([1007, 9999, 1003, 1001])
+    aligned = to_edge_dict(align_adjacency(adjacency, fips, target), target)
+
+    assert aligned == {1007: [1003], 9999: [], 1003: [1007, 1001], 1001: [1003]}
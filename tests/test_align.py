@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.pandas.align import align_lagged_dates, align_lags
+
+
+def _frame(fips, start, n_days, seed):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_days).strftime('%m-%d')
+    df = pd.DataFrame(rng.random((len(fips), n_days)), columns=dates)
+    df.insert(0, 'FIPS', fips)
+    return df
+
+def test_lag_sequences_read_as_ranges():
+    df1 = _frame([1001, 1003, 1005], '2020-03-01', 60, 0)
+    df2 = _frame([1003, 1005, 1007], '2020-03-05', 60, 1)
+    expected = align_lags(df1, df2, 'FIPS', range(0, 15, 7))
+
+    for lags in ([0, 7, 14], np.array([0, 7, 14])):
+        got = align_lags(df1, df2, 'FIPS', lags)
+        for a, b in zip(got, expected):
+            np.testing.assert_array_equal(a, b)
+    for lags in ([0, 7, 15], [14, 7, 0], [], [0.5]):
+        with pytest.raises(ValueError):
+            align_lags(df1, df2, 'FIPS', lags)
+
+@pytest.mark.parametrize('lag', [0, 3, 14])
+def test_days_missing_from_either_frame_are_dropped(lag):
+    df1 = _frame([1001, 1003, 1005], '2020-03-01', 60, 0)
+    df2 = _frame([1003, 1005, 1007], '2020-03-05', 60, 1)
+    gapped1 = df1.drop(columns=['04-01'])
+    gapped2 = df2.drop(columns=['04-10'])
+
+    aligned, (cause_dates, effect_dates), idx = align_lagged_dates(df1, df2, 'FIPS', lag=lag)
+    got, (got_cause, got_effect), got_idx = align_lagged_dates(gapped1, gapped2, 'FIPS', lag=lag)
+
+    keep = [i for i, (c, e) in enumerate(zip(cause_dates, effect_dates))
+            if c != '04-01' and e != '04-10']
+    assert len(keep) == len(cause_dates) - 2
+    assert got_cause == [cause_dates[i] for i in keep]
+    assert got_effect == [effect_dates[i] for i in keep]
+    assert got_idx == list(range(len(keep)))
+    assert not got[got_idx].isna().any().any()
+    np.testing.assert_array_equal(got[got_idx].to_numpy(), aligned[keep].to_numpy())
@@ -0,0 +1,166 @@
+import re
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from pathlib import Path
+from unittest import mock
+
+from src.data_loader import data_loader, cache
+from src.data_loader.data_loader import get_cum_deaths_dataframe, load_counties, load_acute_care
+
+repo_data_dir = Path(__file__).resolve().parents[1] / 'data'
+static_columns = [
+    'Rural-urban_Continuum Code_2013',
+    'Density per square mile of land area - Population',
+    'Percent of adults with less than a high school diploma 2014-18',
+    'PCTPOV017_2018',
+    'Unemployment_rate_2018',
+    'Total_age65plus',
+    'POP_ESTIMATE_2018',
+]
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    """
+    The shipped deaths, FIPS registry and hospitals files, with seeded
+    county features and OD trips in place of the unshipped ones.
+    """
+    root = tmp_path_factory.mktemp('repo') / 'data'
+    raw, processed = root / 'raw', root / 'processed'
+    raw.mkdir(parents=True)
+    processed.mkdir()
+    for path in (repo_data_dir / 'raw').glob('time_series_covid19_deaths_US_*.csv'):
+        shutil.copy(path, raw)
+    shutil.copy(repo_data_dir / 'raw' / 'countyfipstool2019.csv', raw)
+    shutil.copy(repo_data_dir / 'processed' / 'Hospitals.csv', processed)
+
+    rng = np.random.default_rng(0)
+    deaths = pd.read_csv(next(raw.glob('time_series_covid19_deaths_US_*.csv')))
+    fips = deaths['FIPS'].dropna().astype(int).unique()
+    counties = pd.DataFrame(rng.random((len(fips), len(static_columns))) * 100,
+                            columns=static_columns)
+    counties.insert(0, 'FIPS', fips)
+    counties.loc[rng.choice(len(fips), 50), 'PCTPOV017_2018'] = np.nan
+    counties.to_csv(raw / 'counties_06-01.csv', index=False)
+    # OD trips of all but 30 counties, from before the first onsets
+    dates = pd.date_range('2020-03-01', '2020-06-10')
+    od_fips = rng.permutation(fips)[:len(fips) - 30]
+    od = pd.DataFrame(rng.random((len(od_fips), len(dates))) * 1e5,
+                      columns=dates.strftime('%m-%d'))
+    od.insert(0, 'FIPS', od_fips)
+    od.to_csv(processed / 'od_inter_mobilities_06-12.csv', index=False)
+
+    return root
+
+@pytest.fixture
+def loader(data_dir, monkeypatch):
+    # The loaders read '../data', as from notebooks/
+    notebooks = data_dir.parent / 'notebooks'
+    notebooks.mkdir(exist_ok=True)
+    monkeypatch.chdir(notebooks)
+    monkeypatch.setattr(cache, 'enabled', False)
+    return data_dir
+
+@pytest.mark.parametrize('time_series', [False, True])
+@pytest.mark.parametrize('n_days, onset_threshold', [(14, 1), (28, 3), (30, 5), (60, 10)])
+def test_matches_row_wise(loader, n_days, onset_threshold, time_series):
+    expected = _row_wise(
+        pd.read_csv(next((loader / 'raw').glob('time_series_covid19_deaths_US_*.csv'))),
+        load_counties()[0],
+        load_acute_care(beds=True),
+        pd.read_csv(next((loader / 'processed').glob('od_inter_mobilities_*.csv'))),
+        n_days, onset_threshold, time_series,
+    )
+    got = get_cum_deaths_dataframe(n_days, onset_threshold, time_series)
+
+    assert len(got) > 0
+    # Counts are read as int32 and OD trips as float32 (see `schema`)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False, rtol=1e-6)
+
+def test_incremental_state_matches(data_dir, tmp_path, monkeypatch):
+    root = tmp_path / 'data'
+    shutil.copytree(data_dir, root)
+    (tmp_path / 'notebooks').mkdir()
+    monkeypatch.chdir(tmp_path / 'notebooks')
+    monkeypatch.setattr(cache, 'enabled', False)
+    deaths_path = next((root / 'raw').glob('time_series_covid19_deaths_US_*.csv'))
+    od_path = next((root / 'processed').glob('od_inter_mobilities_*.csv'))
+    deaths, od = pd.read_csv(deaths_path), pd.read_csv(od_path)
+    # Older snapshots, 5 dates short
+    deaths_path.unlink()
+    od_path.unlink()
+    deaths.iloc[:, :-5].to_csv(root / 'raw' / 'time_series_covid19_deaths_US_06-14.csv', index=False)
+    od.iloc[:, :-5].to_csv(root / 'processed' / 'od_inter_mobilities_06-07.csv', index=False)
+    get_cum_deaths_dataframe(28, 3, incremental=True)
+
+    # Newer snapshots, with one county's history revised
+    revised = deaths['FIPS'] == 53033
+    deaths.loc[revised, deaths.columns[-40:-20]] += 1
+    deaths.to_csv(deaths_path, index=False)
+    od.to_csv(od_path, index=False)
+    with mock.patch.object(data_loader, 'build_deaths_state', wraps=data_loader.build_deaths_state) as build_deaths, \
+         mock.patch.object(data_loader, 'extend_deaths_state', wraps=data_loader.extend_deaths_state) as extend_deaths, \
+         mock.patch.object(data_loader, 'build_od_state', wraps=data_loader.build_od_state) as build_od, \
+         mock.patch.object(data_loader, 'extend_od_state', wraps=data_loader.extend_od_state) as extend_od:
+        got = get_cum_deaths_dataframe(28, 3, incremental=True)
+
+    extend_deaths.assert_called_once()
+    extend_od.assert_called_once()
+    build_deaths.assert_not_called()
+    build_od.assert_not_called()
+    pd.testing.assert_frame_equal(got, get_cum_deaths_dataframe(28, 3))
+
+
+def _row_wise(deaths, counties, hospitals, od, n_days, onset_threshold, time_series):
+    """
+    get_cum_deaths_dataframe as the row-wise implementation it replaced,
+    keyed by the dates of the headers ("%m/%d/%y" deaths, "%m-%d" OD trips
+    of 2020) rather than by "%m-%d" labels.
+    """
+    deaths = deaths.dropna(subset=['FIPS']).astype({'FIPS': int}).set_index('FIPS')
+    deaths = deaths[[c for c in deaths.columns if re.fullmatch(r'\d+/\d+/\d+', c)]]
+    deaths.columns = pd.to_datetime(deaths.columns, format='%m/%d/%y')
+    day = pd.Timedelta(days=1)
+
+    rows, onsets = [], {}
+    for fips, row in deaths.iterrows():
+        above = row[row >= onset_threshold]
+        if len(above) == 0:
+            continue
+        onset = above.idxmin()
+        ## Only counties with N_DAYS worth of data after onset
+        if (row.index[-1] - onset).days < n_days:
+            continue
+        ## Remove counties with growth decrease
+        if not row[onset:onset + n_days * day].diff().min() >= 0:
+            continue
+        if time_series:
+            values = {f'day_{k+1:02d}': row[onset + k * day] for k in range(n_days)}
+        else:
+            values = {'cum_deaths': row[onset + n_days * day]}
+        rows.append({'FIPS': fips, **values, 'onset': onset.strftime('%m-%d')})
+        onsets[fips] = onset
+    cum_deaths = pd.merge(pd.DataFrame(rows), hospitals, on='FIPS')
+
+    od = od.set_index('FIPS')
+    od.columns = pd.to_datetime('2020-' + od.columns, format='%Y-%m-%d')
+    od_baseline = od.iloc[:, :14].mean(axis=1).rename('OD_baseline').reset_index()
+    cum_deaths = pd.merge(cum_deaths, od_baseline, on='FIPS')
+    ## Moving average (weekly) mobility, on complete days
+    od_ma = od.T.rolling(7, center=True).mean().T.dropna(axis=1)
+    for column, lag in (('OD_at_onset', 0), ('OD_2wk_before_onset', -14), ('OD_2wk_after_onset', 14)):
+        new_row = []
+        for fips in cum_deaths['FIPS']:
+            try:
+                new_row.append(od_ma.at[fips, onsets[fips] + lag * day])
+            except KeyError:
+                new_row.append(np.nan)
+        cum_deaths[column] = new_row
+
+    static_features = counties[['FIPS'] + static_columns].dropna()
+    cum_deaths = cum_deaths.merge(static_features, on='FIPS')
+    outliers = [36061, 6038, 17031, 48201]
+
+    return cum_deaths[~cum_deaths['FIPS'].isin(outliers)]
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+import pytest
+from email.utils import formatdate
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.error import HTTPError
+
+from src.data_loader.fetch import fetch, fetch_source
+from src.data_loader.data_loader import _get_file
+
+last_modified = formatdate(0, usegmt=True)
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    """
+    Serves server.files by path with an ETag (unless server.etags is off)
+    and a Last-Modified date, answering conditional and Range requests.
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.sha1(body).hexdigest() if self.server.etags else None
+        if (etag is not None and self.headers.get('If-None-Match') == etag) or \
+           (etag is None and self.headers.get('If-Modified-Since') == last_modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') in (etag, last_modified):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+        self.send_response(206 if start else 200)
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        if start:
+            self.send_header('Content-Range', f'bytes {start}-{len(body) - 1}/{len(body)}')
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Upstream)
+    server.files = {'/deaths.csv': b'FIPS,1/22/20\n' + b'1001,0\n' * 50000}
+    server.requests = []
+    server.etags = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _fetch(upstream, raw_dir, date, name='deaths'):
+    urls = {name: upstream.url + f'/{name}.csv'}
+    return fetch(urls=urls, raw_dir=raw_dir, date=date).iloc[0]
+
+def test_fresh_download(upstream, tmp_path):
+    row = _fetch(upstream, tmp_path, '2020-12-31')
+
+    body = upstream.files['/deaths.csv']
+    assert row['status'] == 'downloaded'
+    assert row['path'] == tmp_path / 'deaths_2020-12-31.csv'
+    assert row['path'].read_bytes() == body
+    assert row['bytes'] == len(body)
+    # The partial file is moved into place, nothing else is left in raw
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['.fetch', 'deaths_2020-12-31.csv']
+    assert not (tmp_path / '.fetch' / 'deaths.part').exists()
+
+@pytest.mark.parametrize('etags', [True, False])
+def test_not_modified(upstream, tmp_path, etags):
+    upstream.etags = etags
+    first = _fetch(upstream, tmp_path, '2020-12-31')
+    row = _fetch(upstream, tmp_path, '2021-01-01')
+
+    headers = upstream.requests[-1][1]
+    assert headers.get('If-None-Match' if etags else 'If-Modified-Since') is not None
+    assert row['status'] == 'not modified'
+    assert row['path'] == first['path']
+    assert not (tmp_path / 'deaths_2021-01-01.csv').exists()
+
+def test_unchanged_content_is_no_new_snapshot(upstream, tmp_path):
+    first = _fetch(upstream, tmp_path, '2020-12-31')
+    # Same bytes behind another validator, e.g. after an upstream redeploy
+    meta_path = tmp_path / '.fetch' / 'deaths.json'
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({**meta, 'etag': '"stale"'}))
+    row = _fetch(upstream, tmp_path, '2021-01-01')
+
+    assert row['status'] == 'unchanged'
+    assert row['bytes'] == len(upstream.files['/deaths.csv'])
+    assert row['path'] == first['path']
+    assert sorted(p.name for p in tmp_path.glob('*.csv')) == ['deaths_2020-12-31.csv']
+
+def test_resumed_download(upstream, tmp_path):
+    _fetch(upstream, tmp_path, '2020-12-31')
+    upstream.files['/deaths.csv'] += b'1003,1\n' * 1000
+    body = upstream.files['/deaths.csv']
+    # An interrupted download of the new file
+    meta_path = tmp_path / '.fetch' / 'deaths.json'
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({**meta, 'part_validator': '"%s"' % hashlib.sha1(body).hexdigest()}))
+    (tmp_path / '.fetch' / 'deaths.part').write_bytes(body[:1000])
+    row = _fetch(upstream, tmp_path, '2021-01-02')
+
+    headers = upstream.requests[-1][1]
+    assert headers['Range'] == 'bytes=1000-'
+    assert row['status'] == 'downloaded'
+    assert row['bytes'] == len(body) - 1000
+    assert row['path'].read_bytes() == body
+    # Snapshots are named by full date and ordered across the year
+    assert _get_file(tmp_path, 'deaths') == ('deaths_2021-01-02.csv', '2021-01-02')
+
+def test_stale_partial_download_restarts(upstream, tmp_path):
+    _fetch(upstream, tmp_path, '2020-12-31')
+    upstream.files['/deaths.csv'] += b'1003,1\n'
+    meta_path = tmp_path / '.fetch' / 'deaths.json'
+    meta = json.loads(meta_path.read_text())
+    meta_path.write_text(json.dumps({**meta, 'part_validator': '"changed since"'}))
+    (tmp_path / '.fetch' / 'deaths.part').write_bytes(b'garbage')
+    row = _fetch(upstream, tmp_path, '2021-01-02')
+
+    assert row['status'] == 'downloaded'
+    assert row['path'].read_bytes() == upstream.files['/deaths.csv']
+
+def test_failing_source(upstream, tmp_path):
+    urls = {'deaths': upstream.url + '/deaths.csv', 'counties': upstream.url + '/missing.csv'}
+    rows = fetch(['deaths', 'counties', 'unknown'], urls=urls, raw_dir=tmp_path,
+                 date='2020-12-31').set_index('name')
+
+    assert rows.loc['deaths', 'status'] == 'downloaded'
+    assert rows.loc['counties', 'status'] == 'failed'
+    assert 'HTTPError' in rows.loc['counties', 'error']
+    assert rows.loc['unknown', 'status'] == 'failed'
+    assert 'KeyError' in rows.loc['unknown', 'error']
+    assert not list(tmp_path.glob('counties_*.csv'))
+    with pytest.raises(HTTPError):
+        fetch_source('counties', urls['counties'], raw_dir=tmp_path, date='2020-12-31')
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from src.learning.gam import gam_basis, lam_search, _flatten
+
+
+def _data(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(size=(n, 3))
+    y = rng.gamma(5, np.exp(np.sin(4 * X[:, 0]) + X[:, 1] * X[:, 2]) / 5)
+    return X, y
+
+def _model():
+    from pygam import GammaGAM, s, te
+    return GammaGAM(s(0, n_splines=8) + s(1, n_splines=6) + te(1, 2, n_splines=4))
+
+def test_gam_basis_reproduces_pygam_fit():
+    pytest.importorskip('pygam')
+    X, y = _data()
+    gam = _model()
+    basis, penalties = gam_basis(gam, X)
+    assert basis.shape[0] == len(y)
+    assert penalties.shape == (4, basis.shape[1], basis.shape[1])
+
+    fitted = _model()
+    fitted.lam = [[0.5], [2.0], [[0.1], [3.0]]]
+    fitted.fit(X, y)
+    results, coef = lam_search(basis, y, penalties, [[0.5, 2.0, 0.1, 3.0]],
+                               prune=False, max_iter=200, tol=1e-8)
+
+    np.testing.assert_allclose(coef, fitted.coef_, atol=1e-3)
+    np.testing.assert_allclose(results['edf'][0], fitted.statistics_['edof'], rtol=1e-4)
+    np.testing.assert_allclose(results['GCV'][0], fitted.statistics_['GCV'], rtol=1e-4)
+
+def test_lam_search_matches_gridsearch():
+    pytest.importorskip('pygam')
+    X, y = _data()
+    lams = np.exp(np.random.default_rng(1).uniform(-3, 3, (20, 4)))
+    basis, penalties = gam_basis(_model(), X)
+    expected = _model().gridsearch(X, y, lam=lams, progress=False)
+
+    for n_jobs in (1, 2):
+        results, _ = lam_search(basis, y, penalties, lams, n_jobs=n_jobs)
+        best = results.loc[results['GCV'].idxmin(), 'lam']
+        np.testing.assert_allclose(best, _flatten(expected.lam))
+
+def test_lam_search_fails_undefined_gcv():
+    rng = np.random.default_rng(0)
+    basis = rng.uniform(size=(20, 30))
+    y = rng.gamma(5, 1, 20)
+    penalties = np.eye(30)[None]
+    results, coef = lam_search(basis, y, penalties, [[1e-6], [1e-5]])
+
+    assert (results['status'] == 'failed').all()
+    assert coef is None
+
+def test_lam_search_rejects_empty_lams():
+    with pytest.raises(ValueError, match='no candidates'):
+        lam_search(np.ones((5, 2)), np.ones(5), np.zeros((1, 2, 2)), np.empty((0, 1)))
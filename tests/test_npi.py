@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from src.data_loader.npi import policy_dates, days_since_npi
+
+county_fips = np.array([6001, 6037, 6075, 53033, 53061])
+
+
+def _policies():
+    # California closes schools state-wide, Los Angeles earlier and twice;
+    # King County alone has a stay at home order; an undated record and a
+    # county outside the registry are ignored
+    return pd.DataFrame({
+        'FIPS': [6000, 6037, 6037, 6000, 53033, 6075, 99001, 53000],
+        'npi': ['schools', 'schools', 'schools', 'stay at home', 'stay at home',
+                'stay at home', 'schools', 'gatherings'],
+        'start': pd.array([737500, 737495, 737490, 737510, 737505, pd.NA, 737400, 737520], dtype='Int32'),
+        'end': pd.array([737600, pd.NA, 737550, pd.NA, 737530, pd.NA, pd.NA, pd.NA], dtype='Int32'),
+    })
+
+def _loop_dates(policies, column, npis):
+    dates = np.full((len(county_fips), len(npis)), np.nan)
+    for i, f in enumerate(county_fips):
+        for j, npi in enumerate(npis):
+            records = policies[(policies['npi'] == npi) & policies[column].notna()]
+            own = records.loc[records['FIPS'] == f, column]
+            state = records.loc[records['FIPS'] == f // 1000 * 1000, column]
+            if len(own):
+                dates[i, j] = own.min()
+            elif len(state):
+                dates[i, j] = state.min()
+    return dates
+
+def test_policy_dates_matches_record_loop():
+    policies = _policies()
+    for column in ['start', 'end']:
+        dates, npis = policy_dates(policies, county_fips, column=column)
+        assert list(npis) == ['gatherings', 'schools', 'stay at home']
+        np.testing.assert_array_equal(dates, _loop_dates(policies, column, npis))
+
+    dates, npis = policy_dates(policies, county_fips, npis=['stay at home', 'masks'])
+    np.testing.assert_array_equal(dates[:, 0], [737510, 737510, 737510, 737505, np.nan])
+    assert np.isnan(dates[:, 1]).all()
+
+def test_days_since_npi():
+    fips = np.array([53033, 6037, 6001, 53033])
+    onset = np.array([737520, 737500, 737530, 737520])
+    features = days_since_npi(_policies(), fips, onset)
+    expected = _loop_dates(_policies(), 'start', features.columns[1:])
+
+    assert list(features['FIPS']) == list(fips)
+    rows = [list(county_fips).index(f) for f in fips]
+    np.testing.assert_array_equal(features.iloc[:, 1:].to_numpy(), onset[:, None] - expected[rows])
+
+    by_string = days_since_npi(_policies(), fips, ['03-25', '03-05', '04-04', '03-25'], year=2020)
+    # 2020-03-25 is ordinal 737509
+    assert by_string.at[0, 'stay at home'] == 737509 - 737505
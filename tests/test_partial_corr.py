@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import rankdata, t as t_dist
+
+from src.data_analysis.partial_corr import partial_corr
+
+
+def _frame(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    z = rng.normal(size=(n, 2))
+    df = pd.DataFrame({
+        'a': z @ [1.0, 0.5] + rng.normal(size=n),
+        'b': np.exp(z[:, 0]) + rng.normal(size=n),
+        'c': rng.normal(size=n),
+        'z1': z[:, 0],
+        'z2': z[:, 1],
+        'code': rng.integers(1, 4, n),
+    })
+    df.loc[[3, 40], 'b'] = np.nan
+    df.loc[7, 'z2'] = np.nan
+    return df
+
+def _regressed(df, x, y, controls, method):
+    """Correlation of the residuals of x and y, each regressed on the controls."""
+    values = df[[x, y] + controls].dropna().to_numpy(dtype=float)
+    if method == 'spearman':
+        values = rankdata(values, axis=0)
+    A = np.column_stack([np.ones(len(values)), values[:, 2:]])
+    resid = values[:, :2] - A @ np.linalg.lstsq(A, values[:, :2], rcond=None)[0]
+    return np.corrcoef(resid.T)[0, 1], len(values)
+
+@pytest.mark.parametrize('method', ['spearman', 'pearson'])
+@pytest.mark.parametrize('controls', [[], ['z1'], ['z1', 'z2']])
+def test_partial_corr_matches_regressed_residuals(method, controls):
+    df = _frame()
+    columns = ['a', 'b', 'c']
+    table = partial_corr(df, columns, controls, by='code', method=method)
+
+    # Rows missing any variable are dropped before ranking
+    complete = df.dropna(subset=columns + controls)
+    assert len(table) == 3 * df['code'].nunique()
+    for row in table.itertuples():
+        r, n = _regressed(complete[complete['code'] == row.code], row.x, row.y, controls, method)
+        dof = n - 2 - len(controls)
+        assert row.n == n
+        assert row.r == pytest.approx(r, abs=1e-12)
+        assert row.statistic == pytest.approx(r * np.sqrt(dof / (1 - r**2)))
+        assert row.p_value == pytest.approx(2 * t_dist.sf(abs(row.statistic), dof))
+
+def test_permutation_p_values_do_not_depend_on_n_jobs():
+    df = _frame()
+    serial = partial_corr(df, ['a', 'b', 'c'], ['z2'], by='code', n_perm=200, batch_size=64, n_jobs=1)
+    pooled = partial_corr(df, ['a', 'b', 'c'], ['z2'], by='code', n_perm=200, batch_size=64, n_jobs=2)
+
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert ((serial['p_perm'] > 0) & (serial['p_perm'] <= 1)).all()
+    # Pairs well beyond the t threshold are never matched by a permutation
+    strong = serial['p_value'] < 0.002
+    assert strong.any()
+    assert (serial.loc[strong, 'p_perm'] == 1 / 201).all()
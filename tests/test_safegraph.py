@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data_loader.safegraph import build_od_cube, county_trips, window_mean, safegraph_mobility
+from src.utils.dates import str2day, full_format
+
+fips = [1001, 1003, 1005]
+dates = pd.date_range('2020-03-01', periods=6)
+
+
+@pytest.fixture
+def trips(tmp_path):
+    """
+    Daily origin x destination trips, with no file on 03-03 and 1005
+    missing on 03-05, as the day -> frame dict they are written from.
+    """
+    rng = np.random.default_rng(0)
+    trips = {}
+    for date in dates:
+        if date.day == 3:
+            continue
+        counties = fips[:2] if date.day == 5 else fips
+        trips[date] = pd.DataFrame(rng.integers(0, 100, (len(counties), len(counties))),
+                                   index=counties, columns=counties)
+        trips[date].to_csv(tmp_path / date.strftime('%Y_%m_%d.csv'))
+    return tmp_path, trips
+
+def test_build_od_cube(trips, tmp_path):
+    trips_dir, frames = trips
+    cube, days, cube_fips = build_od_cube(trips_dir, tmp_path / 'cube')
+
+    assert isinstance(cube, np.memmap) and not cube.flags.writeable
+    assert list(cube_fips) == fips
+    assert list(days) == [str2day(d, full_format) for d in dates.strftime(full_format)]
+    for t, date in enumerate(dates):
+        expected = frames[date].reindex(index=fips, columns=fips) if date in frames \
+            else pd.DataFrame(np.nan, index=fips, columns=fips)
+        np.testing.assert_array_equal(cube[t], expected.to_numpy(dtype=np.float32))
+
+def test_county_trips_and_window_mean(trips, tmp_path):
+    trips_dir, frames = trips
+    cube, days, cube_fips = build_od_cube(trips_dir, tmp_path / 'cube')
+    intra, inter = county_trips(cube, chunk_days=4)
+
+    for t, date in enumerate(dates):
+        for i, f in enumerate(fips):
+            if date not in frames or f not in frames[date].index:
+                assert np.isnan(intra[t, i]) and np.isnan(inter[t, i])
+                continue
+            df = frames[date]
+            assert intra[t, i] == df.at[f, f]
+            assert inter[t, i] == df.loc[f].sum() + df[f].sum() - df.at[f, f]
+
+    # Missing days take the last value before them, days outside are skipped
+    filled = pd.DataFrame(inter, index=dates).ffill()
+    onsets = pd.Series(['2020-03-04', '2020-03-02', '2020-03-06'], index=fips)
+    cols = np.array([0, 1, 2])
+    onset_days = np.array([str2day(d, full_format) for d in onsets])
+    for start, stop in [(-2, 0), (0, 2), (-3, 3)]:
+        expected = [
+            filled[i].reindex(pd.date_range(pd.Timestamp(onset) + pd.Timedelta(days=start),
+                                            periods=stop - start)).mean()
+            for i, onset in enumerate(onsets)
+        ]
+        np.testing.assert_allclose(window_mean(inter, days, cols, onset_days, start, stop), expected)
+
+    mobility = safegraph_mobility(onsets.rename(index={1005: 9999}), cube_dir=tmp_path / 'cube')
+    assert np.isnan(mobility.loc[9999]).all()
+    assert mobility.at[1001, '2wk Prior Intra-Mobility'] == pytest.approx(
+        pd.DataFrame(intra, index=dates).ffill()[0].loc[:'2020-03-03'].mean())
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from unittest import mock
+
+from src.data_loader import state
+from src.data_loader.data_loader import _is_nondecreasing
+
+n_new = 6
+
+
+def _snapshots(n=40, n_days=60, seed=0):
+    """
+    An older snapshot cut n_new dates short of a newer one, in which one
+    county's history is revised. Dates run into 2021.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2020-11-20', periods=n_days)
+    fips = rng.choice(np.arange(1001, 56046), n, replace=False)
+    counts = np.cumsum(rng.poisson(0.3, (n, n_days)), axis=1).astype(float)
+    counts[3, 20:] -= 1      # a reporting correction
+    counts[5, 30] = np.nan   # a missing day
+    old = counts[:, :-n_new].copy()
+    revised = 7
+    counts[revised, 10:] += 2
+
+    return fips, dates, old, counts, revised
+
+@pytest.mark.parametrize('onset_threshold', [1, 3, 8])
+def test_extend_deaths_state_matches_rebuild(onset_threshold):
+    fips, dates, old, counts, revised = _snapshots()
+    previous = state.build_deaths_state(fips, dates[:-n_new], old, onset_threshold)
+    expected = state.build_deaths_state(fips, dates, counts, onset_threshold)
+
+    with mock.patch.object(state, 'build_deaths_state', wraps=state.build_deaths_state) as build, \
+         mock.patch.object(state, '_count_diffs', wraps=state._count_diffs) as count_diffs:
+        got = state.extend_deaths_state(previous, fips, dates, counts, onset_threshold)
+
+    # Only the revised county is rebuilt; the others only diff the new
+    # dates and the last old one
+    build.assert_called_once()
+    np.testing.assert_array_equal(build.call_args.args[0], fips[[revised]])
+    assert [c.args[0].shape for c in count_diffs.call_args_list] == [
+        (len(fips), n_new + 1), (1, len(dates))]
+    for key in ['dates', 'days', 'onset', 'onset_value', 'decreases', 'defined']:
+        np.testing.assert_array_equal(got[key], expected[key], err_msg=key)
+    for n_days in [7, 14, 28]:
+        np.testing.assert_array_equal(
+            _is_nondecreasing(got, got['onset'], n_days),
+            _is_nondecreasing(expected, expected['onset'], n_days),
+        )
+
+def test_extend_od_state_matches_rebuild():
+    fips, dates, old, values, revised = _snapshots()
+    width = 7
+    previous = state.build_od_state(fips, dates[:-n_new], old, width)
+    expected = state.build_od_state(fips, dates, values, width)
+
+    with mock.patch.object(state, '_centered_mean', wraps=state._centered_mean) as centered_mean:
+        got = state.extend_od_state(previous, fips, dates, values, width)
+
+    # The tail covers the new dates and the old ones whose window reaches
+    # them; only the revised county is averaged over every date
+    assert [c.args[0].shape for c in centered_mean.call_args_list] == [
+        (len(fips), n_new + 2 * (width // 2)), (1, len(dates))]
+    np.testing.assert_array_equal(got['days'], expected['days'])
+    np.testing.assert_allclose(got['ma'], expected['ma'], rtol=1e-12)
+    np.testing.assert_array_equal(np.isnan(got['ma']), np.isnan(expected['ma']))
+
+def test_extend_rebuilds_on_changed_counties():
+    fips, dates, old, counts, revised = _snapshots()
+    previous = state.build_deaths_state(fips, dates[:-n_new], old, 3)
+    reordered = np.roll(np.arange(len(fips)), 1)
+
+    with mock.patch.object(state, 'build_deaths_state', wraps=state.build_deaths_state) as build:
+        got = state.extend_deaths_state(previous, fips[reordered], dates, counts[reordered], 3)
+
+    np.testing.assert_array_equal(build.call_args.args[0], fips[reordered])
+    np.testing.assert_array_equal(
+        got['onset'], state.build_deaths_state(fips, dates, counts, 3)['onset'][reordered])
+
+def test_load_state_round_trip(tmp_path):
+    fips, dates, old, counts, revised = _snapshots()
+    built = state.build_deaths_state(fips, dates, counts, 3)
+    path = tmp_path / 'deaths_onset_3.npz'
+    state.save_state(path, built, {'size': 1})
+
+    loaded, source = state.load_state(path)
+    assert source == {'size': 1}
+    for key in built:
+        np.testing.assert_array_equal(loaded[key], built[key], err_msg=key)
+
+    with mock.patch.object(state, 'STATE_VERSION', state.STATE_VERSION + 1):
+        assert state.load_state(path) == (None, None)
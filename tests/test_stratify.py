@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from scipy.optimize import minimize
+
+from src.learning.stratify import gamma_glm
+
+
+def _data(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, 3))
+    mu = np.exp(0.5 + X @ np.array([0.3, -0.2, 0.1]))
+    y = rng.gamma(2.0, mu / 2.0)
+    return X, y
+
+def _objective(coef, A, y, alpha):
+    """Mean half Gamma deviance plus the L2 penalty, as in scikit-learn."""
+    mu = np.exp(A @ coef)
+    deviance = 2 * np.sum((y - mu) / mu - np.log(y / mu))
+    grad = A.T @ (1 - y / mu) / len(y) + alpha * np.r_[0, coef[1:]]
+    return deviance / (2 * len(y)) + alpha / 2 * np.sum(coef[1:]**2), grad
+
+@pytest.mark.parametrize('alpha', [0.0, 0.1, 1.0])
+def test_gamma_glm_minimizes_penalized_deviance(alpha):
+    X, y = _data()
+    A = np.column_stack([np.ones(len(X)), X])
+    coef, stats = gamma_glm(X, y, alpha=alpha)
+    expected = minimize(_objective, np.zeros(A.shape[1]), args=(A, y, alpha), jac=True,
+                        method='BFGS', options={'gtol': 1e-10}).x
+
+    np.testing.assert_allclose(coef, expected, atol=1e-6)
+    assert stats['n_iter'] < 100
+    mu = np.exp(A @ coef)
+    assert stats['deviance'] == pytest.approx(2 * np.sum((y - mu) / mu - np.log(y / mu)))
+    null = 2 * np.sum((y - y.mean()) / y.mean() - np.log(y / y.mean()))
+    assert stats['d2'] == pytest.approx(1 - stats['deviance'] / null)
+
+def test_gamma_glm_matches_statsmodels():
+    sm = pytest.importorskip('statsmodels.api')
+    X, y = _data()
+    coef, stats = gamma_glm(X, y)
+    fit = sm.GLM(y, sm.add_constant(X), family=sm.families.Gamma(sm.families.links.Log())).fit()
+
+    np.testing.assert_allclose(coef, fit.params, rtol=1e-6)
+    assert stats['deviance'] == pytest.approx(fit.deviance)
@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+
+from src.data_analysis.tools import ac_pca
+
+
+@pytest.mark.parametrize('n_components', [None, 3, 6])
+def test_lanczos_matches_eigh(n_components):
+    rng = np.random.default_rng(0)
+    X, Y = rng.random((50, 6)), rng.random(50)
+
+    expected = ac_pca(X, Y, 0.5, n_components)
+    got = ac_pca(X, Y, 0.5, n_components, solver='lanczos')
+
+    for a, b in zip(got, expected):
+        np.testing.assert_allclose(a.to_numpy(), b.to_numpy(), atol=1e-8)